@@ -0,0 +1,160 @@
+"""Admission control for the model-backed routes.
+
+Each route group gets an AdmissionController: at most `max_concurrent`
+requests run at once, up to `max_queue` more wait for a slot, and waiting
+clients are served round-robin so one busy client cannot starve the rest.
+A single client may hold at most a `client_share` fraction of the running
+plus queued places.
+
+Requests are shed up front instead of timing out later: when the queue is
+full, when the expected wait (queue position times the recent service time)
+already exceeds `max_wait_seconds`, or when the wait actually runs past it.
+Rejections carry a Retry-After estimate.
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional
+
+from .metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTED, ADMISSION_WAIT_SECONDS
+
+
+# Weight of the newest request in the moving average of slot hold times.
+SERVICE_TIME_ALPHA = 0.2
+
+
+class Rejected(Exception):
+    def __init__(self, status_code: int, reason: str, retry_after: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+        self.detail = detail
+
+
+class AdmissionController:
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, max_wait_seconds: float, client_share: float):
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.max_wait_seconds = max_wait_seconds
+        self.client_limit = max(1, math.ceil((self.max_concurrent + self.max_queue) * client_share))
+        self.running = 0
+        self.service_seconds: Optional[float] = None
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()  # client -> waiters, in turn order
+        self._held: Dict[str, int] = {}  # client -> running + queued
+
+    def queued(self) -> int:
+        return sum(len(waiters) for waiters in self._queues.values())
+
+    def expected_wait(self, ahead: int) -> float:
+        """Seconds until a request with `ahead` others queued before it should start."""
+        if self.service_seconds is None:
+            return 0.0
+        return (ahead + 1) / self.max_concurrent * self.service_seconds
+
+    def _reject(self, status_code: int, reason: str, detail: str) -> Rejected:
+        ADMISSION_REJECTED.inc(route=self.name, reason=reason)
+        retry_after = max(1, math.ceil(self.expected_wait(self.queued())))
+        return Rejected(status_code, reason, retry_after, detail)
+
+    def _publish(self) -> None:
+        ADMISSION_IN_FLIGHT.set(self.running, route=self.name)
+        ADMISSION_QUEUE_DEPTH.set(self.queued(), route=self.name)
+
+    def _take(self, client: str, delta: int) -> None:
+        held = self._held.get(client, 0) + delta
+        if held > 0:
+            self._held[client] = held
+        else:
+            self._held.pop(client, None)
+
+    @asynccontextmanager
+    async def slot(self, client: str) -> AsyncIterator[float]:
+        """Hold a running slot for the block; yields the seconds spent queued."""
+        waited = await self._acquire(client)
+        started = time.perf_counter()
+        try:
+            yield waited
+        finally:
+            self._release(client, time.perf_counter() - started)
+
+    async def _acquire(self, client: str) -> float:
+        if self._held.get(client, 0) >= self.client_limit:
+            raise self._reject(429, "client_share", "Too many concurrent requests from this client.")
+        queued = self.queued()
+        if self.running < self.max_concurrent and not queued:
+            self.running += 1
+            self._take(client, 1)
+            self._publish()
+            ADMISSION_WAIT_SECONDS.observe(0.0, route=self.name)
+            return 0.0
+        if queued >= self.max_queue:
+            raise self._reject(503, "queue_full", "Server is busy. Please retry shortly.")
+        if self.expected_wait(queued) > self.max_wait_seconds:
+            raise self._reject(503, "deadline", "Server is busy. Please retry shortly.")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(client, deque()).append(waiter)
+        self._take(client, 1)
+        self._publish()
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.max_wait_seconds)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if waiter.done() and not waiter.cancelled():
+                # Granted in the same turn the wait ended: hand the slot straight back.
+                self._release(client, 0.0, sample=False)
+            else:
+                waiter.cancel()
+                self._drop(client, waiter)
+            if isinstance(exc, asyncio.CancelledError):
+                raise
+            raise self._reject(503, "timeout", "Server is busy. Please retry shortly.") from None
+        waited = time.perf_counter() - started
+        ADMISSION_WAIT_SECONDS.observe(waited, route=self.name)
+        return waited
+
+    def _drop(self, client: str, waiter: asyncio.Future) -> None:
+        waiters = self._queues.get(client)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del self._queues[client]
+        self._take(client, -1)
+        self._publish()
+
+    def _release(self, client: str, held_seconds: float, sample: bool = True) -> None:
+        self.running -= 1
+        self._take(client, -1)
+        if sample:
+            previous = self.service_seconds
+            self.service_seconds = held_seconds if previous is None else previous + SERVICE_TIME_ALPHA * (held_seconds - previous)
+        # Hand freed slots to the next client in turn, one waiter per client per round.
+        while self.running < self.max_concurrent and self._queues:
+            next_client, waiters = next(iter(self._queues.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                self._queues.move_to_end(next_client)
+            else:
+                del self._queues[next_client]
+            if waiter.done():
+                continue
+            waiter.set_result(None)
+            self.running += 1
+        self._publish()
+
+
+def controller_from_env(name: str, prefix: str, max_concurrent: int, max_queue: int, max_wait_ms: float) -> AdmissionController:
+    """Build a controller from <PREFIX>_MAX_CONCURRENCY, <PREFIX>_MAX_QUEUE and <PREFIX>_QUEUE_TIMEOUT_MS."""
+    return AdmissionController(
+        name=name,
+        max_concurrent=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", str(max_concurrent))),
+        max_queue=int(os.getenv(f"{prefix}_MAX_QUEUE", str(max_queue))),
+        max_wait_seconds=float(os.getenv(f"{prefix}_QUEUE_TIMEOUT_MS", str(max_wait_ms))) / 1000.0,
+        client_share=float(os.getenv("ADMISSION_CLIENT_SHARE", "0.25")),
+    )
@@ -0,0 +1,193 @@
+"""Local audio preprocessing before transcription uploads.
+
+prepare_audio() decodes the clip, trims leading and trailing silence with an
+energy-based voice activity check, downmixes to mono and resamples to 16 kHz,
+then re-encodes it as 16-bit WAV. A clip with no speech at all is flagged as
+silent so the caller can skip the model call. Anything that cannot be decoded
+is passed through unchanged.
+
+WAV and raw 16-bit PCM (audio/pcm, audio/l16 with a rate= parameter) are
+decoded natively. Browser formats (webm/ogg/mp4) are decoded only when PyAV
+is installed; register_decoder() adds others.
+"""
+
+import io
+import os
+import wave
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+TARGET_RATE = int(os.getenv("AUDIO_TARGET_RATE", "16000"))
+VAD_THRESHOLD_DB = float(os.getenv("AUDIO_VAD_THRESHOLD_DB", "-45"))
+VAD_PAD_MS = float(os.getenv("AUDIO_VAD_PAD_MS", "250"))
+VAD_MIN_SPEECH_MS = float(os.getenv("AUDIO_VAD_MIN_SPEECH_MS", "120"))
+FRAME_MS = 20.0
+
+# mime -> decoder(bytes, mime) returning (float32 samples shaped [n, channels] in -1..1, rate) or None.
+Decoder = Callable[[bytes, str], Optional[Tuple[Any, int]]]
+_DECODERS: Dict[str, Decoder] = {}
+
+
+def _enabled() -> bool:
+    return os.getenv("AUDIO_PREPROCESS", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def register_decoder(mime: str, decoder: Decoder) -> None:
+    _DECODERS[mime.lower()] = decoder
+
+
+def _mime_params(mime: str) -> Tuple[str, Dict[str, str]]:
+    base, *params = [part.strip() for part in (mime or "").split(";")]
+    out = {}
+    for param in params:
+        name, _, value = param.partition("=")
+        out[name.strip().lower()] = value.strip()
+    return base.lower(), out
+
+
+def _decode_wav(data: bytes, mime: str) -> Optional[Tuple[Any, int]]:
+    import numpy as np
+
+    try:
+        with wave.open(io.BytesIO(data), "rb") as wav:
+            rate, channels, width = wav.getframerate(), wav.getnchannels(), wav.getsampwidth()
+            frames = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError):
+        return None
+    if width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 2:
+        samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+    elif width == 4:
+        samples = np.frombuffer(frames, dtype="<i4").astype(np.float32) / 2147483648.0
+    else:
+        return None
+    usable = len(samples) - len(samples) % channels
+    return samples[:usable].reshape(-1, channels), rate
+
+
+def _decode_pcm(data: bytes, mime: str) -> Optional[Tuple[Any, int]]:
+    import numpy as np
+
+    base, params = _mime_params(mime)
+    try:
+        rate = int(params.get("rate", "0"))
+        channels = int(params.get("channels", "1"))
+    except ValueError:
+        return None
+    if rate <= 0 or channels <= 0:
+        return None
+    # audio/L16 is big-endian by definition (RFC 2586); audio/pcm is taken as s16le.
+    dtype = ">i2" if base == "audio/l16" else "<i2"
+    usable = len(data) - len(data) % (2 * channels)
+    samples = np.frombuffer(data[:usable], dtype=dtype).astype(np.float32) / 32768.0
+    return samples.reshape(-1, channels), rate
+
+
+def _decode_with_av(data: bytes, mime: str) -> Optional[Tuple[Any, int]]:
+    try:
+        import av
+        import numpy as np
+    except ImportError:
+        return None
+    try:
+        with av.open(io.BytesIO(data)) as container:
+            stream = container.streams.audio[0]
+            resampler = av.AudioResampler(format="s16", layout="mono", rate=TARGET_RATE)
+            chunks = []
+            for frame in container.decode(stream):
+                for out in resampler.resample(frame):
+                    chunks.append(out.to_ndarray().reshape(-1))
+    except Exception:
+        return None
+    if not chunks:
+        return None
+    samples = np.concatenate(chunks).astype(np.float32) / 32768.0
+    return samples.reshape(-1, 1), TARGET_RATE
+
+
+for _mime in ("audio/wav", "audio/x-wav", "audio/wave", "audio/vnd.wave"):
+    register_decoder(_mime, _decode_wav)
+for _mime in ("audio/pcm", "audio/l16"):
+    register_decoder(_mime, _decode_pcm)
+for _mime in ("audio/webm", "audio/ogg", "audio/mp4", "audio/m4a", "audio/x-m4a", "audio/mpeg", "audio/mp3"):
+    register_decoder(_mime, _decode_with_av)
+
+
+def _resample(mono: Any, rate: int, target: int) -> Any:
+    import numpy as np
+
+    if rate == target or len(mono) == 0:
+        return mono
+    if rate > target:
+        # Box filter over the decimation factor as a cheap anti-alias before interpolating.
+        width = int(rate // target)
+        if width > 1:
+            mono = np.convolve(mono, np.full(width, 1.0 / width, dtype=np.float32), mode="same")
+    duration = len(mono) / float(rate)
+    positions = np.arange(int(duration * target), dtype=np.float64) * (rate / float(target))
+    return np.interp(positions, np.arange(len(mono)), mono).astype(np.float32)
+
+
+def _speech_bounds(mono: Any, rate: int) -> Optional[Tuple[int, int]]:
+    """Sample range from the first to the last voiced frame (padded), or None if silent."""
+    import numpy as np
+
+    frame = max(int(rate * FRAME_MS / 1000.0), 1)
+    count = len(mono) // frame
+    if count == 0:
+        return None
+    frames = mono[: count * frame].reshape(count, frame)
+    rms = np.sqrt(np.mean(frames.astype(np.float64) ** 2, axis=1))
+    level_db = 20.0 * np.log10(np.maximum(rms, 1e-9))
+    voiced = np.flatnonzero(level_db > VAD_THRESHOLD_DB)
+    if len(voiced) * FRAME_MS < VAD_MIN_SPEECH_MS:
+        return None
+    pad = int(VAD_PAD_MS / FRAME_MS)
+    start = max(int(voiced[0]) - pad, 0) * frame
+    end = min((int(voiced[-1]) + 1 + pad) * frame, len(mono))
+    return start, end
+
+
+def _encode_wav(mono: Any, rate: int) -> bytes:
+    import numpy as np
+
+    pcm = (np.clip(mono, -1.0, 1.0) * 32767.0).astype("<i2")
+    out = io.BytesIO()
+    with wave.open(out, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(pcm.tobytes())
+    return out.getvalue()
+
+
+def prepare_audio(audio: bytes, mime: Optional[str]) -> Dict[str, Any]:
+    """Trim, downmix and resample a clip for upload.
+
+    Returns {"audio", "mime", "silent", "original_bytes", "bytes_saved"}. The
+    original audio and mime come back unchanged when preprocessing is off, no
+    decoder handles the format, or the result would not be smaller.
+    """
+    result = {"audio": audio, "mime": mime, "silent": False, "original_bytes": len(audio), "bytes_saved": 0}
+    base, _ = _mime_params(mime or "")
+    decoder = _DECODERS.get(base)
+    if not _enabled() or decoder is None or not audio:
+        return result
+    try:
+        decoded = decoder(audio, mime or "")
+    except ImportError:
+        return result
+    if decoded is None:
+        return result
+
+    samples, rate = decoded
+    mono = samples.mean(axis=1) if samples.shape[1] > 1 else samples[:, 0]
+    bounds = _speech_bounds(mono, rate)
+    if bounds is None:
+        return dict(result, audio=b"", silent=True, bytes_saved=len(audio))
+
+    prepared = _encode_wav(_resample(mono[bounds[0]:bounds[1]], rate, TARGET_RATE), TARGET_RATE)
+    if len(prepared) >= len(audio):
+        return result
+    return dict(result, audio=prepared, mime="audio/wav", bytes_saved=len(audio) - len(prepared))
@@ -0,0 +1,383 @@
+"""Small in-process caches for repeated chat and transcription work.
+
+TTLCache is a byte-bounded LRU with per-entry expiry and an optional on-disk
+tier, so hits can survive a restart. Values must be JSON-serializable; their
+encoded size is what counts against the byte budget. The disk tier has its
+own byte cap: when its files pass it, expired files go first and then the
+oldest, down to DISK_LOW_WATER of the cap. Only files carrying DISK_PREFIX are
+ever read or deleted, so the directory may be shared.
+
+SingleFlight collapses concurrent identical work into one task whose result
+(or, for streams, whose events) every caller shares.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .retrieval import chunks_version
+
+DISK_PREFIX = "ttlcache-"
+DISK_LOW_WATER = 0.9
+DISK_STALE_TMP_SECONDS = 60
+
+
+class TTLCache:
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl_seconds: float,
+        disk_dir: Optional[str] = None,
+        disk_max_bytes: Optional[int] = None,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = disk_max_bytes if disk_max_bytes is not None else 8 * max_bytes
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()  # key -> (expires, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Bytes of this cache's files on disk; None until the first scan. Other
+        # workers sharing the directory are picked up whenever it is rescanned.
+        self._disk_bytes: Optional[int] = None
+        self._disk_lock = threading.Lock()
+        self._counters = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expired": 0, "disk_evictions": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_bytes > 0
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, size, value = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return value
+                self._drop(key)
+                self._counters["expired"] += 1
+
+        stored = self._disk_read(key, now)
+        with self._lock:
+            if stored is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["disk_hits"] += 1
+            expires, value = stored
+            self._insert(key, value, expires)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        if not self.enabled:
+            return
+        expires = time.time() + self.ttl_seconds
+        with self._lock:
+            self._insert(key, value, expires)
+        self._disk_write(key, value, expires)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.disk_dir:
+            with self._disk_lock:
+                for path, _, _ in self._disk_files():
+                    _remove(path)
+                self._disk_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            out = dict(self._counters)
+            out["entries"] = len(self._entries)
+            out["bytes"] = self._bytes
+            return out
+
+    def _insert(self, key: str, value: Any, expires: float) -> None:
+        size = len(json.dumps(value, ensure_ascii=False).encode("utf-8")) + len(key)
+        if key in self._entries:
+            self._drop(key)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (expires, size, value)
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self._counters["evictions"] += 1
+
+    def _drop(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, DISK_PREFIX + hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+    def _disk_files(self) -> List[Tuple[str, float, int]]:
+        """(path, mtime, size) of this cache's files, stray temp files included."""
+        out = []
+        try:
+            entries = list(os.scandir(self.disk_dir))
+        except OSError:
+            return out
+        for entry in entries:
+            if not entry.name.startswith(DISK_PREFIX) or not entry.name.endswith((".json", ".tmp")):
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            out.append((entry.path, st.st_mtime, st.st_size))
+        return out
+
+    def _disk_prune(self, now: float) -> None:
+        """Rescan the tier; drop expired files, then the oldest, until under the low-water mark."""
+        kept = []
+        for path, mtime, size in sorted(self._disk_files(), key=lambda f: f[1]):
+            # A file expires at its write time plus the TTL; temp files left by a failed write go after a minute.
+            if mtime + (DISK_STALE_TMP_SECONDS if path.endswith(".tmp") else self.ttl_seconds) <= now:
+                _remove(path)
+            else:
+                kept.append((path, mtime, size))
+        total = sum(size for _, _, size in kept)
+        target = self.disk_max_bytes * DISK_LOW_WATER
+        for path, _, size in kept:
+            if total <= target:
+                break
+            _remove(path)
+            total -= size
+            self._counters["disk_evictions"] += 1
+        self._disk_bytes = total
+
+    def _disk_read(self, key: str, now: float) -> Optional[Tuple[float, Any]]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if record.get("key") != key or float(record.get("expires") or 0) <= now:
+            _remove(path)
+            return None
+        return float(record["expires"]), record.get("value")
+
+    def _disk_write(self, key: str, value: Any, expires: float) -> None:
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            fd, tmp = tempfile.mkstemp(dir=self.disk_dir, prefix=DISK_PREFIX, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"key": key, "expires": expires, "value": value}, f, ensure_ascii=False)
+            size = os.path.getsize(tmp)
+            os.replace(tmp, path)
+        except OSError:
+            # The disk tier is best-effort; the memory tier already has the value.
+            return
+        with self._disk_lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += size - replaced
+            if self._disk_bytes is None or self._disk_bytes > self.disk_max_bytes:
+                self._disk_prune(time.time())
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class SingleFlight:
+    """Share one in-flight task between concurrent callers with the same key.
+
+    The first caller starts the work as its own task; later callers await the
+    same task. A caller that is cancelled only cancels the work when no other
+    caller is still waiting for it. Tasks belong to the running event loop,
+    so keys are scoped per loop. Use separate instances for do() and stream()
+    work; they share the slot table.
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[Tuple[Any, str], Dict[str, Any]] = {}  # (loop, key) -> {"task", "waiters", ...}
+        self._counters = {"leaders": 0, "followers": 0}
+
+    async def do(self, key: str, work: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Return (result, shared); shared is True for callers that joined existing work."""
+        loop = asyncio.get_running_loop()
+        slot = (loop, key)
+        call = self._calls.get(slot)
+        shared = call is not None
+        if call is None:
+            call = {"task": loop.create_task(work()), "waiters": 0}
+            self._calls[slot] = call
+            call["task"].add_done_callback(lambda _, slot=slot, call=call: self._forget(slot, call))
+        self._counters["followers" if shared else "leaders"] += 1
+
+        call["waiters"] += 1
+        try:
+            return await asyncio.shield(call["task"]), shared
+        except asyncio.CancelledError:
+            if call["waiters"] == 1:
+                self._abandon(slot, call)
+            raise
+        finally:
+            call["waiters"] -= 1
+
+    async def stream(self, key: str, work: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Tuple[Any, bool]]:
+        """Yield (event, shared) from one shared run of the async iterator work().
+
+        Every event is kept until the run ends, so a caller that joins late
+        first replays what was already produced and then follows live. An
+        exception from the source is re-raised to every caller after the
+        events that preceded it. Closing the last subscriber cancels the run.
+        """
+        loop = asyncio.get_running_loop()
+        slot = (loop, key)
+        call = self._calls.get(slot)
+        shared = call is not None
+        if call is None:
+            call = {"events": [], "error": None, "changed": asyncio.Event(), "waiters": 0}
+            call["task"] = loop.create_task(self._pump(work(), call))
+            self._calls[slot] = call
+            call["task"].add_done_callback(lambda _, slot=slot, call=call: self._forget(slot, call))
+        self._counters["followers" if shared else "leaders"] += 1
+
+        call["waiters"] += 1
+        index = 0
+        try:
+            while True:
+                if index < len(call["events"]):
+                    index += 1
+                    yield call["events"][index - 1], shared
+                    continue
+                if call["task"].done():
+                    if call["error"] is not None:
+                        raise call["error"]
+                    return
+                await call["changed"].wait()
+        finally:
+            call["waiters"] -= 1
+            if call["waiters"] == 0:
+                self._abandon(slot, call)
+
+    @staticmethod
+    async def _pump(source: AsyncIterator[Any], call: Dict[str, Any]) -> None:
+        def wake() -> None:
+            changed, call["changed"] = call["changed"], asyncio.Event()
+            changed.set()
+
+        try:
+            async for event in source:
+                call["events"].append(event)
+                wake()
+        except Exception as exc:
+            call["error"] = exc
+        finally:
+            close = getattr(source, "aclose", None)
+            if close is not None:
+                await close()
+            # The task counts as done only after this returns; subscribers
+            # woken here see done() on the next loop turn, so wake them late.
+            asyncio.get_running_loop().call_soon(wake)
+
+    def _abandon(self, slot: Tuple[Any, str], call: Dict[str, Any]) -> None:
+        # Nobody is left to use the result: stop the work and let the next caller start fresh.
+        if not call["task"].done():
+            call["task"].cancel()
+        self._forget(slot, call)
+
+    def _forget(self, slot: Tuple[Any, str], call: Dict[str, Any]) -> None:
+        if self._calls.get(slot) is call:
+            del self._calls[slot]
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._counters, in_flight=len(self._calls))
+
+
+response_cache = TTLCache(
+    max_bytes=int(os.getenv("CHAT_CACHE_MAX_BYTES", str(8 * 1024 * 1024))),
+    ttl_seconds=float(os.getenv("CHAT_CACHE_TTL_SECONDS", "3600")),
+    disk_dir=os.getenv("CHAT_CACHE_DIR", "").strip() or None,
+    disk_max_bytes=int(os.getenv("CHAT_CACHE_DISK_MAX_BYTES", str(64 * 1024 * 1024))),
+)
+
+_seen_chunks_version: Optional[Tuple[int, int]] = None
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _normalize(text: str) -> str:
+    # Whitespace only: case can change the answer ("US" vs "us"), so it stays in the key.
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def chat_cache_key(provider: str, mode: str, facts: str, history: Any) -> str:
+    """Key a chat reply by provider, mode, facts block and trimmed history.
+
+    history is whatever the provider actually sends (Gemini contents or the
+    OpenAI transcript), so two requests share a key only if they would send
+    the same prompt. A change to profile_chunks.json empties the cache.
+    """
+    global _seen_chunks_version
+    version = chunks_version()
+    if _seen_chunks_version is not None and version != _seen_chunks_version:
+        response_cache.clear()
+    _seen_chunks_version = version
+
+    if not isinstance(history, str):
+        history = json.dumps(history, ensure_ascii=False, sort_keys=True)
+    facts_sig = hashlib.sha1((facts or "").encode("utf-8")).hexdigest()
+    history_sig = hashlib.sha1(_normalize(history).encode("utf-8")).hexdigest()
+    return f"chat:{provider}:{(mode or '').lower()}:{facts_sig}:{history_sig}"
+
+
+chat_flights = SingleFlight()
+stream_flights = SingleFlight()
+
+transcribe_cache = TTLCache(
+    max_bytes=int(os.getenv("TRANSCRIBE_CACHE_MAX_BYTES", str(2 * 1024 * 1024))),
+    ttl_seconds=float(os.getenv("TRANSCRIBE_CACHE_TTL_SECONDS", "900")),
+)
+transcribe_flights = SingleFlight()
+
+
+def _normalize_mime(mime: Optional[str]) -> str:
+    """Lowercase type and parameter names, no stray spaces; parameter values and order kept."""
+    base, *params = (mime or "").split(";")
+    parts = [base.strip().lower()]
+    for param in params:
+        name, sep, value = param.partition("=")
+        if name.strip():
+            parts.append(f"{name.strip().lower()}{sep}{value.strip()}")
+    return ";".join(parts)
+
+
+def transcribe_cache_key(provider: str, audio: bytes, mime: Optional[str]) -> str:
+    """Key a transcript by the exact upload bytes and its full MIME type.
+
+    Parameters stay in the key: raw PCM with a different ;rate= or ;channels=
+    is different audio even when the bytes match.
+    """
+    digest = hashlib.sha256(audio).hexdigest()
+    return f"transcribe:{provider}:{digest}:{_normalize_mime(mime)}"
@@ -0,0 +1,208 @@
+"""Process-wide registry of provider SDK clients.
+
+Building a genai.Client or AsyncOpenAI per request throws away the HTTP
+connection pool and TLS session each time. Clients here are cached per
+(provider, API key) and reused across requests, so keep-alive connections
+survive between chat turns.
+
+Async HTTP connections belong to the event loop that opened them. A client
+is therefore also rebuilt when it is requested from a different loop, which
+only happens with the asyncio.run() sync wrappers used by scripts. A client
+that is replaced or retired is closed on its own loop; run_closing() closes a
+wrapper's clients before asyncio.run() shuts its loop down.
+"""
+
+import asyncio
+import os
+import threading
+from typing import Any, Awaitable, Dict, Iterable, List, Optional, Set, TypeVar
+
+T = TypeVar("T")
+
+
+POOL_MAX_CONNECTIONS = int(os.getenv("PROVIDER_POOL_MAX_CONNECTIONS", "100"))
+POOL_MAX_KEEPALIVE = int(os.getenv("PROVIDER_POOL_MAX_KEEPALIVE", "20"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("PROVIDER_POOL_KEEPALIVE_EXPIRY", "60"))
+
+_lock = threading.Lock()
+_clients: Dict[tuple, Dict[str, Any]] = {}  # (provider, api_key) -> {"client", "loop"}
+_stats: Dict[str, Dict[str, int]] = {}
+_closing: Set["asyncio.Task[None]"] = set()
+
+
+def _current_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _limits() -> Any:
+    import httpx
+
+    return httpx.Limits(
+        max_connections=POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=POOL_MAX_KEEPALIVE,
+        keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+    )
+
+
+def _build_gemini(api_key: str) -> Any:
+    from google import genai
+
+    try:
+        import httpx
+        from google.genai import types
+
+        http_options = types.HttpOptions(httpx_async_client=httpx.AsyncClient(limits=_limits()))
+        return genai.Client(api_key=api_key, http_options=http_options)
+    except Exception:
+        # Older google-genai versions cannot take a custom httpx client. The
+        # SDK's own pool still gives keep-alive as long as the client is reused.
+        return genai.Client(api_key=api_key)
+
+
+def _build_openai(api_key: str) -> Any:
+    from openai import AsyncOpenAI
+
+    try:
+        from openai import DefaultAsyncHttpxClient
+
+        return AsyncOpenAI(api_key=api_key, http_client=DefaultAsyncHttpxClient(limits=_limits()))
+    except ImportError:
+        return AsyncOpenAI(api_key=api_key)
+
+
+_BUILDERS = {"gemini": _build_gemini, "openai": _build_openai}
+
+
+async def _aclose(client: Any) -> None:
+    """Close a client's HTTP pools; it is being dropped, so errors are ignored."""
+    try:
+        aio = getattr(client, "aio", None)
+        if aio is not None:
+            # genai.Client: the async pool lives on .aio, the sync one on the client.
+            client.close()
+            await aio.aclose()
+        else:
+            await client.close()
+    except Exception:
+        pass
+
+
+def _retire(entry: Dict[str, Any]) -> None:
+    """Close a dropped client on the loop that owns its connections."""
+    loop = entry["loop"]
+    if loop is None or loop.is_closed():
+        # Nothing async can run there any more; only a sync pool can still be closed.
+        close = getattr(entry["client"], "close", None)
+        if getattr(entry["client"], "aio", None) is not None and close is not None:
+            try:
+                close()
+            except Exception:
+                pass
+        return
+    if loop is _current_loop():
+        task = loop.create_task(_aclose(entry["client"]))
+        _closing.add(task)
+        task.add_done_callback(_closing.discard)
+    elif loop.is_running():
+        asyncio.run_coroutine_threadsafe(_aclose(entry["client"]), loop)
+    else:
+        try:
+            loop.run_until_complete(_aclose(entry["client"]))
+        except RuntimeError:
+            # Another loop is running in this thread; the pool cannot be closed from here.
+            pass
+
+
+def get_client(provider: str, api_key: str) -> Any:
+    """Return the pooled client for provider + api_key, creating it if needed."""
+    loop = _current_loop()
+    slot = (provider, api_key)
+    with _lock:
+        stats = _stats.setdefault(provider, {"created": 0, "reused": 0, "rebuilt": 0, "retired": 0})
+        entry = _clients.get(slot)
+        if entry is not None and entry["loop"] is loop:
+            stats["reused"] += 1
+            return entry["client"]
+        if entry is not None:
+            stats["rebuilt"] += 1
+
+    client = _BUILDERS[provider](api_key)
+
+    with _lock:
+        current = _clients.get(slot)
+        if current is not None and current["loop"] is loop:
+            # Another thread built one first; keep theirs so there is one pool.
+            stats["reused"] += 1
+            dropped, client = {"client": client, "loop": loop}, current["client"]
+        else:
+            # Anything still here belongs to another loop and is replaced.
+            _clients[slot] = {"client": client, "loop": loop}
+            stats["created"] += 1
+            dropped = current
+    if dropped is not None:
+        _retire(dropped)
+    return client
+
+
+def get_gemini_client(api_key: str) -> Any:
+    return get_client("gemini", api_key)
+
+
+def get_openai_client(api_key: str) -> Any:
+    return get_client("openai", api_key)
+
+
+def retain_keys(provider: str, api_keys: Iterable[str]) -> None:
+    """Drop pooled clients for keys that are no longer configured."""
+    keep = set(api_keys)
+    with _lock:
+        stale = [slot for slot in _clients if slot[0] == provider and slot[1] not in keep]
+        dropped = [_clients.pop(slot) for slot in stale]
+        if stale:
+            _stats.setdefault(provider, {"created": 0, "reused": 0, "rebuilt": 0, "retired": 0})["retired"] += len(stale)
+    for entry in dropped:
+        _retire(entry)
+
+
+async def close_loop_clients() -> None:
+    """Close and forget every pooled client owned by the running loop."""
+    loop = _current_loop()
+    with _lock:
+        owned = [slot for slot, entry in _clients.items() if entry["loop"] is loop]
+        entries: List[Dict[str, Any]] = [_clients.pop(slot) for slot in owned]
+    for entry in entries:
+        await _aclose(entry["client"])
+
+
+def run_closing(call: Awaitable[T]) -> T:
+    """asyncio.run() for the sync wrappers, closing the clients it opened before the loop ends."""
+
+    async def run() -> T:
+        try:
+            return await call
+        finally:
+            await close_loop_clients()
+
+    return asyncio.run(run())
+
+
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    """Per-provider counters plus the number of live pooled clients."""
+    with _lock:
+        out = {provider: dict(counts) for provider, counts in _stats.items()}
+        for provider, _ in _clients:
+            out.setdefault(provider, {"created": 0, "reused": 0, "rebuilt": 0, "retired": 0})
+            out[provider]["live"] = out[provider].get("live", 0) + 1
+        for counts in out.values():
+            counts.setdefault("live", 0)
+        return out
+
+
+def reset_clients() -> None:
+    """Forget every pooled client and counter (for tests)."""
+    with _lock:
+        _clients.clear()
+        _stats.clear()
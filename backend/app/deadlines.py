@@ -0,0 +1,78 @@
+"""Per-request time budgets for chat generation.
+
+Every chat turn gets a Deadline when it starts: CHAT_DEADLINE_MS_<MODE>, or
+the request's own deadline_ms. Each upstream attempt runs under a timeout of
+whatever is left (capped by CHAT_ATTEMPT_TIMEOUT_MS, so one hung call cannot
+eat the whole budget). A fallback is not started with less than
+MIN_ATTEMPT_SECONDS to go, and after a rate limit or timeout the next
+attempt waits an exponential backoff with full jitter that never runs past
+the budget. When time is up the caller keeps whatever answer it already has.
+"""
+
+import asyncio
+import os
+import random
+import time
+from typing import Awaitable, Optional, TypeVar
+
+
+DEFAULT_DEADLINES_MS = {"quota_saver": 20000, "normal": 30000, "quality": 45000}
+ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("CHAT_ATTEMPT_TIMEOUT_MS", "15000")) / 1000.0
+MIN_ATTEMPT_SECONDS = float(os.getenv("CHAT_MIN_ATTEMPT_MS", "750")) / 1000.0
+BACKOFF_BASE_SECONDS = float(os.getenv("CHAT_BACKOFF_BASE_MS", "250")) / 1000.0
+BACKOFF_MAX_SECONDS = float(os.getenv("CHAT_BACKOFF_MAX_MS", "4000")) / 1000.0
+# Bounds for a client-supplied deadline_ms.
+MIN_DEADLINE_MS = 1000
+MAX_DEADLINE_MS = 120000
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(RuntimeError):
+    pass
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.budget = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(self.expires - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+    def can_start(self) -> bool:
+        """Whether enough time is left to be worth launching another upstream call."""
+        return self.remaining() >= MIN_ATTEMPT_SECONDS
+
+    def attempt_timeout(self) -> float:
+        return min(self.remaining(), ATTEMPT_TIMEOUT_SECONDS)
+
+    async def run(self, call: Awaitable[T], what: str = "attempt") -> T:
+        """Await `call` under the per-attempt timeout; raise DeadlineExceeded when it runs out."""
+        timeout = self.attempt_timeout()
+        try:
+            return await asyncio.wait_for(call, timeout)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"{what} timed out after {timeout:.1f}s") from None
+
+    async def backoff(self, failures: int) -> bool:
+        """Sleep a jittered exponential backoff; False if it would not leave time for another attempt."""
+        ceiling = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** max(failures - 1, 0)))
+        delay = min(random.uniform(0.0, ceiling), self.remaining() - MIN_ATTEMPT_SECONDS)
+        if delay < 0.0:
+            return False
+        await asyncio.sleep(delay)
+        return True
+
+
+def deadline_for(mode: str, override_ms: Optional[int] = None) -> Deadline:
+    mode = (mode or "quota_saver").lower()
+    if override_ms is not None:
+        budget_ms = min(max(int(override_ms), MIN_DEADLINE_MS), MAX_DEADLINE_MS)
+    else:
+        default = DEFAULT_DEADLINES_MS.get(mode, DEFAULT_DEADLINES_MS["quota_saver"])
+        budget_ms = int(os.getenv(f"CHAT_DEADLINE_MS_{mode.upper()}", str(default)))
+    return Deadline(budget_ms / 1000.0)
@@ -1,16 +1,35 @@
+import asyncio
 import os
-import hashlib
-import random
 import time
-from typing import List, Dict, Any, Optional, Tuple, Callable
-
-# Global memory to track briefly exhausted keys. This is intentionally short-lived:
-# a key that hits a per-minute limit should recover quickly, especially when the
-# app has multiple free-tier keys configured.
-_dead_keys_memory = {}  # key -> expiry_timestamp
-
+from collections import deque
+from typing import List, Dict, Any, AsyncIterator, Awaitable, Deque, Optional, Tuple, Callable
+
+# Recent successful attempt latencies (seconds), used for percentile hedge delays.
+_attempt_latencies: Deque[float] = deque(maxlen=256)
+
+from .audio import prepare_audio
+from .cache import chat_cache_key, chat_flights, response_cache, stream_flights, transcribe_cache, transcribe_cache_key, transcribe_flights
+from .clients import get_gemini_client, retain_keys, run_closing
+from .deadlines import Deadline, DeadlineExceeded, deadline_for
+from .lengths import answer_cap
+from .metrics import (
+    AUDIO_BYTES_SAVED,
+    CACHE_LOOKUPS,
+    CONTINUATION_HOP_SECONDS,
+    FALLBACKS,
+    HEDGES,
+    PROVIDER_ATTEMPT_SECONDS,
+    RATE_LIMITED,
+    RETRIEVAL_SECONDS,
+    TRANSCRIBE_CACHE_LOOKUPS,
+    TRANSCRIBE_SECONDS,
+    record_span,
+    span,
+)
+from .packing import input_budget, pack_prompt
 from .prompts import SYSTEM_PROMPT_BASE
-from .retrieval import build_profile_context
+from .retrieval import profile_blocks
+from .scheduler import rank_keys, retry_after_seconds, scheduler
 
 
 def _comma_env(name: str) -> List[str]:
@@ -19,22 +38,17 @@ def _comma_env(name: str) -> List[str]:
 
 def _get_api_keys() -> List[str]:
     keys_str = os.getenv("GEMINI_API_KEYS", os.getenv("GEMINI_API_KEY", ""))
-    return [k.strip() for k in keys_str.split(",") if k.strip()]
-
-
-def _is_key_dead(key: str) -> bool:
-    if key not in _dead_keys_memory:
-        return False
-    if time.time() > _dead_keys_memory[key]:
-        del _dead_keys_memory[key]
-        return False
-    return True
+    keys = [k.strip() for k in keys_str.split(",") if k.strip()]
+    # Pooled clients for keys removed from the environment are dropped here.
+    retain_keys("gemini", keys)
+    return keys
 
 
 def _guess_mime(audio_bytes: bytes, declared_mime: Optional[str] = None) -> str:
+    """Declared mime with its parameters (raw PCM needs ;rate=), else a sniffed one."""
     mime = "audio/webm"
     if declared_mime and "/" in declared_mime:
-        mime = declared_mime.split(";")[0]
+        mime = declared_mime.strip()
     elif audio_bytes[:4] == b"RIFF":
         mime = "audio/wav"
     elif audio_bytes[:4] == b"OggS":
@@ -162,6 +176,25 @@ def _needs_continue(text: str) -> bool:
     return False
 
 
+def _finish_reason(resp: Any) -> Optional[str]:
+    for candidate in getattr(resp, "candidates", None) or []:
+        reason = getattr(candidate, "finish_reason", None)
+        if reason is not None:
+            return str(getattr(reason, "name", reason)).upper()
+    return None
+
+
+def _hit_output_cap(finish_reason: Optional[str], text: str) -> bool:
+    """Whether a reply was cut off by max_output_tokens and needs a continuation hop.
+
+    The finish reason decides whenever the API reports one; the text heuristic
+    is only a fallback for responses without it.
+    """
+    if finish_reason is not None:
+        return finish_reason == "MAX_TOKENS"
+    return _needs_continue(text)
+
+
 def _strip_continue_token(text: str) -> str:
     text = (text or "").strip()
     while text.endswith("[CONTINUE]"):
@@ -192,8 +225,7 @@ def _add_continuation_turn(contents: List[Dict[str, Any]], partial_answer: str)
         "parts": [{
             "text": (
                 "Continue exactly from where the previous answer stopped. "
-                "Do not repeat earlier text. Finish the answer cleanly. "
-                "Only end with [CONTINUE] if another continuation is still absolutely required."
+                "Do not repeat earlier text. Finish the answer cleanly."
             )
         }],
     })
@@ -204,156 +236,632 @@ def _is_rate_limit_error(err_msg: str) -> bool:
     text = err_msg.upper()
     return any(token in text for token in ["429", "QUOTA", "RESOURCE_EXHAUSTED", "RATE LIMIT", "RATE_LIMIT"])
 
-def _generate_with_key_and_model_fallback(
+def _hedge_delay() -> Optional[float]:
+    """Seconds to wait on a slow attempt before launching a backup, or None.
+
+    GEMINI_HEDGE_DELAY_MS is either a fixed delay in milliseconds or a
+    percentile such as "p90" of recent successful attempt latencies. Until
+    enough samples exist, GEMINI_HEDGE_DEFAULT_MS is used. Unset or 0 keeps the
+    plain one-at-a-time fallback.
+    """
+    spec = os.getenv("GEMINI_HEDGE_DELAY_MS", "").strip().lower()
+    if not spec or spec in ("0", "off", "false"):
+        return None
+    if spec.startswith("p"):
+        samples = sorted(_attempt_latencies)
+        if len(samples) < 20:
+            return float(os.getenv("GEMINI_HEDGE_DEFAULT_MS", "3000")) / 1000.0
+        pct = min(max(float(spec[1:]), 0.0), 100.0)
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100.0))]
+    return float(spec) / 1000.0
+
+
+def _usage_tokens(result: Any) -> Optional[int]:
+    usage = getattr(result, "usage_metadata", None)
+    total = getattr(usage, "total_token_count", None)
+    return total if isinstance(total, int) else None
+
+
+def _observe_attempt(seconds: float, key: str, model: str, outcome: str) -> None:
+    PROVIDER_ATTEMPT_SECONDS.observe(seconds, provider="gemini", model=model, key=key[-4:], outcome=outcome)
+    record_span("attempt", seconds, f"{model} ...{key[-4:]} {outcome}")
+
+
+async def _attempt_plan(api_keys: List[str], model_candidates: List[str]) -> List[Tuple[str, str]]:
+    """Order (key, model) pairs for one request.
+
+    Keys are ranked by token-bucket headroom on the preferred model, and each
+    key then walks the model candidates. Pairs still cooling down after a 429
+    are skipped unless every pair is cooling down. The whole plan comes from
+    one read of the scheduler, off the event loop.
+    """
+    if not model_candidates:
+        return []
+    room = await scheduler.offload(scheduler.headroom_table, api_keys, model_candidates)
+    keys = rank_keys(api_keys, {key: room[(key, model_candidates[0])] for key in api_keys})
+    blocked = {pair for pair, left in room.items() if left < 0.0}
+    plan = [(key, model) for key in keys for model in model_candidates]
+    return [pair for pair in plan if pair not in blocked] or plan
+
+
+async def _run_attempts(
     api_keys: List[str],
     model_candidates: List[str],
-    contents,
-    config_factory: Callable[[str], Any],
-    config_without_thinking: Callable[[], Any],
+    attempt: Callable[[Any, str, str, List[str]], Awaitable[Any]],
+    discard: Optional[Callable[[Any], Awaitable[None]]] = None,
+    est_tokens: float = 0.0,
+    deadline: Optional[Deadline] = None,
 ):
-    last_errors = []
+    """Run (key, model) attempts in fallback order and return the first success.
+
+    The order comes from _attempt_plan, and each launch is charged against
+    the shared key scheduler. With
+    hedging on, an attempt that is still running after _hedge_delay() gets a
+    backup on another key (or the next model), up to GEMINI_HEDGE_MAX_INFLIGHT
+    requests at once. The first success wins and the rest are cancelled;
+    `discard` cleans up a loser that also succeeded. Returns
+    (result, model, last tried model, errors).
+
+    With a deadline, every attempt runs under its per-call timeout, a 429 or
+    timeout backs off (with jitter) before the next sequential attempt, and
+    no attempt (hedges included) starts once too little time is left.
+    DeadlineExceeded is raised instead, and also when the plan ran out with
+    every failure a timeout or with the budget spent.
+    """
+    last_errors: List[str] = []
     last_tried = None
-    from google import genai
 
-    alive_keys = [k for k in api_keys if not _is_key_dead(k)]
-    if not alive_keys:
-        alive_keys = api_keys.copy()
+    pending: List[Tuple[str, Any, str]] = []
+    clients: Dict[str, Any] = {}
+    for key, model in await _attempt_plan(api_keys, model_candidates):
+        if key not in clients:
+            try:
+                clients[key] = get_gemini_client(key)
+            except Exception as client_exc:
+                last_errors.append(f"Key(...{key[-4:]}) client init: {client_exc}")
+                clients[key] = None
+        if clients[key] is not None:
+            pending.append((key, clients[key], model))
+
+    hedge_delay = _hedge_delay()
+    max_inflight = max(int(os.getenv("GEMINI_HEDGE_MAX_INFLIGHT", "2")), 1) if hedge_delay is not None else 1
+    running: Dict["asyncio.Task[Any]", Tuple[str, str, float]] = {}
+
+    def launch(prefer_other_key: bool) -> None:
+        nonlocal last_tried
+        pick = 0
+        if prefer_other_key:
+            busy = {key for key, _, _ in running.values()}
+            pick = next((i for i, (key, _, _) in enumerate(pending) if key not in busy), 0)
+        key, client, model = pending.pop(pick)
+        last_tried = model
+
+        async def charged(key=key, client=client, model=model):
+            await scheduler.offload(scheduler.acquire, key, model, est_tokens)
+            return await attempt(client, key, model, last_errors)
+
+        call = charged()
+        task = asyncio.ensure_future(deadline.run(call, model) if deadline is not None else call)
+        running[task] = (key, model, time.monotonic())
+
+    transient_failures = 0
+    failures = 0
+    timeouts = 0
+    out_of_time = False
+    try:
+        while pending or running:
+            if not running:
+                if deadline is not None and not deadline.can_start():
+                    out_of_time = True
+                    break
+                launch(False)
+            timeout = None
+            if pending and len(running) < max_inflight and (deadline is None or deadline.can_start()):
+                newest = max(started for _, _, started in running.values())
+                timeout = max(newest + hedge_delay - time.monotonic(), 0.0)
+            done, _ = await asyncio.wait(list(running), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                if deadline is not None and not deadline.can_start():
+                    continue
+                HEDGES.inc(provider="gemini")
+                launch(True)
+                continue
+
+            winner = None
+            back_off = False
+            for task in done:
+                key, model, started = running.pop(task)
+                exc = task.exception()
+                elapsed = time.monotonic() - started
+                if exc is None:
+                    _observe_attempt(elapsed, key, model, "ok")
+                    if winner is None:
+                        winner = (task.result(), key, model, started)
+                    elif discard is not None:
+                        await discard(task.result())
+                    continue
+                err_msg = str(exc)
+                last_errors.append(f"Key(...{key[-4:]}) {model}: {err_msg}")
+                rate_limited = _is_rate_limit_error(err_msg)
+                timed_out = isinstance(exc, DeadlineExceeded)
+                failures += 1
+                timeouts += timed_out
+                _observe_attempt(elapsed, key, model, "rate_limited" if rate_limited else "timeout" if timed_out else "error")
+                if pending or running:
+                    FALLBACKS.inc(provider="gemini")
+                if rate_limited or timed_out:
+                    transient_failures += 1
+                    back_off = True
+                # Only quota errors cool a pair down; a model that is simply not
+                # available on a free key must not block the key's other models.
+                if rate_limited:
+                    RATE_LIMITED.inc(provider="gemini", model=model)
+                    await scheduler.offload(scheduler.record_rate_limit, key, model, retry_after_seconds(exc))
+            if winner is not None:
+                result, key, model, started = winner
+                _attempt_latencies.append(time.monotonic() - started)
+                actual = _usage_tokens(result)
+                if actual is not None:
+                    await scheduler.offload(scheduler.settle, key, model, est_tokens, actual)
+                return result, model, last_tried, last_errors
+            if deadline is not None and back_off and pending and not running:
+                if not await deadline.backoff(transient_failures):
+                    out_of_time = True
+                    break
+    finally:
+        for task, (key, model, started) in running.items():
+            task.cancel()
+            _observe_attempt(time.monotonic() - started, key, model, "cancelled")
+        for outcome in await asyncio.gather(*running, return_exceptions=True):
+            if discard is not None and not isinstance(outcome, BaseException):
+                await discard(outcome)
+
+    if out_of_time:
+        raise DeadlineExceeded(" | ".join((last_errors[-3:]) + ["deadline reached before another attempt could start"]))
+    if timeouts and (timeouts == failures or (deadline is not None and deadline.expired())):
+        raise DeadlineExceeded(" | ".join(last_errors[-4:]))
+    raise RuntimeError(" | ".join(last_errors[-4:]) if last_errors else "All keys failed.")
 
-    random.shuffle(alive_keys)
 
-    for key in alive_keys:
-        key_had_success_possible = False
-        try:
-            client = genai.Client(api_key=key)
-            for model in model_candidates:
-                last_tried = model
-                try:
-                    resp = client.models.generate_content(
-                        model=model,
-                        contents=contents,
-                        config=config_factory(model),
-                    )
-                    return resp, model, last_tried, last_errors
-                except Exception as first_exc:
-                    err_msg = str(first_exc)
-
-                    # Some deployed google-genai/API combinations may reject the new
-                    # thinking_level field. Retry the same model once without it before
-                    # declaring the model unavailable.
-                    if "thinking" in err_msg.lower() or "ThinkingConfig" in err_msg:
-                        try:
-                            resp = client.models.generate_content(
-                                model=model,
-                                contents=contents,
-                                config=config_without_thinking(),
-                            )
-                            last_errors.append(
-                                f"Key(...{key[-4:]}) {model}: thinking_config rejected; retried without explicit thinking"
-                            )
-                            return resp, model, last_tried, last_errors
-                        except Exception as retry_exc:
-                            err_msg = str(retry_exc)
-
-                    last_errors.append(f"Key(...{key[-4:]}) {model}: {err_msg}")
-
-                    # Do not kill a free key just because one stronger model is not
-                    # available. Try the next candidate; if every candidate fails with
-                    # quota/capacity, briefly cool down the key after this loop.
-                    if _looks_like_model_access_error(err_msg):
-                        continue
-                    continue
-        except Exception as client_exc:
-            last_errors.append(f"Key(...{key[-4:]}) client init: {client_exc}")
-            continue
+def _is_thinking_error(err_msg: str) -> bool:
+    # Some deployed google-genai/API combinations may reject the new
+    # thinking_level field. Retry the same model once without it before
+    # declaring the model unavailable.
+    return "thinking" in err_msg.lower() or "ThinkingConfig" in err_msg
 
-        recent_for_key = [e.upper() for e in last_errors[-len(model_candidates):]]
-        if recent_for_key and all(("429" in e or "QUOTA" in e or "RESOURCE_EXHAUSTED" in e) for e in recent_for_key):
-            _dead_keys_memory[key] = time.time() + 60
 
-    raise RuntimeError(" | ".join(last_errors[-4:]) if last_errors else "All keys failed.")
+async def _generate_with_key_and_model_fallback(
+    api_keys: List[str],
+    model_candidates: List[str],
+    contents,
+    config_factory: Callable[[str], Any],
+    config_without_thinking: Callable[[], Any],
+    est_tokens: float = 0.0,
+    deadline: Optional[Deadline] = None,
+):
+    async def attempt(client: Any, key: str, model: str, notes: List[str]) -> Any:
+        try:
+            return await client.aio.models.generate_content(
+                model=model,
+                contents=contents,
+                config=config_factory(model),
+            )
+        except Exception as first_exc:
+            if not _is_thinking_error(str(first_exc)):
+                raise
+            resp = await client.aio.models.generate_content(
+                model=model,
+                contents=contents,
+                config=config_without_thinking(),
+            )
+            notes.append(f"Key(...{key[-4:]}) {model}: thinking_config rejected; retried without explicit thinking")
+            return resp
+
+    return await _run_attempts(api_keys, model_candidates, attempt, est_tokens=est_tokens, deadline=deadline)
 
 
-def chat_reply(messages: List[Dict[str, Any]], app_mode: str = "quota_saver") -> Dict[str, Any]:
+def _prepare_chat(messages: List[Dict[str, Any]], app_mode: str, deadline_ms: Optional[int] = None) -> Dict[str, Any]:
+    """Resolve keys, mode settings, retrieval facts and history for one chat turn."""
     api_keys = _get_api_keys()
     if not api_keys:
         raise RuntimeError("Missing GEMINI_API_KEYS or GEMINI_API_KEY")
 
-    from google import genai
     from google.genai import types
 
     mode = (app_mode or "quota_saver").lower()
-    candidates, max_out, max_hops, turns, thinking_level = _chat_mode_config(mode)
+    deadline = deadline_for(mode, deadline_ms)
+    candidates, base_out, max_hops, turns, thinking_level = _chat_mode_config(mode)
     last_user_text = ""
     for m in reversed(messages or []):
         if m.get("role") == "user" and m.get("content"):
             last_user_text = m.get("content").strip()
             break
+    # Size the cap to the question so long answers finish in one generation.
+    max_out, answer_kind = answer_cap(last_user_text, base_out)
 
-    # Retrieval
-    embed_key = next((k for k in api_keys if not _is_key_dead(k)), api_keys[0])
-    embed_client = genai.Client(api_key=embed_key)
-    facts = build_profile_context(
-        client=embed_client,
-        question_text=last_user_text,
-        embed_model="gemini-embedding-001",
-        output_dimensionality=256,
-    )
+    # Retrieval is lexical over the local profile corpus; no embedding call.
+    with RETRIEVAL_SECONDS.time(provider="gemini"), span("retrieval"):
+        blocks = profile_blocks(question_text=last_user_text)
+
+    with span("history"):
+        packed = pack_prompt(SYSTEM_PROMPT_BASE, blocks, messages, input_budget(mode), turns, max_facts_chars=4200)
+        facts = packed["facts"]
+        hist = build_gemini_history(packed["messages"], len(packed["messages"])) or [
+            {"role": "user", "parts": [{"text": last_user_text or "Hi"}]}
+        ]
 
     sys_inst = SYSTEM_PROMPT_BASE
     if facts:
         sys_inst += f"\n\nFACTS CONTEXT:\n{facts}"
 
-    hist = build_gemini_history(messages, turns) or [{"role": "user", "parts": [{"text": last_user_text or "Hi"}]}]
+    return {
+        "api_keys": api_keys,
+        "mode": mode,
+        "deadline": deadline,
+        "candidates": candidates,
+        "max_out": max_out,
+        "answer_kind": answer_kind,
+        "max_hops": max_hops,
+        "thinking_level": thinking_level,
+        "facts": facts,
+        "contents": hist,
+        "context_tokens": packed["tokens"],
+        # Packed prompt estimate plus the output cap, charged to the TPM bucket.
+        "est_tokens": packed["tokens"]["total"] + max_out,
+        "config_factory": lambda model: _make_generation_config(types, model, mode, max_out, sys_inst, thinking_level),
+        "config_without_thinking": lambda: _make_generation_config_without_thinking(types, max_out, sys_inst, mode),
+    }
+
 
-    resp, used, last_m, errs = _generate_with_key_and_model_fallback(
-        api_keys=api_keys,
-        model_candidates=candidates,
-        contents=hist,
-        config_factory=lambda model: _make_generation_config(types, model, mode, max_out, sys_inst, thinking_level),
-        config_without_thinking=lambda: _make_generation_config_without_thinking(types, max_out, sys_inst, mode),
+def _chat_metadata(
+    chat: Dict[str, Any],
+    used: Optional[str],
+    last_m: Optional[str],
+    errs: List[str],
+    hops_used: int,
+    deadline_hit: bool = False,
+    truncated: bool = False,
+) -> Dict[str, Any]:
+    return {
+        "used_model": used,
+        "last_tried_model": last_m,
+        "model_errors": errs[-8:],
+        "mode_detail": (
+            f"{chat['mode']}; thinking={chat['thinking_level']}; "
+            f"max_output_tokens={chat['max_out']} ({chat['answer_kind']} answer)"
+        ),
+        "candidate_models": chat["candidates"],
+        "hops_used": hops_used,
+        "context_tokens": chat["context_tokens"],
+        "deadline_ms": int(chat["deadline"].budget * 1000),
+        "deadline_exceeded": deadline_hit,
+        "truncated": truncated,
+    }
+
+
+async def chat_reply_async(
+    messages: List[Dict[str, Any]], app_mode: str = "quota_saver", deadline_ms: Optional[int] = None
+) -> Dict[str, Any]:
+    chat = _prepare_chat(messages, app_mode, deadline_ms)
+    cache_key = chat_cache_key("gemini", chat["mode"], chat["facts"], chat["contents"])
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        CACHE_LOOKUPS.inc(provider="gemini", result="hit")
+        return dict(cached, cached=True)
+
+    # Identical questions arriving together (same prompt, same key) share one generation.
+    result, shared = await chat_flights.do(cache_key, lambda: _generate_reply(chat, cache_key))
+    CACHE_LOOKUPS.inc(provider="gemini", result="shared" if shared else "miss")
+    return dict(result, coalesced=True) if shared else result
+
+
+async def _generate_reply(chat: Dict[str, Any], cache_key: str) -> Dict[str, Any]:
+    resp, used, last_m, errs = await _generate_with_key_and_model_fallback(
+        api_keys=chat["api_keys"],
+        model_candidates=chat["candidates"],
+        contents=chat["contents"],
+        config_factory=chat["config_factory"],
+        config_without_thinking=chat["config_without_thinking"],
+        est_tokens=chat["est_tokens"],
+        deadline=chat["deadline"],
     )
 
     bot_text = _strip_continue_token(resp.text or "")
+    truncated = _hit_output_cap(_finish_reason(resp), resp.text or "")
     hops_used = 0
-    continuation_contents = hist
+    deadline_hit = False
+    continuation_contents = chat["contents"]
 
-    for _ in range(max_hops):
-        if not _needs_continue((resp.text or "").strip()) and not _needs_continue(bot_text):
+    # Hop only while the model actually ran into max_output_tokens.
+    for _ in range(chat["max_hops"]):
+        if not truncated:
+            break
+        if not chat["deadline"].can_start():
+            # Out of time: return what we have rather than start another call.
+            deadline_hit = True
             break
         hops_used += 1
         continuation_contents = _add_continuation_turn(continuation_contents, bot_text)
         try:
-            resp2, used2, last_m2, errs2 = _generate_with_key_and_model_fallback(
-                api_keys=api_keys,
-                model_candidates=candidates,
-                contents=continuation_contents,
-                config_factory=lambda model: _make_generation_config(types, model, mode, max_out, sys_inst, thinking_level),
-                config_without_thinking=lambda: _make_generation_config_without_thinking(types, max_out, sys_inst, mode),
-            )
+            with CONTINUATION_HOP_SECONDS.time(provider="gemini"), span("hop"):
+                resp2, used2, last_m2, errs2 = await _generate_with_key_and_model_fallback(
+                    api_keys=chat["api_keys"],
+                    model_candidates=chat["candidates"],
+                    contents=continuation_contents,
+                    config_factory=chat["config_factory"],
+                    config_without_thinking=chat["config_without_thinking"],
+                    est_tokens=chat["est_tokens"],
+                    deadline=chat["deadline"],
+                )
             used = used2
             last_m = last_m2
             errs.extend(errs2)
             continuation = _strip_continue_token(resp2.text or "")
+            truncated = _hit_output_cap(_finish_reason(resp2), resp2.text or "")
             if not continuation:
                 break
             bot_text = _merge_text(bot_text, continuation)
-            resp = resp2
         except Exception as exc:
             errs.append(f"Continuation failed: {exc}")
+            deadline_hit = isinstance(exc, DeadlineExceeded)
             break
 
-    return {
-        "reply": bot_text.strip() or "I didn’t catch that fully — can you say it again?",
-        "used_model": used,
-        "last_tried_model": last_m,
-        "model_errors": errs[-8:],
-        "mode_detail": f"{mode}; thinking={thinking_level}; max_output_tokens={max_out}",
-        "candidate_models": candidates,
-        "hops_used": hops_used,
-    }
+    result = {"reply": bot_text.strip() or "I didn’t catch that fully — can you say it again?"}
+    result.update(_chat_metadata(chat, used, last_m, errs, hops_used, deadline_hit, truncated))
+    # A reply cut short by the deadline is not cached; the next ask may finish it.
+    if bot_text.strip() and not deadline_hit:
+        response_cache.set(cache_key, result)
+    return result
 
 
-def transcribe(audio_bytes: bytes, declared_mime: Optional[str] = None) -> Dict[str, Any]:
+def chat_reply(messages: List[Dict[str, Any]], app_mode: str = "quota_saver", deadline_ms: Optional[int] = None) -> Dict[str, Any]:
+    """Blocking wrapper around chat_reply_async for scripts and sync callers.
+
+    Must not be called from inside a running event loop.
+    """
+    return run_closing(chat_reply_async(messages, app_mode, deadline_ms))
+
+
+_CONTINUE_TOKEN = "[CONTINUE]"
+
+
+def _split_streamable(buffer: str) -> Tuple[str, str]:
+    """Split buffered text into (safe to emit, held back).
+
+    A trailing "[CONTINUE]" must never reach the client, so any tail that could
+    still grow into that token is held until more text or the end of the stream.
+    """
+    cut = len(buffer)
+    start = buffer.rfind("[")
+    if start != -1 and _CONTINUE_TOKEN.startswith(buffer[start:].rstrip()):
+        cut = start
+    # Trailing whitespace is held too, so it is not emitted ahead of a dropped token.
+    cut = len(buffer[:cut].rstrip())
+    return buffer[:cut], buffer[cut:]
+
+
+async def _stream_with_key_and_model_fallback(
+    api_keys: List[str],
+    model_candidates: List[str],
+    contents,
+    config_factory: Callable[[str], Any],
+    config_without_thinking: Callable[[], Any],
+    outcome: Dict[str, Any],
+    est_tokens: float = 0.0,
+    deadline: Optional[Deadline] = None,
+) -> AsyncIterator[str]:
+    """Stream text chunks, falling back across keys/models until one starts.
+
+    Fallback (and hedging) only applies until the first chunk arrives; once
+    text has been sent it cannot be taken back, so a mid-stream failure ends
+    the stream and is reported in the errors. The used model, last tried model,
+    errors and the final chunk's finish_reason are written into `outcome` when
+    the stream ends, plus deadline_exceeded if the deadline cut the stream short.
+    """
+
+    async def open_stream(client: Any, key: str, model: str, config: Any) -> Tuple[Any, Any, str]:
+        stream = await client.aio.models.generate_content_stream(model=model, contents=contents, config=config)
+        try:
+            return stream, await stream.__anext__(), key
+        except StopAsyncIteration:
+            return stream, None, key
+
+    async def attempt(client: Any, key: str, model: str, notes: List[str]) -> Tuple[Any, Any, str]:
+        try:
+            return await open_stream(client, key, model, config_factory(model))
+        except Exception as first_exc:
+            if not _is_thinking_error(str(first_exc)):
+                raise
+            opened = await open_stream(client, key, model, config_without_thinking())
+            notes.append(f"Key(...{key[-4:]}) {model}: thinking_config rejected; retried without explicit thinking")
+            return opened
+
+    async def discard(opened: Tuple[Any, Any, str]) -> None:
+        close = getattr(opened[0], "aclose", None)
+        if close is not None:
+            try:
+                await close()
+            except Exception:
+                pass
+
+    (stream, first, key), model, last_tried, last_errors = await _run_attempts(
+        api_keys, model_candidates, attempt, discard, est_tokens=est_tokens, deadline=deadline
+    )
+    cut_short = False
+    finish_reason = None
+    try:
+        chunk = first
+        while chunk is not None:
+            finish_reason = _finish_reason(chunk) or finish_reason
+            text = getattr(chunk, "text", None) or ""
+            if text:
+                yield text
+            try:
+                if deadline is None:
+                    chunk = await stream.__anext__()
+                else:
+                    chunk = await asyncio.wait_for(stream.__anext__(), deadline.remaining())
+            except StopAsyncIteration:
+                chunk = None
+    except asyncio.TimeoutError:
+        cut_short = True
+        last_errors.append(f"Key(...{key[-4:]}) {model}: deadline reached mid-stream")
+        await discard((stream, None, key))
+    except Exception as exc:
+        last_errors.append(f"Key(...{key[-4:]}) {model}: stream interrupted: {exc}")
+    except BaseException:
+        # Cancelled or closed early (the client went away): release the upstream stream.
+        await discard((stream, None, key))
+        raise
+    outcome.update(
+        used=model, last_tried=last_tried, errors=last_errors, finish_reason=finish_reason, deadline_exceeded=cut_short
+    )
+
+
+def chat_reply_stream(
+    messages: List[Dict[str, Any]], app_mode: str = "quota_saver", deadline_ms: Optional[int] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """Streaming variant of chat_reply_async.
+
+    Setup errors (missing keys) raise immediately. The returned async iterator
+    yields {"type": "delta", "text": ...} events as tokens arrive, continuation
+    hops included, then one {"type": "done", ...} event carrying the same
+    fields as chat_reply's result. If no model could start, it yields
+    {"type": "error"}.
+    """
+    chat = _prepare_chat(messages, app_mode, deadline_ms)
+    cache_key = chat_cache_key("gemini", chat["mode"], chat["facts"], chat["contents"])
+
+    async def events() -> AsyncIterator[Dict[str, Any]]:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            CACHE_LOOKUPS.inc(provider="gemini", result="hit")
+            yield {"type": "delta", "text": cached["reply"]}
+            yield dict(cached, type="done", cached=True)
+            return
+
+        # Concurrent identical streams follow one generation; late joiners replay it from the start.
+        first = True
+        async for event, shared in stream_flights.stream(cache_key, generate):
+            if first:
+                CACHE_LOOKUPS.inc(provider="gemini", result="shared" if shared else "miss")
+                first = False
+            yield dict(event, coalesced=True) if shared and event["type"] == "done" else event
+
+    async def generate() -> AsyncIterator[Dict[str, Any]]:
+        bot_text = ""
+        contents = chat["contents"]
+        used = last_m = None
+        errs: List[str] = []
+        hops_used = 0
+        deadline_hit = False
+        truncated = False
+
+        for hop in range(chat["max_hops"] + 1):
+            if hop:
+                # Hop only when the previous stream actually ran into max_output_tokens.
+                if not truncated:
+                    break
+                if not chat["deadline"].can_start():
+                    deadline_hit = True
+                    break
+                hops_used += 1
+                contents = _add_continuation_turn(contents, bot_text)
+
+            raw_text = ""
+            emitted = ""
+            held = ""
+            # Same joiner _merge_text inserts between a partial answer and its continuation.
+            joiner = ("" if bot_text.endswith(("-", "/", "(", "[", "{")) else " ") if bot_text else ""
+            outcome: Dict[str, Any] = {}
+            hop_started = time.perf_counter()
+            try:
+                async for piece in _stream_with_key_and_model_fallback(
+                    api_keys=chat["api_keys"],
+                    model_candidates=chat["candidates"],
+                    contents=contents,
+                    config_factory=chat["config_factory"],
+                    config_without_thinking=chat["config_without_thinking"],
+                    outcome=outcome,
+                    est_tokens=chat["est_tokens"],
+                    deadline=chat["deadline"],
+                ):
+                    raw_text += piece
+                    ready, held = _split_streamable(held + piece)
+                    if not emitted:
+                        ready = ready.lstrip()
+                        if ready:
+                            ready = joiner + ready
+                    if ready:
+                        emitted += ready
+                        yield {"type": "delta", "text": ready}
+            except Exception as exc:
+                if not hop:
+                    yield {"type": "error", "detail": str(exc)}
+                    return
+                errs.append(f"Continuation failed: {exc}")
+                deadline_hit = isinstance(exc, DeadlineExceeded)
+                break
+            if hop:
+                CONTINUATION_HOP_SECONDS.observe(time.perf_counter() - hop_started, provider="gemini")
+                record_span("hop", time.perf_counter() - hop_started)
+            used, last_m = outcome.get("used"), outcome.get("last_tried")
+            errs.extend(outcome.get("errors") or [])
+            deadline_hit = bool(outcome.get("deadline_exceeded"))
+            truncated = _hit_output_cap(outcome.get("finish_reason"), raw_text)
+
+            tail = held.rstrip()
+            if tail.endswith(_CONTINUE_TOKEN):
+                tail = tail[:-len(_CONTINUE_TOKEN)].rstrip()
+            if tail:
+                if not emitted:
+                    tail = joiner + tail.lstrip()
+                emitted += tail
+                yield {"type": "delta", "text": tail}
+
+            continuation = _strip_continue_token(raw_text)
+            if hop and not continuation:
+                break
+            bot_text = _merge_text(bot_text, continuation) if hop else continuation
+
+        reply = bot_text.strip()
+        if not reply:
+            reply = "I didn’t catch that fully — can you say it again?"
+            yield {"type": "delta", "text": reply}
+        result = {"reply": reply}
+        result.update(_chat_metadata(chat, used, last_m, errs, hops_used, deadline_hit, truncated))
+        if bot_text.strip() and not deadline_hit:
+            response_cache.set(cache_key, result)
+        yield dict(result, type="done")
+
+    return events()
+
+
+async def transcribe_async(audio_bytes: bytes, declared_mime: Optional[str] = None) -> Dict[str, Any]:
+    with TRANSCRIBE_SECONDS.time(provider="gemini", outcome="error") as labels:
+        # Retried and double-submitted uploads are byte-identical; answer them
+        # from the cache, or share the upstream call if one is already running.
+        cache_key = transcribe_cache_key("gemini", audio_bytes, _guess_mime(audio_bytes, declared_mime))
+        cached = transcribe_cache.get(cache_key)
+        if cached is not None:
+            TRANSCRIBE_CACHE_LOOKUPS.inc(provider="gemini", result="hit")
+            labels["outcome"] = "cached"
+            return dict(cached, cached=True)
+
+        async def fill() -> Dict[str, Any]:
+            # Cached from inside the shared task, so it lands even if the caller who started it went away.
+            fresh = await _transcribe(audio_bytes, declared_mime)
+            if fresh.get("used_model"):
+                transcribe_cache.set(cache_key, fresh)
+            return fresh
+
+        result, shared = await transcribe_flights.do(cache_key, fill)
+        TRANSCRIBE_CACHE_LOOKUPS.inc(provider="gemini", result="shared" if shared else "miss")
+        labels["outcome"] = "ok" if result.get("text") else "empty"
+        return dict(result, coalesced=True) if shared else result
+
+
+async def _transcribe(audio_bytes: bytes, declared_mime: Optional[str] = None) -> Dict[str, Any]:
     api_keys = _get_api_keys()
     if not api_keys:
         raise RuntimeError("Missing GEMINI_API_KEYS or GEMINI_API_KEY")
@@ -362,6 +870,14 @@ def transcribe(audio_bytes: bytes, declared_mime: Optional[str] = None) -> Dict[
 
     from google.genai import types
     mime = _guess_mime(audio_bytes, declared_mime)
+    with span("preprocess"):
+        prepared = await asyncio.to_thread(prepare_audio, audio_bytes, mime)
+    AUDIO_BYTES_SAVED.inc(prepared["bytes_saved"], provider="gemini")
+    if prepared["silent"]:
+        # Pure silence: nothing to transcribe, so no model call.
+        return {"text": "", "used_model": None, "bytes_saved": prepared["bytes_saved"]}
+    # Gemini takes a bare mime type; parameters only matter to prepare_audio.
+    audio_bytes, mime = prepared["audio"], prepared["mime"].split(";")[0].strip()
 
     audio_models = _comma_env("GEMINI_TRANSCRIBE_MODEL_CANDIDATES") or [
         "gemini-3.1-flash-lite",
@@ -377,18 +893,21 @@ def transcribe(audio_bytes: bytes, declared_mime: Optional[str] = None) -> Dict[
     config = types.GenerateContentConfig(temperature=0.0, max_output_tokens=300)
 
     last_errors = []
-    alive_keys = [k for k in api_keys if not _is_key_dead(k)]
-    if not alive_keys:
-        alive_keys = api_keys.copy()
-    random.shuffle(alive_keys)
-
-    for key in alive_keys:
+    room = await scheduler.offload(scheduler.headroom_table, api_keys, audio_models)
+    # Same rule as _attempt_plan: skip cooling pairs only while something else can run.
+    blocked = {pair for pair, left in room.items() if left < 0.0}
+    if len(blocked) == len(room):
+        blocked = set()
+    for key in rank_keys(api_keys, {k: room[(k, audio_models[0])] for k in api_keys}):
         try:
-            from google import genai
-            client = genai.Client(api_key=key)
+            client = get_gemini_client(key)
             for m in audio_models:
+                if (key, m) in blocked:
+                    continue
+                await scheduler.offload(scheduler.acquire, key, m, 300)
+                started = time.perf_counter()
                 try:
-                    resp = client.models.generate_content(
+                    resp = await client.aio.models.generate_content(
                         model=m,
                         contents=[
                             prompt,
@@ -396,23 +915,31 @@ def transcribe(audio_bytes: bytes, declared_mime: Optional[str] = None) -> Dict[
                         ],
                         config=config,
                     )
+                    _observe_attempt(time.perf_counter() - started, key, m, "ok")
                     text = (resp.text or "").strip()
                     if "[NO_SPEECH]" in text.upper():
-                        return {"text": "", "used_model": m}
+                        return {"text": "", "used_model": m, "bytes_saved": prepared["bytes_saved"]}
                     if text:
-                        return {"text": text, "used_model": m}
+                        return {"text": text, "used_model": m, "bytes_saved": prepared["bytes_saved"]}
                 except Exception as e:
                     err_msg = str(e)
                     last_errors.append(f"{m}: {err_msg}")
-                    # Continue through audio fallbacks first; only cool down the key
-                    # if every audio model is exhausted.
+                    rate_limited = _is_rate_limit_error(err_msg)
+                    _observe_attempt(time.perf_counter() - started, key, m, "rate_limited" if rate_limited else "error")
+                    FALLBACKS.inc(provider="gemini")
+                    # Continue through audio fallbacks; a quota error only cools
+                    # down this key/model pair.
+                    if rate_limited:
+                        RATE_LIMITED.inc(provider="gemini", model=m)
+                        await scheduler.offload(scheduler.record_rate_limit, key, m, retry_after_seconds(e))
                     continue
         except Exception:
             continue
 
-        recent_for_key = [e.upper() for e in last_errors[-len(audio_models):]]
-        if recent_for_key and all(("429" in e or "QUOTA" in e or "RESOURCE_EXHAUSTED" in e) for e in recent_for_key):
-            _dead_keys_memory[key] = time.time() + 60
-
     error_summary = " | ".join(last_errors[-2:])
     raise RuntimeError(f"Transcription failed. Quota exhausted or models unavailable. {error_summary}")
+
+
+def transcribe(audio_bytes: bytes, declared_mime: Optional[str] = None) -> Dict[str, Any]:
+    """Blocking wrapper around transcribe_async; not for use inside an event loop."""
+    return run_closing(transcribe_async(audio_bytes, declared_mime))
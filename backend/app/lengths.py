@@ -0,0 +1,54 @@
+"""Output-token caps sized to the question.
+
+A greeting needs a sentence; "walk me through your thesis" needs several
+paragraphs. Every mode has a base cap, and answer_cap() scales it by the
+kind of question so a long answer fits in one generation instead of a chain
+of continuation hops (each of which resends the whole prompt), while short
+replies do not reserve quota they will never use.
+
+The classification is a cheap keyword check on the newest user message.
+Getting it wrong is harmless: a reply that really hits its cap still gets a
+continuation hop.
+"""
+
+import os
+import re
+from typing import Tuple
+
+
+# Multiplier on the mode's base cap for each kind of question.
+OUTPUT_FACTORS = {"short": 0.4, "standard": 1.0, "long": 2.0}
+MIN_OUTPUT_TOKENS = 256
+MAX_OUTPUT_TOKENS = int(os.getenv("CHAT_MAX_OUTPUT_TOKENS", "8192"))
+# Questions at least this many words long usually want a long answer.
+LONG_QUESTION_WORDS = 40
+
+_SHORT_RE = re.compile(
+    r"^(hi|hello|hey|yo|thanks|thank you|thx|ok|okay|cool|great|nice|bye|goodbye|good (morning|afternoon|evening|night))\b"
+)
+_CLOSED_RE = re.compile(r"^(is|are|am|do|does|did|can|could|have|has|will|would|was|were|who|when|where|which|what is your name)\b")
+_LONG_RE = re.compile(
+    r"\b(explain|walk (me|us) through|describe|elaborate|in detail|detailed|step[- ]by[- ]step|compare|contrast|"
+    r"difference between|differences|pros and cons|trade-?offs?|deep dive|architecture|design|derive|derivation|prove|"
+    r"how (does|do|did|would|could|can|should)|why (does|do|did|would|is|are)|examples|list)\b"
+)
+
+
+def classify_question(text: str) -> str:
+    """Return "short", "standard" or "long" for the newest user message."""
+    text = " ".join((text or "").lower().split())
+    words = len(text.split())
+    if not words:
+        return "short"
+    if words >= LONG_QUESTION_WORDS or _LONG_RE.search(text):
+        return "long"
+    if _SHORT_RE.match(text) or (words <= 8 and _CLOSED_RE.match(text)):
+        return "short"
+    return "standard"
+
+
+def answer_cap(question: str, base_tokens: int) -> Tuple[int, str]:
+    """Return (max_output_tokens, question kind) for `question` under a mode's base cap."""
+    kind = classify_question(question)
+    tokens = int(base_tokens * OUTPUT_FACTORS[kind])
+    return max(MIN_OUTPUT_TOKENS, min(tokens, MAX_OUTPUT_TOKENS)), kind
@@ -1,21 +1,34 @@
+import asyncio
+import json
 import os
-from typing import Any, Dict, List, Literal, Optional
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Dict, List, Literal, Optional, Tuple
 
 # --- ADD THESE TWO LINES AT THE VERY TOP ---
 from dotenv import load_dotenv
 load_dotenv() 
 # -------------------------------------------
 
-from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, ConfigDict, Field
+from starlette.datastructures import MutableHeaders
 
 # --- CHANGE THIS LINE TO IMPORT FROM .gemini ---
-from .gemini import chat_reply, transcribe
+from .gemini import chat_reply_async, chat_reply_stream, transcribe_async
 # -----------------------------------------------
+from . import metrics
+from .admission import AdmissionController, Rejected, controller_from_env
+from .clients import close_loop_clients
+from .deadlines import MAX_DEADLINE_MS, MIN_DEADLINE_MS, DeadlineExceeded
+from .sessions import new_session_id, session_store
+from .uploads import UploadError, UploadTooLarge, read_audio_upload
 
 Role = Literal["user", "assistant"]
 MAX_AUDIO_BYTES = int(os.getenv("MAX_AUDIO_BYTES", str(12 * 1024 * 1024)))
+DEBUG_TIMINGS = os.getenv("CHAT_DEBUG_TIMINGS", "").strip().lower() in ("1", "true", "yes")
+TRUST_FORWARDED = os.getenv("ADMISSION_TRUST_FORWARDED", "").strip().lower() in ("1", "true", "yes")
 
 class Message(BaseModel):
     role: Role
@@ -25,6 +38,14 @@ class Message(BaseModel):
 class ChatRequest(BaseModel):
     messages: List[Message] = Field(default_factory=list, max_length=30)
     app_mode: str = Field(default_factory=lambda: os.getenv("APP_MODE", "quota_saver"))
+    # Sessions: send the full history once with use_session to start one, then
+    # only `message` plus the returned session_id. Ids are always minted by
+    # the server; a session_id sent along with `messages` is ignored.
+    use_session: bool = False
+    session_id: Optional[str] = Field(default=None, max_length=64)
+    message: Optional[Message] = None
+    # Overrides the mode's CHAT_DEADLINE_MS_<MODE> time budget for this turn.
+    deadline_ms: Optional[int] = Field(default=None, ge=MIN_DEADLINE_MS, le=MAX_DEADLINE_MS)
 
 class ChatResponse(BaseModel):
     model_config = ConfigDict(protected_namespaces=())
@@ -36,51 +57,274 @@ class ChatResponse(BaseModel):
     candidate_models: List[str] = Field(default_factory=list)
     hops_used: int = 0
     history_sig: Optional[str] = None
+    cached: bool = False
+    coalesced: bool = False
+    context_tokens: Optional[Dict[str, int]] = None
+    session_id: Optional[str] = None
+    deadline_ms: Optional[int] = None
+    deadline_exceeded: bool = False
+    truncated: bool = False
+    timings: Optional[List[Dict[str, Any]]] = None
 
 class TranscribeResponse(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
     text: str
     used_model: Optional[str] = None
+    bytes_saved: int = 0
+    # cached: answered from the transcript cache; coalesced: joined an identical upload already in flight.
+    cached: bool = False
+    coalesced: bool = False
+
+@asynccontextmanager
+async def _lifespan(_: FastAPI) -> AsyncIterator[None]:
+    yield
+    # Release pooled provider connections while the serving loop is still alive.
+    await close_loop_clients()
+
 
-app = FastAPI(title="Talk to Ansuk API", version="0.2.0")
+app = FastAPI(title="Talk to Ansuk API", version="0.2.0", lifespan=_lifespan)
 
 # Setup CORS for local testing
 cors_origins = os.getenv("CORS_ORIGINS", "http://localhost:3000")
 origins = [origin.strip() for origin in cors_origins.split(",") if origin.strip()]
 
+class ServerTimingMiddleware:
+    """Trace selected routes and attach the spans as a Server-Timing header.
+
+    Plain ASGI rather than BaseHTTPMiddleware, so the trace context variable is
+    set in the same task that runs the endpoint.
+    """
+
+    def __init__(self, app: Any, paths: List[str]):
+        self.app = app
+        self.paths = set(paths)
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        trace = metrics.start_trace()
+
+        async def send_with_timing(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", metrics.server_timing(trace))
+                headers.append("Timing-Allow-Origin", ", ".join(origins) or "*")
+            await send(message)
+
+        await self.app(scope, receive, send_with_timing)
+
+class AdmissionMiddleware:
+    """Run each limited route under its AdmissionController, shedding with 429/503 + Retry-After.
+
+    The slot is held until the response body has been sent, so a stream keeps
+    its slot for as long as it is generating.
+    """
+
+    def __init__(self, app: Any, limits: Dict[str, AdmissionController]):
+        self.app = app
+        self.limits = limits
+
+    @staticmethod
+    def _client(scope: Dict[str, Any]) -> str:
+        if TRUST_FORWARDED:
+            for name, value in scope.get("headers", []):
+                if name == b"x-forwarded-for":
+                    return value.decode("latin-1").split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        controller = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if controller is None or scope.get("method") == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        try:
+            async with controller.slot(self._client(scope)) as waited:
+                metrics.record_span("queue", waited)
+                await self.app(scope, receive, send)
+        except Rejected as exc:
+            # Only slot() raises Rejected, so nothing has been sent yet.
+            response = JSONResponse({"detail": exc.detail}, status_code=exc.status_code, headers={"Retry-After": str(exc.retry_after)})
+            await response(scope, receive, send)
+
+chat_admission = controller_from_env("chat", "CHAT", max_concurrent=16, max_queue=64, max_wait_ms=5000)
+transcribe_admission = controller_from_env("transcribe", "TRANSCRIBE", max_concurrent=4, max_queue=16, max_wait_ms=8000)
+app.add_middleware(
+    AdmissionMiddleware,
+    limits={"/api/chat": chat_admission, "/api/chat/stream": chat_admission, "/api/transcribe": transcribe_admission},
+)
+app.add_middleware(ServerTimingMiddleware, paths=["/api/chat", "/api/transcribe"])
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "Retry-After"],
 )
 
 @app.get("/healthz")
 def healthz() -> Dict[str, bool]:
     return {"ok": True}
 
-@app.post("/api/chat", response_model=ChatResponse)
-def api_chat(payload: ChatRequest) -> Dict[str, Any]:
-    usable_messages = [m for m in payload.messages if m.content.strip()]
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint() -> PlainTextResponse:
+    """Prometheus text exposition of this worker's latency histograms and counters."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+async def _chat_history(payload: ChatRequest) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Return (messages to answer, session id to record the turn under, if any).
+
+    A delta request (session_id + message) is answered from the stored
+    history; if that session is gone the client gets 409 and resends the
+    full history, which starts a new session. A full-history request never
+    writes under a client-chosen id, so nobody can replace a history they
+    did not create.
+    """
+    if payload.message is not None:
+        if not payload.session_id:
+            raise HTTPException(status_code=400, detail="`message` needs a session_id; send `messages` to start a conversation.")
+        if payload.message.role != "user" or not payload.message.content.strip():
+            raise HTTPException(status_code=400, detail="`message` must be a non-empty user message.")
+        stored = await session_store.offload(session_store.get, payload.session_id)
+        metrics.SESSION_LOOKUPS.inc(result="miss" if stored is None else "hit")
+        if stored is None:
+            raise HTTPException(status_code=409, detail="Session expired. Resend the full conversation in `messages`.")
+        return stored + [{"role": "user", "content": payload.message.content}], payload.session_id
+
+    usable_messages = [m.model_dump() for m in payload.messages if m.content.strip()]
     if not usable_messages:
         raise HTTPException(status_code=400, detail="At least one non-empty message is required.")
+    if payload.session_id or payload.use_session:
+        return usable_messages, new_session_id()
+    return usable_messages, None
+
+async def _record_turn(session_id: Optional[str], history: List[Dict[str, Any]], reply: str) -> None:
+    if session_id:
+        await session_store.offload(session_store.put, session_id, history + [{"role": "assistant", "content": reply}])
+
+async def _until_disconnected(request: Request) -> None:
+    # The body has already been read, so the next message is the disconnect.
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+async def _unless_disconnected(request: Request, work: Awaitable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Await `work`, cancelling it (and any continuation hops it has left) if the client goes away first.
+
+    A generation shared with other requests keeps running for them.
+    """
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(_until_disconnected(request))
+    try:
+        done, _ = await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+    if task not in done:
+        await asyncio.gather(task, return_exceptions=True)
+        metrics.CHAT_CANCELLED.inc(route="chat")
+        # Nobody is listening; nginx's "client closed request" status, for the logs.
+        raise HTTPException(status_code=499, detail="Client disconnected.")
+    return task.result()
+
+@app.post("/api/chat", response_model=ChatResponse)
+async def api_chat(payload: ChatRequest, request: Request) -> Dict[str, Any]:
+    history, session_id = await _chat_history(payload)
+    metrics.record_since_start("parse")
     try:
         # This now calls gemini.py
-        return chat_reply([m.model_dump() for m in usable_messages], payload.app_mode)
+        result = await _unless_disconnected(request, chat_reply_async(history, payload.app_mode, payload.deadline_ms))
+    except HTTPException:
+        raise
+    except DeadlineExceeded as exc:
+        raise HTTPException(status_code=504, detail=f"No answer within the time budget: {exc}")
     except RuntimeError as exc:
         raise HTTPException(status_code=500, detail=str(exc))
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Chat failed: {str(exc)}")
+    if session_id:
+        await _record_turn(session_id, history, result["reply"])
+        result = dict(result, session_id=session_id)
+    if DEBUG_TIMINGS:
+        result = dict(result, timings=metrics.trace_entries(metrics.current_trace()))
+    return result
+
+async def _sse(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    """Frame provider events as Server-Sent Events: `event: <type>` + JSON data.
+
+    If the client disconnects, the response is cancelled or closed mid-stream;
+    `events` is closed with it, which stops the generation and its remaining
+    hops unless another request is following the same one.
+    """
+    finished = False
+    try:
+        async for event in events:
+            yield f"event: {event.get('type', 'message')}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finished = True
+    except Exception as exc:
+        finished = True
+        error = {"type": "error", "detail": f"Chat failed: {str(exc)}"}
+        yield f"event: error\ndata: {json.dumps(error, ensure_ascii=False)}\n\n"
+    finally:
+        if not finished:
+            metrics.CHAT_CANCELLED.inc(route="stream")
+            close = getattr(events, "aclose", None)
+            if close is not None:
+                await close()
 
-@app.post("/api/transcribe", response_model=TranscribeResponse)
-async def api_transcribe(file: UploadFile = File(...)) -> Dict[str, Any]:
-    audio_bytes = await file.read()
+@app.post("/api/chat/stream")
+async def api_chat_stream(payload: ChatRequest) -> StreamingResponse:
+    """Stream the reply as `delta` events; the final `done` event carries the ChatResponse fields."""
+    history, session_id = await _chat_history(payload)
+    try:
+        events = chat_reply_stream(history, payload.app_mode, payload.deadline_ms)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=500, detail=str(exc))
+
+    async def with_session(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        try:
+            async for event in events:
+                if event.get("type") == "done":
+                    await _record_turn(session_id, history, event["reply"])
+                    event = dict(event, session_id=session_id)
+                yield event
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        _sse(with_session(events) if session_id else events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+_AUDIO_UPLOAD_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "properties": {"file": {"type": "string", "format": "binary"}},
+            "required": ["file"],
+        }}},
+    }
+}
+
+@app.post("/api/transcribe", response_model=TranscribeResponse, openapi_extra=_AUDIO_UPLOAD_SCHEMA)
+async def api_transcribe(request: Request) -> Dict[str, Any]:
+    """Transcribe a multipart `file` upload, read incrementally and capped at MAX_AUDIO_BYTES."""
+    metrics.record_since_start("parse")
+    try:
+        with metrics.span("read"):
+            audio_bytes, content_type = await read_audio_upload(request, MAX_AUDIO_BYTES)
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail="Audio upload is too large.")
+    except UploadError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
     if not audio_bytes:
         raise HTTPException(status_code=400, detail="Empty audio upload.")
-    if len(audio_bytes) > MAX_AUDIO_BYTES:
-        raise HTTPException(status_code=413, detail="Audio upload is too large.")
     try:
         # This now calls gemini.py
-        return transcribe(audio_bytes, declared_mime=file.content_type)
+        return await transcribe_async(audio_bytes, declared_mime=content_type)
     except RuntimeError as exc:
         raise HTTPException(status_code=500, detail=str(exc))
\ No newline at end of file
@@ -0,0 +1,270 @@
+"""In-process metrics rendered in the Prometheus text format.
+
+No client library or collector is needed: counters, gauges and histograms live in
+plain dicts and /metrics renders them on demand. Each series is updated under
+a per-metric lock held only for a few additions, which keeps recording cheap
+enough to leave on in production. Values are per worker process; scrape each
+worker (or run one) to aggregate.
+
+The same module keeps a per-request trace: a list of named spans held in a
+context variable, which main.py turns into a Server-Timing header.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    )
+    return "{" + body + "}"
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: object) -> float:
+        with self._lock:
+            return self._values.get(_label_key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(key)} {_format_number(value)}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels: object) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def value(self, **labels: object) -> float:
+        with self._lock:
+            return self._values.get(_label_key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(key)} {_format_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelKey, List[float]] = {}  # per-bucket counts + [sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = _label_key(labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            if slot < len(self.buckets):
+                series[slot] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels: object) -> int:
+        with self._lock:
+            series = self._series.get(_label_key(labels))
+            return int(series[-1]) if series else 0
+
+    @contextmanager
+    def time(self, **labels: object) -> Iterator[Dict[str, object]]:
+        """Time a block. The yielded dict can add or change labels before it exits."""
+        extra: Dict[str, object] = {}
+        started = time.perf_counter()
+        try:
+            yield extra
+        finally:
+            self.observe(time.perf_counter() - started, **{**labels, **extra})
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', _format_number(bound)),))} {_format_number(cumulative)}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, (('le', '+Inf'),))} {_format_number(series[-1])}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_number(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {_format_number(series[-1])}")
+        return lines
+
+
+RETRIEVAL_SECONDS = Histogram("chat_retrieval_seconds", "Time spent selecting profile facts blocks.")
+PROVIDER_ATTEMPT_SECONDS = Histogram(
+    "chat_provider_attempt_seconds", "Duration of each upstream model attempt (chat or transcription) by model, key suffix and outcome."
+)
+CONTINUATION_HOP_SECONDS = Histogram("chat_continuation_hop_seconds", "Duration of each continuation hop.")
+TRANSCRIBE_SECONDS = Histogram("transcribe_seconds", "End-to-end transcription time by outcome.")
+CACHE_LOOKUPS = Counter("chat_cache_lookups_total", "Response cache lookups by result (hit, miss or shared in-flight generation).")
+RATE_LIMITED = Counter("provider_rate_limited_total", "Upstream attempts rejected with a 429 or quota error.")
+FALLBACKS = Counter("provider_fallbacks_total", "Failed upstream attempts that moved on to another key or model.")
+AUDIO_BYTES_SAVED = Counter("transcribe_audio_bytes_saved_total", "Upload bytes removed by silence trimming and resampling.")
+HEDGES = Counter("provider_hedges_total", "Backup attempts launched because an attempt was slow.")
+TRANSCRIBE_CACHE_LOOKUPS = Counter(
+    "transcribe_cache_lookups_total", "Transcript cache lookups by result (hit, miss or shared in-flight call)."
+)
+CHAINED_REQUESTS = Counter(
+    "provider_chained_requests_total",
+    "Requests sent as a delta on a stored previous response, by kind (hop, turn) and result (chained, or fallback to resending the text).",
+)
+CHAINED_INPUT_CHARS_SAVED = Counter("provider_chained_input_chars_saved_total", "Input characters not resent because a request was chained.")
+CHAT_CANCELLED = Counter(
+    "chat_cancelled_total", "Chat requests whose client disconnected before the answer was complete, by route (chat, stream)."
+)
+SESSION_LOOKUPS = Counter("chat_session_lookups_total", "Delta chat requests by whether their session was found (hit) or had expired (miss).")
+ADMISSION_IN_FLIGHT = Gauge("admission_in_flight", "Requests currently holding an admission slot, by route group.")
+ADMISSION_QUEUE_DEPTH = Gauge("admission_queue_depth", "Requests waiting for an admission slot, by route group.")
+ADMISSION_WAIT_SECONDS = Histogram("admission_wait_seconds", "Time admitted requests spent queued before running.")
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total", "Requests shed before running, by route group and reason (client_share, queue_full, deadline, timeout)."
+)
+
+REGISTRY = (
+    RETRIEVAL_SECONDS,
+    PROVIDER_ATTEMPT_SECONDS,
+    CONTINUATION_HOP_SECONDS,
+    TRANSCRIBE_SECONDS,
+    CACHE_LOOKUPS,
+    RATE_LIMITED,
+    FALLBACKS,
+    HEDGES,
+    AUDIO_BYTES_SAVED,
+    TRANSCRIBE_CACHE_LOOKUPS,
+    SESSION_LOOKUPS,
+    CHAT_CANCELLED,
+    CHAINED_REQUESTS,
+    CHAINED_INPUT_CHARS_SAVED,
+    ADMISSION_IN_FLIGHT,
+    ADMISSION_QUEUE_DEPTH,
+    ADMISSION_WAIT_SECONDS,
+    ADMISSION_REJECTED,
+)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# -- per-request traces ------------------------------------------------------
+
+_trace: ContextVar[Optional[Dict[str, Any]]] = ContextVar("request_trace", default=None)
+
+
+def start_trace() -> Dict[str, Any]:
+    """Begin collecting spans for the current request (and tasks it spawns)."""
+    trace = {"started": time.perf_counter(), "spans": []}
+    _trace.set(trace)
+    return trace
+
+
+def current_trace() -> Dict[str, Any]:
+    return _trace.get() or {"started": time.perf_counter(), "spans": []}
+
+
+def record_span(name: str, seconds: float, desc: str = "") -> None:
+    """Add a span to the current request's trace; a no-op outside a traced request."""
+    trace = _trace.get()
+    if trace is not None:
+        trace["spans"].append((name, seconds, desc))
+
+
+def record_since_start(name: str) -> None:
+    """Record a span covering everything since the trace started (e.g. body parsing)."""
+    trace = _trace.get()
+    if trace is not None:
+        record_span(name, time.perf_counter() - trace["started"])
+
+
+@contextmanager
+def span(name: str, desc: str = "") -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - started, desc)
+
+
+def trace_entries(trace: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Spans as dicts. Repeated names (attempts, hops) are numbered attempt-1, attempt-2, ..."""
+    totals: Dict[str, int] = {}
+    for name, _, _ in trace["spans"]:
+        totals[name] = totals.get(name, 0) + 1
+    seen: Dict[str, int] = {}
+    entries = []
+    for name, seconds, desc in trace["spans"]:
+        if totals[name] > 1:
+            seen[name] = seen.get(name, 0) + 1
+            name = f"{name}-{seen[name]}"
+        entry: Dict[str, Any] = {"name": name, "ms": round(seconds * 1000.0, 1)}
+        if desc:
+            entry["desc"] = desc
+        entries.append(entry)
+    return entries
+
+
+def server_timing(trace: Dict[str, Any]) -> str:
+    parts = []
+    for entry in trace_entries(trace) + [{"name": "total", "ms": round((time.perf_counter() - trace["started"]) * 1000.0, 1)}]:
+        part = entry["name"]
+        if entry.get("desc"):
+            part += ';desc="{}"'.format(entry["desc"].replace("\\", "").replace('"', "'"))
+        parts.append(f"{part};dur={entry['ms']}")
+    return ", ".join(parts)
@@ -1,10 +1,56 @@
+import asyncio
 import hashlib
 import io
 import os
-from typing import Any, Dict, List, Optional, Tuple
-
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from .audio import prepare_audio
+from .cache import (
+    TTLCache,
+    chat_cache_key,
+    chat_flights,
+    response_cache,
+    stream_flights,
+    transcribe_cache,
+    transcribe_cache_key,
+    transcribe_flights,
+)
+from .clients import get_openai_client, retain_keys, run_closing
+from .deadlines import Deadline, DeadlineExceeded, deadline_for
+from .lengths import answer_cap
+from .metrics import (
+    AUDIO_BYTES_SAVED,
+    CACHE_LOOKUPS,
+    CHAINED_INPUT_CHARS_SAVED,
+    CHAINED_REQUESTS,
+    CONTINUATION_HOP_SECONDS,
+    FALLBACKS,
+    PROVIDER_ATTEMPT_SECONDS,
+    RATE_LIMITED,
+    RETRIEVAL_SECONDS,
+    TRANSCRIBE_CACHE_LOOKUPS,
+    TRANSCRIBE_SECONDS,
+    record_span,
+    span,
+)
+from .packing import input_budget, pack_prompt
 from .prompts import SYSTEM_PROMPT_BASE
-from .retrieval import build_profile_context
+from .retrieval import profile_blocks
+
+
+# Continuation hops, and optionally consecutive turns of one conversation, are
+# chained to the stored previous response with previous_response_id, so only
+# the new input goes over the wire. When the stored state is unavailable the
+# request is resent as text, exactly as without chaining.
+CHAIN_CONTINUATIONS = os.getenv("OPENAI_CHAIN_CONTINUATIONS", "1").strip().lower() in ("1", "true", "yes")
+CHAIN_TURNS = os.getenv("OPENAI_CHAIN_TURNS", "").strip().lower() in ("1", "true", "yes")
+# A turn chain keeps every earlier turn in the model's context, so start over
+# from the packed transcript after this many turns.
+CHAIN_MAX_TURNS = int(os.getenv("OPENAI_CHAIN_MAX_TURNS", "6"))
+CHAINED_CONTINUE_INPUT = "Continue exactly from where you stopped. Do not repeat earlier text."
+# conversation digest -> {"id": response id that ended the turn, "depth": turns chained}
+_turn_chains = TTLCache(max_bytes=256 * 1024, ttl_seconds=float(os.getenv("OPENAI_CHAIN_TTL_SECONDS", "3600")))
 
 
 def _comma_env(name: str) -> List[str]:
@@ -100,6 +146,20 @@ def needs_continue(text: str) -> bool:
     return False
 
 
+def _hit_output_cap(response: Any, text: str) -> bool:
+    """Whether a reply stopped at max_output_tokens and needs a continuation hop.
+
+    The response status decides whenever there is one; the text heuristic is
+    only a fallback for responses without it.
+    """
+    status = getattr(response, "status", None)
+    if status == "incomplete":
+        return getattr(getattr(response, "incomplete_details", None), "reason", None) == "max_output_tokens"
+    if status is not None:
+        return False
+    return needs_continue(text)
+
+
 def strip_continue_token(text: str) -> str:
     text = (text or "").strip()
     if text.endswith("[CONTINUE]"):
@@ -122,56 +182,225 @@ def _response_text(response: Any) -> str:
     return "".join(chunks).strip()
 
 
-def _generate_with_fallback(client: Any, model_candidates: List[str], instructions: str, input_text: str, max_output_tokens: int):
+def _is_rate_limit_error(exc: BaseException) -> bool:
+    if getattr(exc, "status_code", None) == 429:
+        return True
+    text = str(exc).upper()
+    return any(token in text for token in ["429", "RATE LIMIT", "RATE_LIMIT", "INSUFFICIENT_QUOTA"])
+
+
+def _is_missing_state_error(exc: BaseException) -> bool:
+    """A previous_response_id the API no longer (or never) had; retrying cannot help."""
+    return "previous_response" in str(exc).lower()
+
+
+def _observe_attempt(client: Any, model: str, started: float, outcome: str) -> None:
+    seconds = time.perf_counter() - started
+    key_suffix = (getattr(client, "api_key", "") or "")[-4:]
+    PROVIDER_ATTEMPT_SECONDS.observe(seconds, provider="openai", model=model, key=key_suffix, outcome=outcome)
+    record_span("attempt", seconds, f"{model} ...{key_suffix} {outcome}")
+
+
+def _record_failure(client: Any, model: str, exc: BaseException, started: float, more_left: bool) -> bool:
+    """Record a failed attempt; True if it was transient (a 429 or a timeout) and worth backing off."""
+    rate_limited = _is_rate_limit_error(exc)
+    timed_out = isinstance(exc, DeadlineExceeded)
+    _observe_attempt(client, model, started, "rate_limited" if rate_limited else "timeout" if timed_out else "error")
+    if rate_limited:
+        RATE_LIMITED.inc(provider="openai", model=model)
+    if more_left:
+        FALLBACKS.inc(provider="openai")
+    return rate_limited or timed_out
+
+
+def _bounded(call: Any, deadline: Optional[Deadline], model: str) -> Any:
+    return deadline.run(call, model) if deadline is not None else call
+
+
+def _exhausted(last_errors: List[str], failures: int, timeouts: int, deadline: Optional[Deadline]) -> RuntimeError:
+    """The error once every candidate failed: DeadlineExceeded if timeouts or the spent budget did it."""
+    message = last_errors[-1] if last_errors else "All OpenAI models failed"
+    if timeouts and (timeouts == failures or (deadline is not None and deadline.expired())):
+        return DeadlineExceeded(message)
+    return RuntimeError(message)
+
+
+async def _wait_turn(deadline: Optional[Deadline], transient_failures: int, last_errors: List[str]) -> None:
+    """Back off after transient failures; raise DeadlineExceeded if the next model should not start."""
+    if deadline is None:
+        return
+    if (transient_failures and not await deadline.backoff(transient_failures)) or not deadline.can_start():
+        raise DeadlineExceeded(" | ".join(last_errors[-3:] + ["deadline reached before another attempt could start"]))
+
+
+async def _generate_with_fallback(
+    client: Any,
+    model_candidates: List[str],
+    instructions: str,
+    input_text: str,
+    max_output_tokens: int,
+    deadline: Optional[Deadline] = None,
+    extra: Optional[Dict[str, Any]] = None,
+):
+    extra = extra or {}
     last_errors: List[str] = []
     last_tried = None
-    for model in model_candidates:
+    transient_failures = 0
+    failures = 0
+    timeouts = 0
+    for index, model in enumerate(model_candidates):
+        await _wait_turn(deadline, transient_failures, last_errors)
         last_tried = model
+        started = time.perf_counter()
         try:
-            response = client.responses.create(
-                model=model,
-                instructions=instructions,
-                input=input_text,
-                max_output_tokens=max_output_tokens,
-                temperature=0.6,
-            )
-            return response, model, last_tried, last_errors
-        except Exception as exc:
-            # Some models/accounts may reject temperature. Retry once without it.
-            try:
-                response = client.responses.create(
+            response = await _bounded(
+                client.responses.create(
                     model=model,
                     instructions=instructions,
                     input=input_text,
                     max_output_tokens=max_output_tokens,
+                    temperature=0.6,
+                    **extra,
+                ),
+                deadline,
+                model,
+            )
+            _observe_attempt(client, model, started, "ok")
+            return response, model, last_tried, last_errors
+        except Exception as exc:
+            # Some models/accounts may reject temperature. Retry once without it
+            # (a timeout is not a rejected parameter, so it moves straight on).
+            try:
+                if isinstance(exc, DeadlineExceeded) or _is_missing_state_error(exc):
+                    raise exc
+                response = await _bounded(
+                    client.responses.create(
+                        model=model,
+                        instructions=instructions,
+                        input=input_text,
+                        max_output_tokens=max_output_tokens,
+                        **extra,
+                    ),
+                    deadline,
+                    model,
                 )
+                _observe_attempt(client, model, started, "ok")
                 return response, model, last_tried, last_errors
             except Exception as retry_exc:
                 last_errors.append(f"{model}: {repr(retry_exc or exc)}")
+                failures += 1
+                timeouts += isinstance(retry_exc, DeadlineExceeded)
+                if _record_failure(client, model, retry_exc, started, index + 1 < len(model_candidates)):
+                    transient_failures += 1
                 continue
-    raise RuntimeError(last_errors[-1] if last_errors else "All OpenAI models failed")
+    raise _exhausted(last_errors, failures, timeouts, deadline)
+
+
+def _store_args() -> Dict[str, Any]:
+    return {"store": True} if CHAIN_CONTINUATIONS or CHAIN_TURNS else {}
+
+
+def _response_id(response: Any) -> Optional[str]:
+    return getattr(response, "id", None) or None
+
+
+def _conversation_key(mode: str, messages: List[Dict[str, Any]]) -> str:
+    lines = [f"{m.get('role')}: {(m.get('content') or '').strip()}" for m in messages if (m.get("content") or "").strip()]
+    return f"chain:{mode}:" + hashlib.sha1("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+def _turn_chain(mode: str, messages: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """The stored response that ended this conversation's previous turn, if the new turn can chain to it."""
+    if not CHAIN_TURNS or not messages or messages[-1].get("role") != "user":
+        return None
+    link = _turn_chains.get(_conversation_key(mode, messages[:-1]))
+    if link is None or link["depth"] >= CHAIN_MAX_TURNS:
+        return None
+    latest = (messages[-1].get("content") or "").strip()
+    return dict(link, input=f"User: {latest}\n\nReply to this latest user message as Ansuk.")
+
+
+def _remember_turn(chat: Dict[str, Any], reply: str, response_id: Optional[str], depth: int) -> None:
+    if CHAIN_TURNS and response_id:
+        key = _conversation_key(chat["mode"], chat["messages"] + [{"role": "assistant", "content": reply}])
+        _turn_chains.set(key, {"id": response_id, "depth": depth})
 
 
-def chat_reply(messages: List[Dict[str, Any]], app_mode: str = "quota_saver") -> Dict[str, Any]:
+def _count_chained(kind: str, chained: bool, delta_input: str, full_input: str) -> None:
+    CHAINED_REQUESTS.inc(provider="openai", kind=kind, result="chained" if chained else "fallback")
+    if chained:
+        CHAINED_INPUT_CHARS_SAVED.inc(max(len(full_input) - len(delta_input), 0), provider="openai", kind=kind)
+
+
+async def _generate_chained(
+    chat: Dict[str, Any], kind: str, previous_id: Optional[str], delta_input: str, full_input: str, models: List[str]
+):
+    """Generate from `delta_input` chained to `previous_id`, or from `full_input` if that fails.
+
+    The chained request goes to the first of `models` only; any failure there
+    (state expired or never stored, model busy) falls back to the full input
+    across all candidates. Returns (response, model, last tried, errors, chained).
+    """
+    client, deadline = chat["client"], chat["deadline"]
+    notes: List[str] = []
+    if previous_id:
+        try:
+            response, model, last_tried, errors = await _generate_with_fallback(
+                client,
+                models[:1],
+                chat["instructions"],
+                delta_input,
+                chat["max_output_tokens"],
+                deadline,
+                {"previous_response_id": previous_id, **_store_args()},
+            )
+            _count_chained(kind, True, delta_input, full_input)
+            return response, model, last_tried, errors, True
+        except DeadlineExceeded:
+            raise
+        except Exception as exc:
+            _count_chained(kind, False, delta_input, full_input)
+            notes.append(f"{kind} chaining failed; resent as text: {exc}")
+    response, model, last_tried, errors = await _generate_with_fallback(
+        client, chat["candidates"], chat["instructions"], full_input, chat["max_output_tokens"], deadline, _store_args()
+    )
+    return response, model, last_tried, notes + errors, False
+
+
+def _prepare_chat(messages: List[Dict[str, Any]], app_mode: str, deadline_ms: Optional[int] = None) -> Dict[str, Any]:
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise RuntimeError("Missing OPENAI_API_KEY")
 
     try:
-        from openai import OpenAI
-    except Exception as exc:
+        client = get_openai_client(api_key)
+    except ImportError as exc:
         raise RuntimeError("openai is not installed or could not be imported.") from exc
-
-    client = OpenAI(api_key=api_key)
-    candidates, max_output_tokens, max_hops, history_turns = _chat_mode_config(app_mode)
+    retain_keys("openai", [api_key])
+    deadline = deadline_for(app_mode, deadline_ms)
+    candidates, base_output_tokens, max_hops, history_turns = _chat_mode_config(app_mode)
 
     last_user_text = _last_user_text(messages)
-    facts_block = build_profile_context(
-        question_text=last_user_text,
-        k=int(os.getenv("PROFILE_TOP_K", "4")),
-        min_score=float(os.getenv("PROFILE_MIN_SCORE", "0.10")),
-        max_chars=int(os.getenv("PROFILE_MAX_CONTEXT_CHARS", "2800")),
-    )
+    # Size the cap to the question so long answers finish in one generation.
+    max_output_tokens, answer_kind = answer_cap(last_user_text, base_output_tokens)
+    with RETRIEVAL_SECONDS.time(provider="openai"), span("retrieval"):
+        blocks = profile_blocks(
+            question_text=last_user_text,
+            k=int(os.getenv("PROFILE_TOP_K", "4")),
+            min_score=float(os.getenv("PROFILE_MIN_SCORE", "0.10")),
+        )
+
+    with span("history"):
+        packed = pack_prompt(
+            SYSTEM_PROMPT_BASE,
+            blocks,
+            messages,
+            input_budget(app_mode),
+            history_turns,
+            max_facts_chars=int(os.getenv("PROFILE_MAX_CONTEXT_CHARS", "2800")),
+        )
+        facts_block = packed["facts"]
+        transcript = _build_transcript(packed["messages"], len(packed["messages"]))
 
     instructions = SYSTEM_PROMPT_BASE
     if facts_block:
@@ -181,46 +410,422 @@ def chat_reply(messages: List[Dict[str, Any]], app_mode: str = "quota_saver") ->
             + facts_block
         )
 
-    transcript = _build_transcript(messages, history_turns)
-    response, used_model, last_tried, errors = _generate_with_fallback(
-        client, candidates, instructions, transcript, max_output_tokens
+    return {
+        "client": client,
+        "mode": (app_mode or "quota_saver").lower(),
+        "deadline": deadline,
+        "facts": facts_block,
+        "candidates": candidates,
+        "max_output_tokens": max_output_tokens,
+        "answer_kind": answer_kind,
+        "max_hops": max_hops,
+        "instructions": instructions,
+        "transcript": transcript,
+        "context_tokens": packed["tokens"],
+        "messages": [m for m in messages or []],
+        "chain": _turn_chain((app_mode or "quota_saver").lower(), messages or []),
+    }
+
+
+def _continuation_input(previous_input: str, bot_text: str) -> str:
+    return (
+        previous_input
+        + "\n\nAssistant partial answer:\n"
+        + bot_text
+        + "\n\nContinue exactly from where the partial answer stopped. Do not repeat earlier text."
+    )
+
+
+async def chat_reply_async(
+    messages: List[Dict[str, Any]], app_mode: str = "quota_saver", deadline_ms: Optional[int] = None
+) -> Dict[str, Any]:
+    chat = _prepare_chat(messages, app_mode, deadline_ms)
+    cache_key = chat_cache_key("openai", chat["mode"], chat["facts"], chat["transcript"])
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        CACHE_LOOKUPS.inc(provider="openai", result="hit")
+        return dict(cached, cached=True)
+
+    # Identical questions arriving together (same prompt, same key) share one generation.
+    result, shared = await chat_flights.do(cache_key, lambda: _generate_reply(chat, cache_key))
+    CACHE_LOOKUPS.inc(provider="openai", result="shared" if shared else "miss")
+    return dict(result, coalesced=True) if shared else result
+
+
+async def _generate_reply(chat: Dict[str, Any], cache_key: str) -> Dict[str, Any]:
+    max_output_tokens = chat["max_output_tokens"]
+    transcript = chat["transcript"]
+    deadline = chat["deadline"]
+    chain = chat["chain"] or {}
+    response, used_model, last_tried, errors, chained = await _generate_chained(
+        chat, "turn", chain.get("id"), chain.get("input", ""), transcript, chat["candidates"]
     )
-    bot_text = strip_continue_token(_response_text(response)) or "I didn’t catch that fully — can you say it again?"
+    depth = chain["depth"] + 1 if chained else 1
+    previous_id = _response_id(response)
+    first_text = strip_continue_token(_response_text(response))
+    bot_text = first_text or "I didn’t catch that fully — can you say it again?"
+    truncated = _hit_output_cap(response, _response_text(response))
 
     hops_used = 0
+    deadline_hit = False
     continuation_input = transcript
-    for _ in range(max_hops):
-        if not needs_continue(bot_text):
+    # Hop only while the model actually ran into max_output_tokens.
+    for _ in range(chat["max_hops"]):
+        if not truncated:
+            break
+        if not deadline.can_start():
+            deadline_hit = True
             break
         hops_used += 1
-        continuation_input = (
-            continuation_input
-            + "\n\nAssistant partial answer:\n"
-            + bot_text
-            + "\n\nContinue exactly from where the partial answer stopped. Do not repeat earlier text."
-        )
+        continuation_input = _continuation_input(continuation_input, bot_text)
         try:
-            response2, used_model2, last_tried2, errors2 = _generate_with_fallback(
-                client, candidates, instructions, continuation_input, max_output_tokens
-            )
+            with CONTINUATION_HOP_SECONDS.time(provider="openai"), span("hop"):
+                # Chained, the hop sends only "continue"; the partial answer is already stored upstream.
+                response2, used_model2, last_tried2, errors2, _ = await _generate_chained(
+                    chat,
+                    "hop",
+                    previous_id if CHAIN_CONTINUATIONS else None,
+                    CHAINED_CONTINUE_INPUT,
+                    continuation_input,
+                    [used_model],
+                )
+            previous_id = _response_id(response2)
             used_model = used_model2
             last_tried = last_tried2
             errors = errors + errors2
             continuation = strip_continue_token(_response_text(response2))
+            truncated = _hit_output_cap(response2, _response_text(response2))
             if not continuation:
                 break
             bot_text = bot_text.rstrip() + " " + continuation
-        except Exception:
+        except Exception as exc:
+            deadline_hit = isinstance(exc, DeadlineExceeded)
             break
 
-    return {
+    result = {
         "reply": bot_text,
         "used_model": used_model,
         "last_tried_model": last_tried,
         "model_errors": errors[-8:],
         "hops_used": hops_used,
+        "mode_detail": f"{chat['mode']}; max_output_tokens={max_output_tokens} ({chat['answer_kind']} answer)",
         "history_sig": hashlib.sha1(transcript.encode("utf-8")).hexdigest(),
+        "context_tokens": chat["context_tokens"],
+        "deadline_ms": int(deadline.budget * 1000),
+        "deadline_exceeded": deadline_hit,
+        "truncated": truncated,
     }
+    # A reply cut short by the deadline is not cached; the next ask may finish it.
+    if first_text and not deadline_hit:
+        response_cache.set(cache_key, result)
+    if first_text:
+        _remember_turn(chat, bot_text, previous_id, depth)
+    return result
+
+
+def chat_reply(messages: List[Dict[str, Any]], app_mode: str = "quota_saver", deadline_ms: Optional[int] = None) -> Dict[str, Any]:
+    """Blocking wrapper around chat_reply_async; not for use inside an event loop."""
+    return run_closing(chat_reply_async(messages, app_mode, deadline_ms))
+
+
+def _split_streamable(buffer: str) -> Tuple[str, str]:
+    """Split buffered text into (safe to emit, held back) so a trailing
+    [CONTINUE] token never reaches the client."""
+    cut = len(buffer)
+    start = buffer.rfind("[")
+    if start != -1 and "[CONTINUE]".startswith(buffer[start:].rstrip()):
+        cut = start
+    # Trailing whitespace is held too, so it is not emitted ahead of a dropped token.
+    cut = len(buffer[:cut].rstrip())
+    return buffer[:cut], buffer[cut:]
+
+
+async def _close_stream(stream: Any) -> None:
+    close = getattr(stream, "close", None)
+    if close is not None:
+        try:
+            await close()
+        except Exception:
+            pass
+
+
+async def _stream_with_fallback(
+    client: Any,
+    model_candidates: List[str],
+    instructions: str,
+    input_text: str,
+    max_output_tokens: int,
+    outcome: Dict[str, Any],
+    deadline: Optional[Deadline] = None,
+    extra: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[str]:
+    """Stream output_text deltas from the Responses API.
+
+    Models are tried in order until one produces its first event; after that a
+    failure ends the stream instead of switching models mid-answer. The used
+    model, last tried model, errors and the final response (from the
+    completed/incomplete event) are written into `outcome`, plus
+    deadline_exceeded if the deadline cut the stream short.
+    """
+    last_errors: List[str] = []
+    last_tried = None
+    transient_failures = 0
+    failures = 0
+    timeouts = 0
+
+    async def open_stream(model: str, **params: Any) -> Tuple[Any, Any]:
+        stream = await client.responses.create(
+            model=model,
+            instructions=instructions,
+            input=input_text,
+            max_output_tokens=max_output_tokens,
+            stream=True,
+            **params,
+            **(extra or {}),
+        )
+        try:
+            return stream, await stream.__anext__()
+        except StopAsyncIteration:
+            return stream, None
+
+    for index, model in enumerate(model_candidates):
+        await _wait_turn(deadline, transient_failures, last_errors)
+        last_tried = model
+        started = time.perf_counter()
+        try:
+            stream, event = await _bounded(open_stream(model, temperature=0.6), deadline, model)
+        except Exception as exc:
+            # Some models/accounts may reject temperature. Retry once without it.
+            try:
+                if isinstance(exc, DeadlineExceeded) or _is_missing_state_error(exc):
+                    raise exc
+                stream, event = await _bounded(open_stream(model), deadline, model)
+            except Exception as retry_exc:
+                last_errors.append(f"{model}: {repr(retry_exc or exc)}")
+                failures += 1
+                timeouts += isinstance(retry_exc, DeadlineExceeded)
+                if _record_failure(client, model, retry_exc, started, index + 1 < len(model_candidates)):
+                    transient_failures += 1
+                continue
+        _observe_attempt(client, model, started, "ok")
+
+        cut_short = False
+        final = None
+        try:
+            while event is not None:
+                event_type = getattr(event, "type", "")
+                if event_type == "response.output_text.delta":
+                    delta = getattr(event, "delta", "") or ""
+                    if delta:
+                        yield delta
+                elif event_type in ("response.completed", "response.incomplete"):
+                    final = getattr(event, "response", None)
+                elif event_type in ("error", "response.failed"):
+                    last_errors.append(f"{model}: stream {event_type}")
+                    break
+                try:
+                    if deadline is None:
+                        event = await stream.__anext__()
+                    else:
+                        event = await asyncio.wait_for(stream.__anext__(), deadline.remaining())
+                except StopAsyncIteration:
+                    event = None
+        except asyncio.TimeoutError:
+            cut_short = True
+            last_errors.append(f"{model}: deadline reached mid-stream")
+            await _close_stream(stream)
+        except Exception as exc:
+            last_errors.append(f"{model}: stream interrupted: {repr(exc)}")
+        except BaseException:
+            # Cancelled or closed early (the client went away): release the upstream stream.
+            await _close_stream(stream)
+            raise
+        outcome.update(used=model, last_tried=last_tried, errors=last_errors, final=final, deadline_exceeded=cut_short)
+        return
+    raise _exhausted(last_errors, failures, timeouts, deadline)
+
+
+async def _stream_chained(
+    chat: Dict[str, Any],
+    kind: str,
+    previous_id: Optional[str],
+    delta_input: str,
+    full_input: str,
+    models: List[str],
+    outcome: Dict[str, Any],
+) -> AsyncIterator[str]:
+    """Streaming counterpart of _generate_chained; sets outcome["chained"].
+
+    _stream_with_fallback only raises before its first chunk, so falling back
+    never repeats text that was already streamed.
+    """
+    client, deadline = chat["client"], chat["deadline"]
+    notes: List[str] = []
+    if previous_id:
+        try:
+            async for piece in _stream_with_fallback(
+                client,
+                models[:1],
+                chat["instructions"],
+                delta_input,
+                chat["max_output_tokens"],
+                outcome,
+                deadline,
+                {"previous_response_id": previous_id, **_store_args()},
+            ):
+                yield piece
+            _count_chained(kind, True, delta_input, full_input)
+            outcome["chained"] = True
+            return
+        except DeadlineExceeded:
+            raise
+        except Exception as exc:
+            _count_chained(kind, False, delta_input, full_input)
+            notes.append(f"{kind} chaining failed; resent as text: {exc}")
+    async for piece in _stream_with_fallback(
+        client, chat["candidates"], chat["instructions"], full_input, chat["max_output_tokens"], outcome, deadline, _store_args()
+    ):
+        yield piece
+    outcome["errors"] = notes + (outcome.get("errors") or [])
+    outcome["chained"] = False
+
+
+def chat_reply_stream(
+    messages: List[Dict[str, Any]], app_mode: str = "quota_saver", deadline_ms: Optional[int] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """Streaming variant of chat_reply: delta events, then a done event with metadata."""
+    chat = _prepare_chat(messages, app_mode, deadline_ms)
+    deadline = chat["deadline"]
+    max_output_tokens = chat["max_output_tokens"]
+    transcript = chat["transcript"]
+    cache_key = chat_cache_key("openai", chat["mode"], chat["facts"], transcript)
+
+    async def events() -> AsyncIterator[Dict[str, Any]]:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            CACHE_LOOKUPS.inc(provider="openai", result="hit")
+            yield {"type": "delta", "text": cached["reply"]}
+            yield dict(cached, type="done", cached=True)
+            return
+
+        # Concurrent identical streams follow one generation; late joiners replay it from the start.
+        first = True
+        async for event, shared in stream_flights.stream(cache_key, generate):
+            if first:
+                CACHE_LOOKUPS.inc(provider="openai", result="shared" if shared else "miss")
+                first = False
+            yield dict(event, coalesced=True) if shared and event["type"] == "done" else event
+
+    async def generate() -> AsyncIterator[Dict[str, Any]]:
+        bot_text = ""
+        continuation_input = transcript
+        used_model = last_tried = None
+        errors: List[str] = []
+        hops_used = 0
+        deadline_hit = False
+        truncated = False
+        chain = chat["chain"] or {}
+        previous_id = chain.get("id")
+        depth = 1
+
+        for hop in range(chat["max_hops"] + 1):
+            if hop:
+                # Hop only when the previous stream actually ran into max_output_tokens.
+                if not truncated:
+                    break
+                if not deadline.can_start():
+                    deadline_hit = True
+                    break
+                hops_used += 1
+                continuation_input = _continuation_input(continuation_input, bot_text)
+
+            raw_text = ""
+            emitted = ""
+            held = ""
+            joiner = " " if bot_text else ""
+            outcome: Dict[str, Any] = {}
+            hop_started = time.perf_counter()
+            if hop:
+                # Chained, the hop sends only "continue"; the partial answer is already stored upstream.
+                stream = _stream_chained(
+                    chat,
+                    "hop",
+                    previous_id if CHAIN_CONTINUATIONS else None,
+                    CHAINED_CONTINUE_INPUT,
+                    continuation_input,
+                    [used_model],
+                    outcome,
+                )
+            else:
+                stream = _stream_chained(
+                    chat, "turn", previous_id, chain.get("input", ""), transcript, chat["candidates"], outcome
+                )
+            try:
+                async for piece in stream:
+                    raw_text += piece
+                    ready, held = _split_streamable(held + piece)
+                    if not emitted:
+                        ready = ready.lstrip()
+                        if ready:
+                            ready = joiner + ready
+                    if ready:
+                        emitted += ready
+                        yield {"type": "delta", "text": ready}
+            except Exception as exc:
+                if not hop:
+                    yield {"type": "error", "detail": str(exc)}
+                    return
+                deadline_hit = isinstance(exc, DeadlineExceeded)
+                break
+            if hop:
+                CONTINUATION_HOP_SECONDS.observe(time.perf_counter() - hop_started, provider="openai")
+                record_span("hop", time.perf_counter() - hop_started)
+            used_model, last_tried = outcome.get("used"), outcome.get("last_tried")
+            errors = errors + (outcome.get("errors") or [])
+            deadline_hit = bool(outcome.get("deadline_exceeded"))
+            truncated = _hit_output_cap(outcome.get("final"), raw_text)
+            previous_id = _response_id(outcome.get("final"))
+            if not hop and outcome.get("chained"):
+                depth = chain["depth"] + 1
+
+            tail = held.rstrip()
+            if tail.endswith("[CONTINUE]"):
+                tail = tail[:-len("[CONTINUE]")].rstrip()
+            if tail:
+                if not emitted:
+                    tail = joiner + tail.lstrip()
+                emitted += tail
+                yield {"type": "delta", "text": tail}
+
+            continuation = strip_continue_token(raw_text)
+            if hop and not continuation:
+                break
+            bot_text = (bot_text.rstrip() + " " + continuation) if hop else continuation
+
+        answered = bool(bot_text)
+        if not bot_text:
+            bot_text = "I didn’t catch that fully — can you say it again?"
+            yield {"type": "delta", "text": bot_text}
+        result = {
+            "reply": bot_text,
+            "used_model": used_model,
+            "last_tried_model": last_tried,
+            "model_errors": errors[-8:],
+            "hops_used": hops_used,
+            "mode_detail": f"{chat['mode']}; max_output_tokens={max_output_tokens} ({chat['answer_kind']} answer)",
+            "history_sig": hashlib.sha1(transcript.encode("utf-8")).hexdigest(),
+            "context_tokens": chat["context_tokens"],
+            "deadline_ms": int(deadline.budget * 1000),
+            "deadline_exceeded": deadline_hit,
+            "truncated": truncated,
+        }
+        if answered and not deadline_hit:
+            response_cache.set(cache_key, result)
+        if answered:
+            _remember_turn(chat, bot_text, previous_id, depth)
+        yield dict(result, type="done")
+
+    return events()
 
 
 def _suffix_for_mime(declared_mime: Optional[str]) -> str:
@@ -237,7 +842,31 @@ def _suffix_for_mime(declared_mime: Optional[str]) -> str:
     }.get(mime, ".webm")
 
 
-def transcribe(audio_bytes: bytes, declared_mime: Optional[str] = None) -> Dict[str, Any]:
+async def transcribe_async(audio_bytes: bytes, declared_mime: Optional[str] = None) -> Dict[str, Any]:
+    with TRANSCRIBE_SECONDS.time(provider="openai", outcome="error") as labels:
+        # Retried and double-submitted uploads are byte-identical; answer them
+        # from the cache, or share the upstream call if one is already running.
+        cache_key = transcribe_cache_key("openai", audio_bytes, declared_mime or ("audio/wav" if audio_bytes[:4] == b"RIFF" else None))
+        cached = transcribe_cache.get(cache_key)
+        if cached is not None:
+            TRANSCRIBE_CACHE_LOOKUPS.inc(provider="openai", result="hit")
+            labels["outcome"] = "cached"
+            return dict(cached, cached=True)
+
+        async def fill() -> Dict[str, Any]:
+            # Cached from inside the shared task, so it lands even if the caller who started it went away.
+            fresh = await _transcribe(audio_bytes, declared_mime)
+            if fresh.get("used_model"):
+                transcribe_cache.set(cache_key, fresh)
+            return fresh
+
+        result, shared = await transcribe_flights.do(cache_key, fill)
+        TRANSCRIBE_CACHE_LOOKUPS.inc(provider="openai", result="shared" if shared else "miss")
+        labels["outcome"] = "ok" if result.get("text") else "empty"
+        return dict(result, coalesced=True) if shared else result
+
+
+async def _transcribe(audio_bytes: bytes, declared_mime: Optional[str] = None) -> Dict[str, Any]:
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise RuntimeError("Missing OPENAI_API_KEY")
@@ -246,34 +875,50 @@ def transcribe(audio_bytes: bytes, declared_mime: Optional[str] = None) -> Dict[
         return {"text": "", "used_model": None}
 
     try:
-        from openai import OpenAI
-    except Exception as exc:
+        client = get_openai_client(api_key)
+    except ImportError as exc:
         raise RuntimeError("openai is not installed or could not be imported.") from exc
-
-    client = OpenAI(api_key=api_key)
+    retain_keys("openai", [api_key])
     candidates = _comma_env("OPENAI_TRANSCRIBE_MODEL_CANDIDATES") or [
         os.getenv("OPENAI_TRANSCRIBE_MODEL", "gpt-4o-mini-transcribe").strip() or "gpt-4o-mini-transcribe",
         "gpt-4o-transcribe",
         "whisper-1",
     ]
 
-    suffix = _suffix_for_mime(declared_mime)
+    with span("preprocess"):
+        sniffed = "audio/wav" if audio_bytes[:4] == b"RIFF" else None
+        prepared = await asyncio.to_thread(prepare_audio, audio_bytes, declared_mime or sniffed)
+    AUDIO_BYTES_SAVED.inc(prepared["bytes_saved"], provider="openai")
+    if prepared["silent"]:
+        # Pure silence: nothing to transcribe, so no model call.
+        return {"text": "", "used_model": None, "bytes_saved": prepared["bytes_saved"]}
+    audio_bytes = prepared["audio"]
+
+    suffix = _suffix_for_mime(prepared["mime"])
     prompt = "Transcribe accurately. Preserve spoken wording and punctuation."
 
-    for model in candidates:
+    for index, model in enumerate(candidates):
+        started = time.perf_counter()
         try:
             audio_file = io.BytesIO(audio_bytes)
             audio_file.name = f"speech{suffix}"
-            transcription = client.audio.transcriptions.create(
+            transcription = await client.audio.transcriptions.create(
                 model=model,
                 file=audio_file,
                 prompt=prompt,
             )
+            _observe_attempt(client, model, started, "ok")
             text = getattr(transcription, "text", transcription)
             text = (text or "").strip().strip('"').strip()
             if text:
-                return {"text": text, "used_model": model}
-        except Exception:
+                return {"text": text, "used_model": model, "bytes_saved": prepared["bytes_saved"]}
+        except Exception as exc:
+            _record_failure(client, model, exc, started, index + 1 < len(candidates))
             continue
 
-    return {"text": "", "used_model": None}
+    return {"text": "", "used_model": None, "bytes_saved": prepared["bytes_saved"]}
+
+
+def transcribe(audio_bytes: bytes, declared_mime: Optional[str] = None) -> Dict[str, Any]:
+    """Blocking wrapper around transcribe_async; not for use inside an event loop."""
+    return run_closing(transcribe_async(audio_bytes, declared_mime))
@@ -0,0 +1,115 @@
+"""Token-budgeted packing of the chat prompt.
+
+Input tokens cost quota and prefill time, so each mode gets an input budget
+(CHAT_INPUT_TOKENS_<MODE>) and pack_prompt() fills it in priority order:
+
+  1. the system prompt and the newest user message (always sent),
+  2. pinned facts blocks,
+  3. topical facts blocks, best score first,
+  4. earlier history, newest first.
+
+Blocks and messages are kept or dropped whole. History stops at the first
+message that does not fit, so what is sent is always a contiguous tail of
+the conversation, starting at a user turn. Token counts are a chars/4
+estimate, the same heuristic the key scheduler charges.
+"""
+
+import math
+import os
+from typing import Any, Dict, List, Optional
+
+
+CHARS_PER_TOKEN = 4.0
+# Role label and separators around each history message.
+MESSAGE_OVERHEAD_TOKENS = 4
+DEFAULT_INPUT_BUDGETS = {"quota_saver": 2500, "normal": 4000, "quality": 6000}
+
+
+def estimate_tokens(text: str) -> int:
+    return int(math.ceil(len(text or "") / CHARS_PER_TOKEN))
+
+
+def input_budget(mode: str) -> int:
+    mode = (mode or "quota_saver").lower()
+    default = DEFAULT_INPUT_BUDGETS.get(mode, DEFAULT_INPUT_BUDGETS["quota_saver"])
+    return int(os.getenv(f"CHAT_INPUT_TOKENS_{mode.upper()}", str(default)))
+
+
+def _message_tokens(message: Dict[str, Any]) -> int:
+    return estimate_tokens((message.get("content") or "").strip()) + MESSAGE_OVERHEAD_TOKENS
+
+
+def pack_prompt(
+    system_prompt: str,
+    blocks: List[Dict[str, Any]],
+    messages: List[Dict[str, Any]],
+    budget: int,
+    max_messages: int,
+    max_facts_chars: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Choose the facts blocks and history messages that fit in `budget` tokens.
+
+    `blocks` come from retrieval.profile_blocks() in priority order; the
+    pinned ones go first regardless. At most `max_messages` of the latest
+    messages are considered. Returns {"facts", "messages", "tokens"}, where
+    "facts" is the joined facts text, "messages" the kept messages in
+    chronological order, and "tokens" the estimated size of each section
+    plus how many blocks and messages were dropped.
+    """
+    history = [m for m in messages or [] if (m.get("content") or "").strip()][-max(max_messages, 1):]
+    newest_user = next((i for i in range(len(history) - 1, -1, -1) if history[i].get("role") == "user"), None)
+
+    system_tokens = estimate_tokens(system_prompt)
+    remaining = budget - system_tokens
+    required = _message_tokens(history[newest_user]) if newest_user is not None else 0
+    remaining -= required
+
+    ordered = [b for b in blocks if b.get("pinned")] + [b for b in blocks if not b.get("pinned")]
+    kept_blocks: List[str] = []
+    facts_tokens = 0
+    facts_chars = 0
+    for block in ordered:
+        cost = estimate_tokens(block["text"]) + 1
+        chars = len(block["text"]) + (2 if kept_blocks else 0)
+        if cost > remaining or (max_facts_chars is not None and facts_chars + chars > max_facts_chars):
+            continue
+        kept_blocks.append(block["text"])
+        remaining -= cost
+        facts_tokens += cost
+        facts_chars += chars
+
+    kept = [False] * len(history)
+    if newest_user is not None:
+        kept[newest_user] = True
+    history_tokens = required
+    for i in range(len(history) - 1, -1, -1):
+        if i == newest_user:
+            continue
+        cost = _message_tokens(history[i])
+        if cost > remaining:
+            break
+        kept[i] = True
+        remaining -= cost
+        history_tokens += cost
+
+    # Both providers drop a leading assistant turn, so do not count one.
+    for i in [i for i, keep in enumerate(kept) if keep]:
+        if history[i].get("role") == "user":
+            break
+        kept[i] = False
+        history_tokens -= _message_tokens(history[i])
+
+    packed_messages = [m for m, keep in zip(history, kept) if keep]
+    return {
+        "facts": "\n\n".join(kept_blocks),
+        "messages": packed_messages,
+        "tokens": {
+            "system": system_tokens,
+            "facts": facts_tokens,
+            "history": history_tokens,
+            "total": system_tokens + facts_tokens + history_tokens,
+            "budget": budget,
+            "facts_dropped": len(ordered) - len(kept_blocks),
+            "history_dropped": len(history) - len(packed_messages),
+        },
+    }
@@ -1,14 +1,24 @@
+import heapq
+import itertools
 import json
+import logging
 import math
 import os
 import re
+from collections import Counter
 from functools import lru_cache
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 
+logger = logging.getLogger(__name__)
+
 HERE = os.path.dirname(__file__)
 CHUNKS_PATH = os.path.join(HERE, "profile_chunks.json")
 INDEX_PATH = os.path.join(HERE, "profile_index.json")
+# Binary index written by scripts/build_profile_index.py: a .npy matrix of
+# pre-normalized rows plus a JSON sidecar with ids, titles, model and dimension.
+INDEX_VECTORS_PATH = os.path.join(HERE, "profile_index.npy")
+INDEX_META_PATH = os.path.join(HERE, "profile_index.meta.json")
 
 _STOPWORDS = {
     "a", "an", "and", "are", "as", "at", "be", "but", "by", "can", "do", "does",
@@ -79,6 +89,18 @@ _QUERY_EXPANSIONS = {
     "life": ["story", "identity", "education", "nokia", "thesis", "hermis"],
 }
 
+# Multi-word project/entity names that earn a bonus when both the question and
+# the chunk contain them verbatim.
+_IMPORTANT_PHRASES = (
+    "nokia standards", "internship outcome", "site based fine tuning", "dueling double dqn", "prioritized experience replay",
+    "action masking", "sparse online portfolio learning", "sparse switching",
+    "windowed ftrl", "projected gradient descent", "cardinality constrained simplex",
+    "hermis", "inter iit", "student placement representative", "dr samrat mukhopadhyay",
+    "100x", "ai agent", "ai agents", "voice bot", "voicebot", "ai twin", "stage 1 assessment",
+    "basic memory stack", "chat history", "local storage", "localstorage", "production ready",
+    "customer-facing conversational improvements", "weekly releases", "sales playbook", "operational role",
+)
+
 _PINNED_IDS = ("identity", "current_status_education", "answer_policy")
 _DEFAULT_CONTEXT_IDS = ("nokia_internship", "thesis_overview", "hermis_project")
 
@@ -113,13 +135,78 @@ def load_index() -> Optional[Dict[str, Any]]:
 
     The chat runtime does not depend on this file. It is retained only so older
     local tooling does not break if it imports load_index().
+
+    The binary artifact is preferred: its matrix is memory-mapped read-only, so
+    uvicorn workers share the same pages and nothing is parsed at startup. The
+    JSON file remains the fallback, also when numpy is missing or the binary
+    artifact is corrupt or does not match its sidecar.
     """
+    if os.path.exists(INDEX_VECTORS_PATH) and os.path.exists(INDEX_META_PATH):
+        try:
+            return _load_binary_index(INDEX_VECTORS_PATH, INDEX_META_PATH)
+        except (ImportError, ValueError, OSError, EOFError) as exc:
+            logger.warning("Binary profile index unusable, falling back to %s: %s", INDEX_PATH, exc)
     if not os.path.exists(INDEX_PATH):
         return None
     with open(INDEX_PATH, "r", encoding="utf-8") as f:
         return json.load(f)
 
 
+def _load_binary_index(vectors_path: str, meta_path: str) -> Dict[str, Any]:
+    import numpy as np
+
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    matrix = np.load(vectors_path, mmap_mode="r")
+    rows = meta.get("items") or []
+    if matrix.ndim != 2 or matrix.shape[0] != len(rows):
+        raise ValueError(f"{vectors_path} does not match {meta_path}")
+
+    # Chunk text is not duplicated into the sidecar; resolve it from the live
+    # profile_chunks.json so vectors never serve stale facts.
+    try:
+        text_by_id = {str(c.get("id")): c.get("text") or "" for c in load_chunks()}
+    except Exception:
+        text_by_id = {}
+    items = [
+        {"id": row.get("id"), "title": row.get("title") or "", "text": text_by_id.get(str(row.get("id")), "")}
+        for row in rows
+    ]
+
+    valid = np.ones(len(items), dtype=bool)
+    valid[[int(pos) for pos in meta.get("invalid_rows") or []]] = False
+
+    index = {key: value for key, value in meta.items() if key != "items"}
+    index["items"] = items
+    # Rows are normalized at build time; the engine uses the mapped matrix as is.
+    index["_engine"] = {"items": items, "matrix": matrix, "valid": valid, "dim": int(matrix.shape[1])}
+    return index
+
+
+_chunks_stamp: Optional[Tuple[int, int]] = None
+
+
+def chunks_version() -> Tuple[int, int]:
+    """Return (mtime_ns, size) of profile_chunks.json.
+
+    When the file changes on disk, the cached chunks and the indexes built from
+    them are dropped so the next request reloads fresh facts.
+    """
+    global _chunks_stamp
+    try:
+        st = os.stat(CHUNKS_PATH)
+        stamp = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        stamp = (0, 0)
+    if stamp != _chunks_stamp:
+        if _chunks_stamp is not None:
+            load_chunks.cache_clear()
+            load_lexical_index.cache_clear()
+            load_index.cache_clear()
+        _chunks_stamp = stamp
+    return stamp
+
+
 def _tokens(text: str) -> List[str]:
     return [
         token
@@ -153,6 +240,11 @@ def _chunk_parts(item: Dict[str, Any]) -> Tuple[str, str, str]:
     return title.lower(), tags.lower(), text.lower()
 
 
+def _priority_prior(item: Dict[str, Any]) -> float:
+    priority = float(item.get("priority") or 0.0)
+    return min(max(priority, 0.0), 100.0) / 100.0 * 0.35
+
+
 def _keyword_score(query_tokens: List[str], raw_question: str, item: Dict[str, Any]) -> float:
     """Score a tiny personal-profile corpus without a paid embedding call.
 
@@ -160,6 +252,9 @@ def _keyword_score(query_tokens: List[str], raw_question: str, item: Dict[str, A
     small priority prior. This keeps stable identity facts present while still
     letting topical chunks win when the user asks about Nokia, thesis, Hermis,
     etc.
+
+    This is the reference scorer. The request path uses the precompiled
+    lexical index below, which must rank chunks exactly like this function.
     """
     if not query_tokens:
         return 0.0
@@ -179,24 +274,142 @@ def _keyword_score(query_tokens: List[str], raw_question: str, item: Dict[str, A
     # Reward exact phrase hits for multi-word project/entity names.
     raw = (raw_question or "").lower()
     haystack = f"{title} {tags} {text}"
-    important_phrases = [
-        "nokia standards", "internship outcome", "site based fine tuning", "dueling double dqn", "prioritized experience replay",
-        "action masking", "sparse online portfolio learning", "sparse switching",
-        "windowed ftrl", "projected gradient descent", "cardinality constrained simplex",
-        "hermis", "inter iit", "student placement representative", "dr samrat mukhopadhyay",
-        "100x", "ai agent", "ai agents", "voice bot", "voicebot", "ai twin", "stage 1 assessment",
-        "basic memory stack", "chat history", "local storage", "localstorage", "production ready",
-        "customer-facing conversational improvements", "weekly releases", "sales playbook", "operational role",
-    ]
-    for phrase in important_phrases:
+    for phrase in _IMPORTANT_PHRASES:
         if phrase in raw and phrase in haystack:
             score += 4.0
 
-    priority = float(item.get("priority") or 0.0)
-    score += min(max(priority, 0.0), 100.0) / 100.0 * 0.35
+    score += _priority_prior(item)
     return score / max(len(query_tokens), 1)
 
 
+# Query tokens and corpus words are both runs of [a-z0-9], so every substring hit
+# of a query token lies inside a single corpus word. That lets the index resolve
+# `token in title` / `text.count(token)` from per-word postings alone. Candidate
+# words come from a bigram index (query tokens are at least two characters), so a
+# token not seen before costs the words sharing all its bigrams, not the vocabulary.
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_TOKEN_CACHE_MAX = int(os.getenv("PROFILE_TOKEN_CACHE_MAX", "4096"))
+
+
+def build_lexical_index(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Precompile the chunk corpus for _keyword_score-equivalent ranking.
+
+    postings maps each corpus word to {chunk position: [title, tags, text]}
+    occurrence counts, and bigrams maps each character bigram to the words
+    containing it. Priority priors and phrase hits are computed once so a
+    query only touches the postings of its own tokens.
+    """
+    postings: Dict[str, Dict[int, List[int]]] = {}
+    phrase_postings: Dict[str, List[int]] = {phrase: [] for phrase in _IMPORTANT_PHRASES}
+    priors: List[float] = []
+
+    for pos, item in enumerate(items):
+        title, tags, text = _chunk_parts(item)
+        for field, value in enumerate((title, tags, text)):
+            for word in _WORD_RE.findall(value):
+                postings.setdefault(word, {}).setdefault(pos, [0, 0, 0])[field] += 1
+        haystack = f"{title} {tags} {text}"
+        for phrase in _IMPORTANT_PHRASES:
+            if phrase in haystack:
+                phrase_postings[phrase].append(pos)
+        priors.append(_priority_prior(item))
+
+    bigrams: Dict[str, set] = {}
+    for word in postings:
+        for i in range(len(word) - 1):
+            bigrams.setdefault(word[i : i + 2], set()).add(word)
+
+    return {
+        "items": items,
+        "postings": postings,
+        "bigrams": bigrams,
+        "phrase_postings": phrase_postings,
+        "priors": priors,
+        # Stable order of chunks that no query token touches: they score on
+        # their prior alone.
+        "prior_order": sorted(range(len(items)), key=lambda pos: -priors[pos]),
+        "token_cache": {},
+    }
+
+
+@lru_cache(maxsize=1)
+def load_lexical_index() -> Dict[str, Any]:
+    return build_lexical_index(load_chunks())
+
+
+def _token_postings(index: Dict[str, Any], token: str) -> Dict[int, Tuple[bool, bool, int]]:
+    """Resolve a query token to {chunk position: (in title, in tags, text count)}."""
+    cache: Dict[str, Dict[int, Tuple[bool, bool, int]]] = index["token_cache"]
+    cached = cache.get(token)
+    if cached is not None:
+        return cached
+
+    postings = index["postings"]
+    if len(token) < 2:
+        candidates: Iterable[str] = postings
+    else:
+        gram_sets = sorted((index["bigrams"].get(token[i : i + 2], set()) for i in range(len(token) - 1)), key=len)
+        candidates = gram_sets[0].intersection(*gram_sets[1:])
+
+    counts: Dict[int, List[int]] = {}
+    for word in candidates:
+        by_chunk = postings[word]
+        occurrences = word.count(token)
+        if not occurrences:
+            continue
+        for pos, (in_title, in_tags, in_text) in by_chunk.items():
+            acc = counts.setdefault(pos, [0, 0, 0])
+            acc[0] += in_title
+            acc[1] += in_tags
+            acc[2] += in_text * occurrences
+
+    resolved = {pos: (t > 0, g > 0, x) for pos, (t, g, x) in counts.items()}
+    if len(cache) >= _TOKEN_CACHE_MAX:
+        cache.clear()
+    cache[token] = resolved
+    return resolved
+
+
+def _ranked_chunks(
+    index: Dict[str, Any], query_tokens: List[str], raw_question: str
+) -> Iterator[Tuple[float, Dict[str, Any]]]:
+    """Yield (score, item) in the order a stable sort on _keyword_score gives."""
+    items = index["items"]
+    if not query_tokens:
+        for item in items:
+            yield 0.0, item
+        return
+
+    partial: Dict[int, float] = {}
+    for token in query_tokens:
+        for pos, (in_title, in_tags, count) in _token_postings(index, token).items():
+            score = partial.get(pos, 0.0)
+            if in_title:
+                score += 2.4
+            if in_tags:
+                score += 1.8
+            if count:
+                score += 0.8 + min(count, 5) * 0.15
+            partial[pos] = score
+
+    raw = (raw_question or "").lower()
+    for phrase in _IMPORTANT_PHRASES:
+        if phrase in raw:
+            for pos in index["phrase_postings"][phrase]:
+                partial[pos] = partial.get(pos, 0.0) + 4.0
+
+    n = max(len(query_tokens), 1)
+    priors = index["priors"]
+    touched = sorted(
+        (((score + priors[pos]) / n, pos) for pos, score in partial.items()),
+        key=lambda pair: (-pair[0], pair[1]),
+    )
+    untouched = ((priors[pos] / n, pos) for pos in index["prior_order"] if pos not in partial)
+
+    for score, pos in heapq.merge(touched, untouched, key=lambda pair: (-pair[0], pair[1])):
+        yield score, items[pos]
+
+
 def _items_by_id(items: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
     return {str(item.get("id")): item for item in items if item.get("id")}
 
@@ -206,6 +419,118 @@ def _pinned_context(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     return [by_id[item_id] for item_id in _PINNED_IDS if item_id in by_id]
 
 
+def _vector_engine(index: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the index embeddings as a pre-normalized float32 matrix.
+
+    Built once per index dict and cached on it. Rows whose embedding has the
+    wrong length or a zero norm are kept (so row positions match items) but
+    marked invalid; they score -1.0 exactly like _cosine does.
+    """
+    engine = index.get("_engine")
+    if engine is not None:
+        return engine
+
+    import numpy as np
+
+    items = [it for it in index.get("items") or [] if isinstance(it.get("embedding"), list)]
+    lengths = Counter(len(it["embedding"]) for it in items)
+    dim = lengths.most_common(1)[0][0] if lengths else 0
+    matrix = np.zeros((len(items), dim), dtype=np.float32)
+    for row, it in enumerate(items):
+        if len(it["embedding"]) == dim:
+            matrix[row] = it["embedding"]
+    norms = np.linalg.norm(matrix, axis=1)
+    valid = norms > 0.0
+    matrix[valid] /= norms[valid, None]
+
+    engine = {"items": items, "matrix": np.ascontiguousarray(matrix), "valid": valid, "dim": dim}
+    index["_engine"] = engine
+    return engine
+
+
+def _python_top_k(
+    query_vec: List[float], index: Dict[str, Any], k: int, min_score: float
+) -> List[Tuple[float, Dict[str, Any]]]:
+    # Fallback when NumPy is unavailable.
+    scored: List[Tuple[float, Dict[str, Any]]] = []
+    for it in index.get("items") or []:
+        vec = it.get("embedding")
+        if not isinstance(vec, list):
+            continue
+        scored.append((_cosine(query_vec, vec), it))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [(s, it) for s, it in scored[:k] if s >= min_score]
+
+
+def top_k_from_index(
+    query_vecs: List[List[float]],
+    index: Dict[str, Any],
+    k: int = 3,
+    min_score: float = 0.15,
+) -> List[List[Tuple[float, Dict[str, Any]]]]:
+    """Score a batch of query vectors against the index in one matrix product.
+
+    Returns, per query, up to k (cosine, item) pairs at or above min_score,
+    best first. Ties keep index order, matching the old stable sort.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        return [_python_top_k(q, index, k, min_score) for q in query_vecs]
+
+    engine = _vector_engine(index)
+    items, matrix, valid, dim = engine["items"], engine["matrix"], engine["valid"], engine["dim"]
+    results: List[List[Tuple[float, Dict[str, Any]]]] = [[] for _ in query_vecs]
+    n = len(items)
+    if not query_vecs or n == 0 or k <= 0:
+        return results
+
+    queries = np.zeros((len(query_vecs), dim), dtype=np.float32)
+    usable = np.zeros(len(query_vecs), dtype=bool)
+    for row, vec in enumerate(query_vecs):
+        if vec is not None and len(vec) == dim and dim:
+            queries[row] = vec
+            usable[row] = True
+    q_norms = np.linalg.norm(queries, axis=1)
+    usable &= q_norms > 0.0
+    queries[usable] /= q_norms[usable, None]
+
+    scores = queries @ matrix.T
+    scores[:, ~valid] = -1.0
+    scores[~usable, :] = -1.0
+
+    top = min(k, n)
+    for row in range(len(query_vecs)):
+        row_scores = scores[row]
+        if top < n:
+            candidates = np.argpartition(-row_scores, top - 1)[:top]
+            # argpartition picks an arbitrary member of a tie at the boundary;
+            # pull in every row tied with the cut-off so index order decides.
+            cutoff = row_scores[candidates].min()
+            candidates = np.union1d(candidates, np.flatnonzero(row_scores == cutoff))
+        else:
+            candidates = np.arange(n)
+        order = candidates[np.lexsort((candidates, -row_scores[candidates]))][:top]
+        results[row] = [
+            (float(row_scores[pos]), items[pos]) for pos in order if row_scores[pos] >= min_score
+        ]
+    return results
+
+
+def build_contexts_from_index(
+    query_vecs: List[List[float]],
+    index: Dict[str, Any],
+    k: int = 3,
+    min_score: float = 0.15,
+    max_chars: int = 2800,
+) -> List[str]:
+    """Batch variant of build_context_from_index: one context per query vector."""
+    return [
+        _format_blocks([it for _, it in picked], max_chars=max_chars)
+        for picked in top_k_from_index(query_vecs, index, k=k, min_score=min_score)
+    ]
+
+
 def build_context_from_index(
     query_vec: List[float],
     index: Dict[str, Any],
@@ -214,18 +539,31 @@ def build_context_from_index(
     max_chars: int = 2800,
 ) -> str:
     """Legacy vector-index context builder retained for old scripts/tests."""
-    items = index.get("items") or []
-    scored: List[Tuple[float, Dict[str, Any]]] = []
-    for it in items:
-        vec = it.get("embedding")
-        if not isinstance(vec, list):
-            continue
-        s = _cosine(query_vec, vec)
-        scored.append((s, it))
-    scored.sort(key=lambda x: x[0], reverse=True)
+    return build_contexts_from_index([query_vec], index, k=k, min_score=min_score, max_chars=max_chars)[0]
 
-    picked = [it for s, it in scored[:k] if s >= min_score]
-    return _format_blocks(picked, max_chars=max_chars)
+
+def _format_block(item: Dict[str, Any]) -> str:
+    title = (item.get("title") or "").strip()
+    text = (item.get("text") or "").strip()
+    if not text:
+        return ""
+    return f"### {title}\n{text}" if title else text
+
+
+def join_blocks(blocks: Iterable[str], max_chars: int) -> str:
+    """Join formatted blocks in order, skipping any that would push past max_chars.
+
+    Blocks are kept or dropped whole, never cut mid-sentence.
+    """
+    kept: List[str] = []
+    used = 0
+    for block in blocks:
+        cost = len(block) + (2 if kept else 0)
+        if used + cost > max_chars:
+            continue
+        kept.append(block)
+        used += cost
+    return "\n\n".join(kept)
 
 
 def _format_blocks(items: List[Dict[str, Any]], max_chars: int) -> str:
@@ -236,12 +574,49 @@ def _format_blocks(items: List[Dict[str, Any]], max_chars: int) -> str:
         if item_id in seen:
             continue
         seen.add(item_id)
-        title = (item.get("title") or "").strip()
-        text = (item.get("text") or "").strip()
-        if not text:
+        block = _format_block(item)
+        if block:
+            blocks.append(block)
+    return join_blocks(blocks, max_chars)
+
+
+def profile_blocks(*, question_text: str, k: int = 5, min_score: float = 0.18) -> List[Dict[str, Any]]:
+    """Return the facts blocks for a question in priority order.
+
+    Each entry is {"id", "text", "score", "pinned"}: pinned chunks first, then
+    topical chunks best score first (or the default chunks when nothing
+    clears min_score). "text" is the formatted block as it appears in the
+    FACTS CONTEXT.
+    """
+    try:
+        chunks_version()
+        index = load_lexical_index()
+    except Exception:
+        return []
+
+    items = index["items"]
+    by_id = _items_by_id(items)
+    query_tokens = _expanded_query_tokens(question_text)
+    topical_limit = max(k, 1) + len(_PINNED_IDS)
+
+    picked: List[Tuple[float, bool, Dict[str, Any]]] = [(0.0, True, item) for item in _pinned_context(items)]
+    ranked = _ranked_chunks(index, query_tokens, question_text)
+    above_floor = itertools.takewhile(lambda pair: pair[0] >= min_score, ranked)
+    picked.extend((score, False, item) for score, item in itertools.islice(above_floor, topical_limit - len(picked)))
+
+    if len(picked) <= len(_PINNED_IDS):
+        picked.extend((0.0, False, by_id[item_id]) for item_id in _DEFAULT_CONTEXT_IDS if item_id in by_id)
+
+    blocks = []
+    seen = set()
+    for score, pinned, item in picked[:topical_limit]:
+        item_id = item.get("id") or item.get("title") or item.get("text")
+        text = _format_block(item)
+        if item_id in seen or not text:
             continue
-        blocks.append(f"### {title}\n{text}" if title else text)
-    return "\n\n".join(blocks).strip()[:max_chars]
+        seen.add(item_id)
+        blocks.append({"id": str(item_id), "text": text, "score": round(score, 4), "pinned": pinned})
+    return blocks
 
 
 def build_profile_context(
@@ -260,22 +635,5 @@ def build_profile_context(
     lexical retrieval is more reliable and cheaper than making a second model
     call for embeddings on every chat request.
     """
-    try:
-        items = load_chunks()
-    except Exception:
-        return ""
-
-    by_id = _items_by_id(items)
-    query_tokens = _expanded_query_tokens(question_text)
-    scored = [(_keyword_score(query_tokens, question_text, item), item) for item in items]
-    scored.sort(key=lambda pair: pair[0], reverse=True)
-
-    picked: List[Dict[str, Any]] = []
-    picked.extend(_pinned_context(items))
-    picked.extend(item for score, item in scored if score >= min_score)
-
-    if len(picked) <= len(_PINNED_IDS):
-        picked.extend(by_id[item_id] for item_id in _DEFAULT_CONTEXT_IDS if item_id in by_id)
-
-    topical_limit = max(k, 1) + len(_PINNED_IDS)
-    return _format_blocks(picked[:topical_limit], max_chars=max_chars)
+    blocks = profile_blocks(question_text=question_text, k=k, min_score=min_score)
+    return join_blocks((block["text"] for block in blocks), max_chars)
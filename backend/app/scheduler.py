@@ -0,0 +1,282 @@
+"""Token-bucket scheduling for provider API keys.
+
+Each (key, model) pair has two buckets that refill continuously: requests per
+minute and tokens per minute. Callers ask for keys ordered by headroom, charge
+a bucket before each call, and report 429s (with any Retry-After hint) so the
+pair is skipped until it recovers.
+
+State lives in a small SQLite file so every uvicorn worker on the host sees
+the same exhaustion instead of relearning it. API keys are never written to
+disk; rows are keyed by a short hash. If the file cannot be opened, the
+scheduler falls back to an in-process store.
+
+Reads (headroom, key order, blocks) are plain SELECTs that write nothing;
+only charges, corrections and 429s take a write transaction, and a change
+that leaves the bucket as it was is not written. Async callers go through
+offload() so SQLite never blocks the event loop.
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+DEFAULT_RPM = float(os.getenv("GEMINI_RPM_LIMIT", "15"))
+DEFAULT_TPM = float(os.getenv("GEMINI_TPM_LIMIT", "250000"))
+DEFAULT_BLOCK_SECONDS = float(os.getenv("KEY_RATE_LIMIT_COOLDOWN_SECONDS", "60"))
+
+_RETRY_RE = re.compile(r"retry(?:[ _-]?delay|[ _-]?after| in)?[\"':=\s]*(\d+(?:\.\d+)?)\s*(ms|s)?", re.IGNORECASE)
+
+
+def _model_limits() -> Dict[str, Tuple[float, float]]:
+    """Parse GEMINI_MODEL_LIMITS="model=rpm:tpm,model=rpm:tpm" overrides."""
+    limits: Dict[str, Tuple[float, float]] = {}
+    for item in os.getenv("GEMINI_MODEL_LIMITS", "").split(","):
+        if "=" not in item:
+            continue
+        model, _, spec = item.partition("=")
+        rpm, _, tpm = spec.partition(":")
+        try:
+            limits[model.strip()] = (float(rpm), float(tpm or DEFAULT_TPM))
+        except ValueError:
+            continue
+    return limits
+
+
+def key_id(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def retry_after_seconds(exc: Any) -> Optional[float]:
+    """Extract a Retry-After hint from an SDK exception or its message."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        try:
+            value = headers.get("retry-after")
+            if value is not None:
+                return max(float(value), 0.0)
+        except (TypeError, ValueError):
+            pass
+    match = _RETRY_RE.search(str(exc))
+    if not match:
+        return None
+    seconds = float(match.group(1))
+    return seconds / 1000.0 if (match.group(2) or "").lower() == "ms" else seconds
+
+
+class KeyScheduler:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._local = threading.local()
+        self._memory: Dict[Tuple[str, str], List[float]] = {}
+        self._memory_lock = threading.Lock()
+        self._limits = _model_limits()
+        if path:
+            try:
+                self._conn()
+            except sqlite3.Error:
+                self.path = None
+
+    # -- storage ---------------------------------------------------------
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                " key_id TEXT NOT NULL, model TEXT NOT NULL,"
+                " requests REAL NOT NULL, tokens REAL NOT NULL,"
+                " updated REAL NOT NULL, blocked_until REAL NOT NULL,"
+                " PRIMARY KEY (key_id, model))"
+            )
+            self._local.conn = conn
+        return conn
+
+    def _read(self, pairs: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], List[float]]:
+        """Refilled rows for every pair from a single SELECT; nothing is written."""
+        now = time.time()
+        pairs = list(pairs)
+        if not pairs:
+            return {}
+        stored: Dict[Tuple[str, str], List[float]] = {}
+        if self.path:
+            try:
+                kids = sorted({kid for kid, _ in pairs})
+                models = sorted({model for _, model in pairs})
+                query = (
+                    "SELECT key_id, model, requests, tokens, updated, blocked_until FROM buckets"
+                    f" WHERE key_id IN ({','.join('?' * len(kids))}) AND model IN ({','.join('?' * len(models))})"
+                )
+                for kid, model, *row in self._conn().execute(query, kids + models):
+                    stored[(kid, model)] = row
+                return {pair: self._refill(pair[1], stored.get(pair), now) for pair in pairs}
+            except sqlite3.Error:
+                stored = {}
+        with self._memory_lock:
+            for pair in pairs:
+                if pair in self._memory:
+                    stored[pair] = list(self._memory[pair])
+        return {pair: self._refill(pair[1], stored.get(pair), now) for pair in pairs}
+
+    def _update(self, pairs: Iterable[Tuple[str, str]], change) -> Dict[Tuple[str, str], List[float]]:
+        """Refill, apply `change(row, now)` and persist each pair atomically.
+
+        Rows are [requests, tokens, updated, blocked_until]. A pair whose
+        change is a no-op is not written: refilling is a pure function of the
+        stored row and the clock, so the stored row is still exact.
+        """
+        now = time.time()
+        pairs = list(pairs)
+        out: Dict[Tuple[str, str], List[float]] = {}
+        if self.path:
+            try:
+                conn = self._conn()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    for kid, model in pairs:
+                        found = conn.execute(
+                            "SELECT requests, tokens, updated, blocked_until FROM buckets WHERE key_id=? AND model=?",
+                            (kid, model),
+                        ).fetchone()
+                        row = self._refill(model, list(found) if found else None, now)
+                        before = list(row)
+                        change(row, now)
+                        out[(kid, model)] = row
+                        if row == before:
+                            continue
+                        conn.execute(
+                            "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?, ?, ?)",
+                            (kid, model, row[0], row[1], row[2], row[3]),
+                        )
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                return out
+            except sqlite3.Error:
+                # A locked or broken file must never fail a chat request.
+                pass
+        with self._memory_lock:
+            for kid, model in pairs:
+                row = self._refill(model, self._memory.get((kid, model)), now)
+                before = list(row)
+                change(row, now)
+                if row != before:
+                    self._memory[(kid, model)] = row
+                out[(kid, model)] = row
+        return out
+
+    def limits(self, model: str) -> Tuple[float, float]:
+        return self._limits.get(model, (DEFAULT_RPM, DEFAULT_TPM))
+
+    def _refill(self, model: str, row: Optional[List[float]], now: float) -> List[float]:
+        rpm, tpm = self.limits(model)
+        if row is None:
+            return [rpm, tpm, now, 0.0]
+        elapsed = max(now - row[2], 0.0)
+        return [
+            min(rpm, row[0] + elapsed * rpm / 60.0),
+            min(tpm, row[1] + elapsed * tpm / 60.0),
+            now,
+            row[3],
+        ]
+
+    # -- public API ------------------------------------------------------
+
+    async def offload(self, method, *args):
+        """Call a scheduler method from async code without blocking the loop on SQLite."""
+        if not self.path:
+            return method(*args)
+        return await asyncio.to_thread(method, *args)
+
+    def headroom_table(self, api_keys: List[str], models: List[str]) -> Dict[Tuple[str, str], float]:
+        """Headroom of every (key, model) pair from one read; -1.0 while blocked."""
+        rows = self._read((key_id(k), m) for k in api_keys for m in models)
+        now = time.time()
+        out = {}
+        for model in models:
+            rpm, tpm = self.limits(model)
+            for k in api_keys:
+                row = rows[(key_id(k), model)]
+                if row[3] > now:
+                    out[(k, model)] = -1.0
+                else:
+                    out[(k, model)] = min(row[0] / rpm if rpm else 1.0, row[1] / tpm if tpm else 1.0)
+        return out
+
+    def headroom(self, api_keys: List[str], model: str) -> Dict[str, float]:
+        """Fraction of the tighter bucket left per key; -1.0 while blocked."""
+        return {k: room for (k, _), room in self.headroom_table(api_keys, [model]).items()}
+
+    def order_keys(self, api_keys: List[str], model: str) -> List[str]:
+        """Keys with the most headroom first; blocked keys only if nothing else is left."""
+        if not api_keys:
+            return []
+        return rank_keys(api_keys, self.headroom(api_keys, model))
+
+    def is_blocked(self, api_key: str, model: str) -> bool:
+        return self.headroom([api_key], model)[api_key] < 0.0
+
+    def acquire(self, api_key: str, model: str, tokens: float) -> None:
+        """Charge one request and an estimated token count before a call."""
+
+        def charge(row: List[float], now: float) -> None:
+            row[0] -= 1.0
+            row[1] -= max(tokens, 0.0)
+
+        self._update([(key_id(api_key), model)], charge)
+
+    def settle(self, api_key: str, model: str, estimated: float, actual: float) -> None:
+        """Correct the token bucket once the real usage is known."""
+
+        def correct(row: List[float], now: float) -> None:
+            row[1] += estimated - actual
+
+        self._update([(key_id(api_key), model)], correct)
+
+    def record_rate_limit(self, api_key: str, model: str, retry_after: Optional[float] = None) -> None:
+        """Block the pair until Retry-After (or the default cooldown) and empty its buckets."""
+        wait = DEFAULT_BLOCK_SECONDS if retry_after is None else retry_after
+
+        def block(row: List[float], now: float) -> None:
+            row[0] = min(row[0], 0.0)
+            row[3] = max(row[3], now + wait)
+
+        self._update([(key_id(api_key), model)], block)
+
+    def reset(self) -> None:
+        """Forget every bucket (for tests)."""
+        with self._memory_lock:
+            self._memory.clear()
+        if self.path:
+            try:
+                self._conn().execute("DELETE FROM buckets")
+            except sqlite3.Error:
+                pass
+
+
+def rank_keys(api_keys: List[str], room: Dict[str, float]) -> List[str]:
+    """Order keys by headroom, dropping blocked ones unless every key is blocked."""
+    ordered = sorted(api_keys, key=lambda k: room[k], reverse=True)
+    usable = [k for k in ordered if room[k] >= 0.0]
+    return usable or ordered
+
+
+def _default_path() -> Optional[str]:
+    path = os.getenv("KEY_SCHEDULER_DB", "").strip()
+    if path.lower() in ("memory", ":memory:", "off"):
+        return None
+    return path or os.path.join(tempfile.gettempdir(), "chat_with_me_key_scheduler.sqlite3")
+
+
+scheduler = KeyScheduler(_default_path())
@@ -0,0 +1,154 @@
+"""Server-side conversation history for delta-only chat requests.
+
+A client that has a session id sends just its new message; the server adds
+it to the stored history, answers, and stores the reply. Sessions live in a
+bounded in-process LRU with a TTL, or in a small SQLite file when
+CHAT_SESSION_DB is set, so every uvicorn worker on the host can continue the
+same conversation. A session that has been evicted or expired is simply not
+found: the client is told so and resends the full history, which starts the
+session again.
+
+Only the last SESSION_MAX_MESSAGES messages are kept per session, which is
+all any mode's history window can use. Async callers go through offload() so
+SQLite never blocks the event loop.
+"""
+
+import asyncio
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+SESSION_TTL_SECONDS = float(os.getenv("CHAT_SESSION_TTL_SECONDS", "1800"))
+SESSION_MAX_SESSIONS = int(os.getenv("CHAT_SESSION_MAX_SESSIONS", "1000"))
+SESSION_MAX_MESSAGES = int(os.getenv("CHAT_SESSION_MAX_MESSAGES", "30"))
+
+Messages = List[Dict[str, str]]
+
+
+def new_session_id() -> str:
+    return secrets.token_urlsafe(16)
+
+
+def _trim(messages: Messages) -> Messages:
+    kept = [{"role": m["role"], "content": m["content"]} for m in messages if (m.get("content") or "").strip()]
+    return kept[-SESSION_MAX_MESSAGES:]
+
+
+class SessionStore:
+    def __init__(self, path: Optional[str] = None, max_sessions: int = SESSION_MAX_SESSIONS, ttl_seconds: float = SESSION_TTL_SECONDS):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._memory: "OrderedDict[str, Tuple[float, Messages]]" = OrderedDict()  # id -> (expires, messages)
+        self._lock = threading.Lock()
+        if path:
+            try:
+                self._conn()
+            except sqlite3.Error:
+                self.path = None
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " id TEXT PRIMARY KEY, messages TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)")
+            self._local.conn = conn
+        return conn
+
+    async def offload(self, method, *args):
+        """Call a store method from async code without blocking the loop on SQLite."""
+        if not self.path:
+            return method(*args)
+        return await asyncio.to_thread(method, *args)
+
+    def get(self, session_id: str) -> Optional[Messages]:
+        """Return the stored history and refresh its TTL, or None if unknown or expired."""
+        now = time.time()
+        if self.path:
+            try:
+                conn = self._conn()
+                row = conn.execute("SELECT messages, expires FROM sessions WHERE id=?", (session_id,)).fetchone()
+                if row is None or row[1] <= now:
+                    return None
+                conn.execute("UPDATE sessions SET expires=? WHERE id=?", (now + self.ttl_seconds, session_id))
+                return json.loads(row[0])
+            except (sqlite3.Error, ValueError):
+                # A locked or broken file must never fail a chat request; the
+                # client falls back to sending the full history.
+                return None
+        with self._lock:
+            entry = self._memory.get(session_id)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._memory[session_id]
+                return None
+            self._memory[session_id] = (now + self.ttl_seconds, entry[1])
+            self._memory.move_to_end(session_id)
+            return list(entry[1])
+
+    def put(self, session_id: str, messages: Messages) -> None:
+        now = time.time()
+        messages = _trim(messages)
+        if self.path:
+            try:
+                conn = self._conn()
+                conn.execute(
+                    "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+                    (session_id, json.dumps(messages, ensure_ascii=False), now + self.ttl_seconds),
+                )
+                conn.execute("DELETE FROM sessions WHERE expires <= ?", (now,))
+                conn.execute(
+                    "DELETE FROM sessions WHERE id IN (SELECT id FROM sessions ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+                    (self.max_sessions,),
+                )
+                return
+            except sqlite3.Error:
+                pass
+        with self._lock:
+            self._memory[session_id] = (now + self.ttl_seconds, messages)
+            self._memory.move_to_end(session_id)
+            while len(self._memory) > self.max_sessions:
+                self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        if self.path:
+            try:
+                count = self._conn().execute("SELECT COUNT(*) FROM sessions WHERE expires > ?", (time.time(),)).fetchone()[0]
+                return {"backend": "sqlite", "sessions": count}
+            except sqlite3.Error:
+                pass
+        with self._lock:
+            return {"backend": "memory", "sessions": len(self._memory)}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+        if self.path:
+            try:
+                self._conn().execute("DELETE FROM sessions")
+            except sqlite3.Error:
+                pass
+
+
+def _default_path() -> Optional[str]:
+    path = os.getenv("CHAT_SESSION_DB", "").strip()
+    if path.lower() in ("", "memory", ":memory:", "off"):
+        return None
+    return path
+
+
+session_store = SessionStore(_default_path())
@@ -0,0 +1,82 @@
+"""Bounded multipart reading for audio uploads.
+
+FastAPI's File(...) parameter buffers the whole request before the handler
+runs, so an oversized upload is only rejected after it has been received in
+full. read_audio_upload() instead parses the body as it streams in and stops
+as soon as the byte cap is crossed (or immediately, when Content-Length
+already exceeds it). The file part is held in memory up to
+AUDIO_SPOOL_BYTES and spooled to a temp file beyond that, so concurrent
+uploads do not each buffer a second full copy while they arrive.
+"""
+
+import os
+from typing import AsyncIterator, Optional, Tuple
+
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+from starlette.requests import Request
+
+
+AUDIO_SPOOL_BYTES = int(os.getenv("AUDIO_SPOOL_BYTES", str(1024 * 1024)))
+# Boundary lines and part headers around the audio bytes.
+MULTIPART_OVERHEAD_BYTES = 16 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadError(ValueError):
+    pass
+
+
+class _BodyTooLarge(MultiPartException):
+    # Raised from inside the parser's stream so it closes its spooled files.
+    pass
+
+
+class _AudioPartParser(MultiPartParser):
+    max_file_size = AUDIO_SPOOL_BYTES
+
+
+async def _bounded(stream: AsyncIterator[bytes], limit: int) -> AsyncIterator[bytes]:
+    received = 0
+    async for chunk in stream:
+        received += len(chunk)
+        if received > limit:
+            raise _BodyTooLarge("Audio upload is too large.")
+        yield chunk
+
+
+async def read_audio_upload(request: Request, max_bytes: int, field: str = "file") -> Tuple[bytes, Optional[str]]:
+    """Return (audio bytes, declared content type) from a multipart request.
+
+    Raises UploadTooLarge past max_bytes and UploadError for malformed bodies
+    or a missing file field.
+    """
+    content_type = request.headers.get("content-type", "")
+    if not content_type.lower().startswith("multipart/form-data"):
+        raise UploadError("Expected a multipart/form-data upload.")
+    body_limit = max_bytes + MULTIPART_OVERHEAD_BYTES
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > body_limit:
+        raise UploadTooLarge("Audio upload is too large.")
+
+    parser = _AudioPartParser(request.headers, _bounded(request.stream(), body_limit), max_files=1, max_fields=16)
+    try:
+        form = await parser.parse()
+    except _BodyTooLarge as exc:
+        raise UploadTooLarge(str(exc)) from exc
+    except MultiPartException as exc:
+        raise UploadError(exc.message) from exc
+
+    upload = form.get(field)
+    try:
+        if not isinstance(upload, UploadFile):
+            raise UploadError(f"Missing '{field}' file field.")
+        if (upload.size or 0) > max_bytes:
+            raise UploadTooLarge("Audio upload is too large.")
+        # The one full copy: providers send the audio inline, so they need bytes.
+        return await upload.read(), upload.content_type
+    finally:
+        await form.close()
@@ -0,0 +1,314 @@
+"""Benchmark the retrieval and prompt-assembly hot paths.
+
+Covers query expansion, keyword scoring, build_profile_context, the vector
+top-k path (build_context_from_index), build_gemini_history, the OpenAI
+transcript builder and the token-budget packer. Corpora are synthesized from profile_chunks.json and
+scaled from its ~20 chunks up to 100k; questions come from a fixed set of
+interview questions plus seeded random ones, so runs are reproducible.
+
+Usage (from repo root):
+  python backend/scripts/bench_hot_paths.py                   # print results
+  python backend/scripts/bench_hot_paths.py --save            # write the baseline
+  python backend/scripts/bench_hot_paths.py --compare         # diff against it
+  python backend/scripts/bench_hot_paths.py --sizes 20,1000 --seconds 0.5
+
+Each case reports throughput, p50/p99 latency per call and the peak Python
+heap allocated while running it (tracemalloc, measured in a separate pass so
+it does not skew the timings). --compare exits with status 1 when a case's
+p50 or p99 regressed by more than --threshold (and by at least --floor-us).
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app import retrieval  # noqa: E402
+from app.gemini import build_gemini_history  # noqa: E402
+from app.openai_provider import _build_transcript  # noqa: E402
+from app.packing import pack_prompt  # noqa: E402
+from app.prompts import SYSTEM_PROMPT_BASE  # noqa: E402
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "bench_baseline.json")
+DEFAULT_SIZES = (20, 1000, 10000, 100000)
+VECTOR_DIM = 256
+
+INTERVIEW_QUESTIONS = [
+    "Tell me about yourself.",
+    "Walk me through your resume.",
+    "What did you work on during your Nokia internship?",
+    "What is your thesis about?",
+    "Explain the Hermis project and your role in it.",
+    "Why should we hire you?",
+    "What are your biggest strengths and weaknesses?",
+    "Describe a challenging bug you fixed.",
+    "Which programming languages are you most comfortable with?",
+    "How do you approach system design for a new service?",
+    "What machine learning models have you trained and deployed?",
+    "Tell me about a time you disagreed with a teammate.",
+    "Where do you see yourself in five years?",
+    "What are you studying right now and when do you graduate?",
+    "Have you worked with Kubernetes, Docker or cloud deployments?",
+    "How do you measure the performance of a retrieval system?",
+    "What is the most impactful project you have shipped?",
+    "Do you have experience with real-time data pipelines?",
+    "How do you handle tight deadlines?",
+    "What research papers or publications have you contributed to?",
+    "Why are you interested in this role?",
+    "What did you learn from your internship at Nokia?",
+    "Can you explain your thesis results to a non-technical person?",
+    "What tools do you use for testing and CI?",
+    "Are you open to relocation and what is your notice period?",
+    "How did you evaluate the accuracy of your models?",
+    "What would your previous manager say about you?",
+    "Describe your experience with Python and C++.",
+    "How do you keep up with new technology?",
+    "Do you have any questions for us?",
+]
+
+
+# -- workloads ---------------------------------------------------------------
+
+
+def _vocabulary(chunks: List[Dict[str, Any]]) -> List[str]:
+    words = []
+    for chunk in chunks:
+        words.extend(retrieval._tokens(" ".join([chunk.get("title") or "", chunk.get("text") or ""])))
+    return sorted(set(words))
+
+
+def synthetic_corpus(base: List[Dict[str, Any]], size: int, seed: int = 7) -> List[Dict[str, Any]]:
+    """The real chunks first, then generated ones drawn from the same vocabulary."""
+    rng = random.Random(seed)
+    vocab = _vocabulary(base)
+    tag_pool = sorted({tag for chunk in base for tag in chunk.get("tags") or []}) or vocab
+    corpus = [dict(chunk) for chunk in base[:size]]
+    for n in range(len(corpus), size):
+        template = base[n % len(base)]
+        words = rng.choices(vocab, k=rng.randint(25, 90))
+        corpus.append({
+            "id": f"synthetic_{n}",
+            "title": " ".join(rng.choices(vocab, k=rng.randint(2, 5))).title(),
+            "tags": rng.sample(tag_pool, k=min(len(tag_pool), rng.randint(1, 4))),
+            "priority": rng.choice([0, 0, 0, 10, 20, template.get("priority") or 0]),
+            "text": " ".join(words).capitalize() + ".",
+        })
+    return corpus
+
+
+def question_set(vocab: List[str], count: int = 60, seed: int = 11) -> List[str]:
+    rng = random.Random(seed)
+    synthetic = [" ".join(rng.choices(vocab, k=rng.randint(3, 12))) + "?" for _ in range(count - len(INTERVIEW_QUESTIONS))]
+    return INTERVIEW_QUESTIONS + synthetic
+
+
+def conversation(turns: int, seed: int = 3) -> List[Dict[str, Any]]:
+    """An interview transcript that starts with the frontend's assistant greeting."""
+    rng = random.Random(seed)
+    messages = [{"role": "assistant", "content": "Hi, I'm Ansuk. Ask me anything about my work."}]
+    for n in range(turns - 1):
+        if n % 2 == 0:
+            messages.append({"role": "user", "content": rng.choice(INTERVIEW_QUESTIONS)})
+        else:
+            sentences = rng.randint(3, 14)
+            messages.append({"role": "assistant", "content": " ".join(
+                rng.choice(INTERVIEW_QUESTIONS).replace("?", ".") for _ in range(sentences)
+            )})
+    return messages
+
+
+def vector_index(corpus: List[Dict[str, Any]], seed: int = 5) -> Tuple[Dict[str, Any], List[List[float]]]:
+    """An in-memory index shaped like the mmap'd binary one, plus query vectors."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    matrix = rng.standard_normal((len(corpus), VECTOR_DIM), dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    items = [{"id": c.get("id"), "title": c.get("title") or "", "text": c.get("text") or ""} for c in corpus]
+    valid = np.ones(len(items), dtype=bool)
+    index = {"items": items, "_engine": {"items": items, "matrix": matrix, "valid": valid, "dim": VECTOR_DIM}}
+    queries = rng.standard_normal((32, VECTOR_DIM), dtype=np.float32).tolist()
+    return index, queries
+
+
+# -- measurement ---------------------------------------------------------------
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    pos = min(int(round(pct / 100.0 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[pos]
+
+
+def measure(fn: Callable[[int], Any], seconds: float, min_calls: int = 5, max_calls: int = 20000) -> Dict[str, float]:
+    """Call fn(i) until the time budget is spent; fn gets a call counter to vary inputs."""
+    fn(0)  # warm caches and lazy imports
+    samples: List[float] = []
+    deadline = time.perf_counter() + seconds
+    calls = 0
+    while calls < max_calls and (calls < min_calls or time.perf_counter() < deadline):
+        started = time.perf_counter_ns()
+        fn(calls)
+        samples.append((time.perf_counter_ns() - started) / 1000.0)
+        calls += 1
+    total_us = sum(samples)
+    samples.sort()
+
+    tracemalloc.start()
+    try:
+        for n in range(min(calls, min_calls)):
+            fn(n)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "calls": calls,
+        "ops_per_sec": round(calls / (total_us / 1e6), 1) if total_us else 0.0,
+        "p50_us": round(_percentile(samples, 50), 1),
+        "p99_us": round(_percentile(samples, 99), 1),
+        "peak_kib": round(peak / 1024.0, 1),
+    }
+
+
+def _use_corpus(index: Dict[str, Any]) -> Callable[[], None]:
+    """Point build_profile_context at a synthetic lexical index; returns an undo."""
+    saved = (retrieval.load_lexical_index, retrieval.chunks_version)
+    retrieval.load_lexical_index = lambda: index
+    retrieval.chunks_version = lambda: (0, 0)
+
+    def restore() -> None:
+        retrieval.load_lexical_index, retrieval.chunks_version = saved
+
+    return restore
+
+
+def run(sizes: List[int], seconds: float, only: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    base = retrieval.load_chunks()
+    vocab = _vocabulary(base)
+    questions = question_set(vocab)
+    results: Dict[str, Dict[str, float]] = {}
+
+    def case(name: str, size: Any, fn: Callable[[int], Any], budget: float = seconds, min_calls: int = 5) -> None:
+        label = f"{name}@{size}"
+        if only and only not in label:
+            return
+        results[label] = measure(fn, budget, min_calls=min_calls)
+        r = results[label]
+        print(f"{label:<40} {r['ops_per_sec']:>12,.1f}/s  p50 {r['p50_us']:>11,.1f}us  "
+              f"p99 {r['p99_us']:>11,.1f}us  peak {r['peak_kib']:>10,.1f}KiB", flush=True)
+
+    case("expanded_query_tokens", "questions", lambda i: retrieval._expanded_query_tokens(questions[i % len(questions)]))
+
+    for size in sizes:
+        corpus = synthetic_corpus(base, size)
+        case("build_lexical_index", size, lambda i: retrieval.build_lexical_index(corpus), min_calls=1)
+        tokens = [retrieval._expanded_query_tokens(q) for q in questions]
+
+        def score_all(i: int) -> float:
+            q = i % len(questions)
+            return max(retrieval._keyword_score(tokens[q], questions[q], item) for item in corpus)
+
+        case("keyword_score_full_scan", size, score_all, min_calls=3)
+
+        index = retrieval.build_lexical_index(corpus)
+        restore = _use_corpus(index)
+        try:
+            case("build_profile_context", size, lambda i: retrieval.build_profile_context(
+                question_text=questions[i % len(questions)]
+            ))
+        finally:
+            restore()
+        del index
+
+        try:
+            vindex, queries = vector_index(corpus)
+        except ImportError:
+            print(f"build_context_from_index@{size}: numpy not installed, skipped")
+        else:
+            case("build_context_from_index", size, lambda i, vindex=vindex: retrieval.build_context_from_index(
+                queries[i % len(queries)], vindex, k=5, min_score=0.0
+            ))
+            del vindex
+
+    blocks = retrieval.profile_blocks(question_text=questions[0])
+    for turns in (2, 10, 30):
+        messages = conversation(turns)
+        case("build_gemini_history", turns, lambda i: build_gemini_history(messages, 16))
+        case("openai_build_transcript", turns, lambda i: _build_transcript(messages, 10))
+        case("pack_prompt", turns, lambda i: pack_prompt(SYSTEM_PROMPT_BASE, blocks, messages, 2500, 16))
+
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Any], threshold: float, floor_us: float) -> int:
+    old = baseline.get("results") or {}
+    regressions = 0
+    print(f"\nagainst baseline from {baseline.get('meta', {}).get('created', '?')} (threshold {threshold:.0%})")
+    for label, r in results.items():
+        before = old.get(label)
+        if not before:
+            print(f"{label:<40} new case")
+            continue
+        deltas = []
+        worst = 0.0
+        for metric in ("p50_us", "p99_us"):
+            if before.get(metric):
+                change = r[metric] / before[metric] - 1.0
+                # Microsecond-scale jitter is not a regression.
+                if r[metric] - before[metric] >= floor_us:
+                    worst = max(worst, change)
+                deltas.append(f"{metric[:3]} {change:+.0%}")
+        flag = "REGRESSION" if worst > threshold else ""
+        regressions += bool(flag)
+        print(f"{label:<40} {'  '.join(deltas):<24} {flag}")
+    return 1 if regressions else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES), help="corpus sizes, comma separated")
+    parser.add_argument("--seconds", type=float, default=1.0, help="time budget per case")
+    parser.add_argument("--only", help="run cases whose label contains this text")
+    parser.add_argument("--save", nargs="?", const=BASELINE_PATH, help="write results as the baseline")
+    parser.add_argument("--compare", nargs="?", const=BASELINE_PATH, help="compare against a saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="relative slowdown that counts as a regression")
+    parser.add_argument("--floor-us", type=float, default=10.0, help="ignore slowdowns smaller than this in absolute terms")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    results = run(sizes, args.seconds, args.only)
+
+    status = 0
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            status = compare(results, json.load(f), args.threshold, args.floor_us)
+    if args.save:
+        payload = {
+            "meta": {
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "platform": platform.platform(),
+                "seconds_per_case": args.seconds,
+            },
+            "results": results,
+        }
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nWrote baseline to {args.save}")
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
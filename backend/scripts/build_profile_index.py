@@ -1,66 +1,301 @@
 """Build a local embeddings index for profile_chunks.json.
 
-This lets you do 'mini-RAG' without any database: the app ships with a JSON file
-containing embeddings for each chunk.
+This lets you do 'mini-RAG' without any database: the app ships with a
+binary matrix containing embeddings for each chunk.
 
 Usage (from repo root):
   export GEMINI_API_KEY=...
   python backend/scripts/build_profile_index.py
 
-It will write: backend/app/profile_index.json
+It will write:
+  backend/app/profile_index.npy        pre-normalized embedding matrix
+  backend/app/profile_index.meta.json  ids, titles, model and dimension
+
+Set PROFILE_INDEX_FORMAT=json (or both) to also write the legacy
+backend/app/profile_index.json, and PROFILE_INDEX_DTYPE=float16 to halve the
+matrix size.
+
+Builds are incremental: every row records a content hash, and chunks whose
+hash matches the previous artifact reuse its vector. Only added or changed
+chunks are embedded, in batches spread over a small thread pool:
+  PROFILE_EMBED_BATCH_SIZE  texts per embed_content call (default 32)
+  PROFILE_EMBED_WORKERS     concurrent batches (default 4)
+  PROFILE_EMBED_RPM         embed_content calls per minute (default 60)
 """
 
+import hashlib
 import json
 import os
+import random
+import threading
 import time
-from typing import Any, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 
 CHUNKS_PATH = os.path.join(os.path.dirname(__file__), "..", "app", "profile_chunks.json")
 OUT_PATH = os.path.join(os.path.dirname(__file__), "..", "app", "profile_index.json")
+VECTORS_OUT_PATH = os.path.join(os.path.dirname(__file__), "..", "app", "profile_index.npy")
+META_OUT_PATH = os.path.join(os.path.dirname(__file__), "..", "app", "profile_index.meta.json")
 
 EMBED_MODEL = os.getenv("PROFILE_EMBED_MODEL", "gemini-embedding-001")
 OUTPUT_DIM = int(os.getenv("PROFILE_EMBED_DIM", "256"))
+INDEX_FORMAT = os.getenv("PROFILE_INDEX_FORMAT", "binary").strip().lower()  # binary | json | both
+INDEX_DTYPE = os.getenv("PROFILE_INDEX_DTYPE", "float32").strip().lower()  # float32 | float16
 
+EMBED_BATCH_SIZE = int(os.getenv("PROFILE_EMBED_BATCH_SIZE", "32"))
+EMBED_WORKERS = int(os.getenv("PROFILE_EMBED_WORKERS", "4"))
+EMBED_RPM = float(os.getenv("PROFILE_EMBED_RPM", "60"))
+EMBED_RETRIES = int(os.getenv("PROFILE_EMBED_RETRIES", "4"))
 
-def _extract_vector(embed_result: Any) -> Optional[List[float]]:
-    # Mirrors backend/app/retrieval.py
+
+def _values(embedding: Any) -> Optional[List[float]]:
+    # Dicts first: every dict has a .values() method.
+    if isinstance(embedding, dict):
+        return [float(x) for x in embedding["values"]] if "values" in embedding else None
+    if hasattr(embedding, "values"):
+        return [float(x) for x in list(getattr(embedding, "values"))]
+    return None
+
+
+def _extract_vectors(embed_result: Any) -> List[Optional[List[float]]]:
+    """Return one vector per embedded text, in request order."""
     if embed_result is None:
-        return None
+        return []
 
     if isinstance(embed_result, dict):
         if "embedding" in embed_result and isinstance(embed_result["embedding"], dict):
-            v = embed_result["embedding"].get("values")
-            if isinstance(v, list):
-                return [float(x) for x in v]
-        if "embeddings" in embed_result and isinstance(embed_result["embeddings"], list) and embed_result["embeddings"]:
-            e0 = embed_result["embeddings"][0]
-            if isinstance(e0, dict) and "values" in e0:
-                return [float(x) for x in e0["values"]]
+            return [_values(embed_result["embedding"])]
+        if "embeddings" in embed_result and isinstance(embed_result["embeddings"], list):
+            return [_values(e) for e in embed_result["embeddings"]]
 
     if hasattr(embed_result, "embedding"):
-        emb = getattr(embed_result, "embedding")
-        if hasattr(emb, "values"):
-            return [float(x) for x in list(getattr(emb, "values"))]
-        if isinstance(emb, dict) and "values" in emb:
-            return [float(x) for x in emb["values"]]
+        return [_values(getattr(embed_result, "embedding"))]
 
     if hasattr(embed_result, "embeddings"):
         embs = getattr(embed_result, "embeddings")
-        if isinstance(embs, list) and embs:
-            e0 = embs[0]
-            if hasattr(e0, "values"):
-                return [float(x) for x in list(getattr(e0, "values"))]
-            if isinstance(e0, dict) and "values" in e0:
-                return [float(x) for x in e0["values"]]
+        if isinstance(embs, list):
+            return [_values(e) for e in embs]
 
-    return None
+    return []
+
+
+def _extract_vector(embed_result: Any) -> Optional[List[float]]:
+    # Mirrors backend/app/retrieval.py
+    vectors = _extract_vectors(embed_result)
+    return vectors[0] if vectors else None
+
+
+def _embed_input(title: str, text: str) -> str:
+    # Batched calls share one config, so the per-document title cannot go in
+    # EmbedContentConfig(title=...). Fold it into the content instead.
+    return f"title: {title} | text: {text}" if title else text
+
+
+def content_hash(title: str, text: str, model: str = EMBED_MODEL, dim: int = OUTPUT_DIM) -> str:
+    payload = json.dumps([model, dim, _embed_input(title, text)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def load_previous_vectors(model: str = EMBED_MODEL, dim: int = OUTPUT_DIM) -> Dict[str, List[float]]:
+    """Map content hash -> vector from whatever artifact the last build left.
+
+    Vectors from a different model or dimension are never reused, and neither
+    are legacy JSON rows without a recorded hash: those were embedded from the
+    text with the title passed in the config, not from _embed_input(), so
+    they are re-embedded once on the first incremental build.
+    """
+    reusable: Dict[str, List[float]] = {}
+
+    if os.path.exists(META_OUT_PATH) and os.path.exists(VECTORS_OUT_PATH):
+        try:
+            import numpy as np
+
+            with open(META_OUT_PATH, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("model") == model and int(meta.get("output_dimensionality") or 0) == dim:
+                matrix = np.load(VECTORS_OUT_PATH, mmap_mode="r")
+                invalid = set(meta.get("invalid_rows") or [])
+                for row, item in enumerate(meta.get("items") or []):
+                    if item.get("sha") and row not in invalid and row < matrix.shape[0]:
+                        reusable[item["sha"]] = [float(x) for x in matrix[row]]
+        except (ImportError, OSError, ValueError):
+            pass
+
+    if os.path.exists(OUT_PATH):
+        try:
+            with open(OUT_PATH, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+        except (OSError, ValueError):
+            legacy = {}
+        if legacy.get("model") == model and int(legacy.get("output_dimensionality") or 0) == dim:
+            for item in legacy.get("items") or []:
+                vec = item.get("embedding")
+                if item.get("sha") and isinstance(vec, list) and vec:
+                    reusable.setdefault(item["sha"], vec)
+
+    return reusable
+
+
+class _Pacer:
+    """Space embed_content calls across worker threads to stay under an RPM cap.
+
+    A rate-limit error pushes the next slot back for every worker, so one 429
+    slows the whole build instead of each thread hammering the API in turn.
+    """
+
+    def __init__(self, rpm: float):
+        self.interval = 60.0 / rpm if rpm > 0 else 0.0
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def back_off(self, seconds: float) -> None:
+        with self.lock:
+            self.next_slot = max(self.next_slot, time.monotonic() + seconds)
+
+
+def _is_rate_limit_error(err_msg: str) -> bool:
+    text = err_msg.upper()
+    return any(token in text for token in ["429", "QUOTA", "RESOURCE_EXHAUSTED", "RATE LIMIT", "RATE_LIMIT"])
+
+
+def _embed_batch(
+    client: Any,
+    texts: List[str],
+    make_config: Callable[[], Any],
+    pacer: _Pacer,
+    model: str,
+    retries: int,
+) -> List[List[float]]:
+    for attempt in range(retries + 1):
+        pacer.wait()
+        try:
+            res = client.models.embed_content(model=model, contents=texts, config=make_config())
+        except Exception as exc:
+            if attempt >= retries or not _is_rate_limit_error(str(exc)):
+                raise
+            pacer.back_off(min(2 ** attempt, 30) + random.random())
+            continue
+        vectors = _extract_vectors(res)
+        if len(vectors) != len(texts) or not all(vectors):
+            raise RuntimeError(f"embed_content returned {len(vectors)} vectors for {len(texts)} texts")
+        return [[round(float(x), 8) for x in vec] for vec in vectors]
+    raise RuntimeError("unreachable")
+
+
+def embed_chunks(
+    client: Any,
+    chunks: List[Dict[str, Any]],
+    *,
+    previous: Optional[Dict[str, List[float]]] = None,
+    make_config: Callable[[], Any] = lambda: None,
+    model: str = EMBED_MODEL,
+    dim: int = OUTPUT_DIM,
+    batch_size: int = EMBED_BATCH_SIZE,
+    workers: int = EMBED_WORKERS,
+    rpm: float = EMBED_RPM,
+    retries: int = EMBED_RETRIES,
+) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """Return index items for chunks, embedding only what the manifest lacks.
+
+    client only needs models.embed_content(model=, contents=, config=), so a
+    fake client works for tests and dry runs.
+    """
+    previous = previous or {}
+    items: List[Dict[str, Any]] = []
+    pending: Dict[str, List[int]] = {}  # sha -> item positions still missing a vector
+    pending_inputs: Dict[str, str] = {}
+
+    for c in chunks:
+        title = (c.get("title") or "").strip()
+        text = (c.get("text") or "").strip()
+        if not text:
+            continue
+        sha = content_hash(title, text, model, dim)
+        item = {"id": c.get("id"), "title": title, "text": text, "sha": sha, "embedding": previous.get(sha)}
+        if item["embedding"] is None:
+            pending.setdefault(sha, []).append(len(items))
+            pending_inputs[sha] = _embed_input(title, text)
+        items.append(item)
+
+    shas = list(pending)
+    batches = [shas[i:i + max(batch_size, 1)] for i in range(0, len(shas), max(batch_size, 1))]
+    pacer = _Pacer(rpm)
+
+    def run(batch: List[str]) -> Tuple[List[str], List[List[float]]]:
+        texts = [pending_inputs[sha] for sha in batch]
+        return batch, _embed_batch(client, texts, make_config, pacer, model, retries)
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        for batch, vectors in pool.map(run, batches):
+            for sha, vec in zip(batch, vectors):
+                for pos in pending[sha]:
+                    items[pos]["embedding"] = vec
+
+    stats = {
+        "total": len(items),
+        "reused": len(items) - sum(len(positions) for positions in pending.values()),
+        "embedded": len(shas),
+        "calls": len(batches),
+    }
+    return items, stats
+
+
+def write_binary_index(items: List[Dict[str, Any]], meta: Dict[str, Any], dtype: str = INDEX_DTYPE) -> None:
+    """Write the .npy matrix and its metadata sidecar.
+
+    Rows are L2-normalized here so the runtime can memory-map the matrix and
+    score it with a single product, without touching every page at startup.
+    """
+    import numpy as np
+
+    if dtype not in ("float32", "float16"):
+        raise SystemExit(f"Unsupported PROFILE_INDEX_DTYPE: {dtype}")
+
+    dim = int(meta["output_dimensionality"])
+    matrix = np.zeros((len(items), dim), dtype=np.float32)
+    invalid_rows: List[int] = []
+    for row, item in enumerate(items):
+        vec = np.asarray(item["embedding"], dtype=np.float32)
+        norm = float(np.linalg.norm(vec)) if vec.shape == (dim,) else 0.0
+        if norm <= 0.0:
+            invalid_rows.append(row)
+            continue
+        matrix[row] = vec / norm
+
+    sidecar = dict(meta)
+    sidecar["dtype"] = dtype
+    sidecar["invalid_rows"] = invalid_rows
+    sidecar["items"] = [{"id": item["id"], "title": item["title"], "sha": item.get("sha")} for item in items]
+
+    os.makedirs(os.path.dirname(VECTORS_OUT_PATH), exist_ok=True)
+    np.save(VECTORS_OUT_PATH, matrix.astype(dtype))
+    with open(META_OUT_PATH, "w", encoding="utf-8") as f:
+        json.dump(sidecar, f, ensure_ascii=False, indent=2)
+
+
+def write_json_index(items: List[Dict[str, Any]], meta: Dict[str, Any]) -> None:
+    out = dict(meta)
+    out["items"] = items
+    os.makedirs(os.path.dirname(OUT_PATH), exist_ok=True)
+    with open(OUT_PATH, "w", encoding="utf-8") as f:
+        json.dump(out, f, ensure_ascii=False)
 
 
 def main() -> None:
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         raise SystemExit("Missing GEMINI_API_KEY")
+    if INDEX_FORMAT not in ("binary", "json", "both"):
+        raise SystemExit(f"Unsupported PROFILE_INDEX_FORMAT: {INDEX_FORMAT}")
 
     from google import genai
     from google.genai import types
@@ -70,57 +305,32 @@ def main() -> None:
 
     client = genai.Client(api_key=api_key)
 
-    items: List[Dict[str, Any]] = []
-    for c in chunks:
-        title = (c.get("title") or "").strip()
-        text = (c.get("text") or "").strip()
-        if not text:
-            continue
-
+    def make_config() -> Any:
         # Prefer retrieval-aware embeddings for documents.
-        cfg_kwargs: Dict[str, Any] = {
-            "task_type": "RETRIEVAL_DOCUMENT",
-            "output_dimensionality": OUTPUT_DIM,
-        }
-        if title:
-            # Title is supported for RETRIEVAL_DOCUMENT and can improve quality.
-            cfg_kwargs["title"] = title
-
         try:
-            cfg = types.EmbedContentConfig(**cfg_kwargs)
+            return types.EmbedContentConfig(task_type="RETRIEVAL_DOCUMENT", output_dimensionality=OUTPUT_DIM)
         except TypeError:
             # Fallback for older SDKs
-            cfg = types.EmbedContentConfig()
-
-        res = client.models.embed_content(model=EMBED_MODEL, contents=text, config=cfg)
-        vec = _extract_vector(res)
-        if not vec:
-            raise RuntimeError(f"Failed to embed chunk: {c.get('id')}")
-
-        # Keep file smaller: round floats a bit (good enough for similarity search).
-        vec = [round(float(x), 8) for x in vec]
+            return types.EmbedContentConfig()
 
-        items.append({
-            "id": c.get("id"),
-            "title": title,
-            "text": text,
-            "embedding": vec,
-        })
+    items, stats = embed_chunks(client, chunks, previous=load_previous_vectors(), make_config=make_config)
+    print(
+        f"Embedded {stats['embedded']} new/changed chunks in {stats['calls']} calls; "
+        f"reused {stats['reused']} of {stats['total']}."
+    )
 
-        time.sleep(0.05)  # gentle pacing
-
-    out = {
+    meta = {
         "model": EMBED_MODEL,
         "output_dimensionality": OUTPUT_DIM,
         "created_unix": int(time.time()),
-        "items": items,
     }
 
-    os.makedirs(os.path.dirname(OUT_PATH), exist_ok=True)
-    with open(OUT_PATH, "w", encoding="utf-8") as f:
-        json.dump(out, f, ensure_ascii=False)
-
-    print(f"Wrote {OUT_PATH} with {len(items)} items (model={EMBED_MODEL}, dim={OUTPUT_DIM}).")
+    if INDEX_FORMAT in ("binary", "both"):
+        write_binary_index(items, meta)
+        print(f"Wrote {VECTORS_OUT_PATH} + {META_OUT_PATH} with {len(items)} items (model={EMBED_MODEL}, dim={OUTPUT_DIM}, dtype={INDEX_DTYPE}).")
+    if INDEX_FORMAT in ("json", "both"):
+        write_json_index(items, meta)
+        print(f"Wrote {OUT_PATH} with {len(items)} items (model={EMBED_MODEL}, dim={OUTPUT_DIM}).")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,391 @@
+"""Local stand-in for the Gemini and OpenAI HTTP APIs, for load tests.
+
+Serves just enough of each API for the backend's SDK calls:
+  POST /v1beta/models/{model}:generateContent        Gemini chat + audio
+  POST /v1beta/models/{model}:streamGenerateContent  Gemini streaming (SSE)
+  POST /v1/responses                                 OpenAI Responses (+ stream)
+  POST /v1/audio/transcriptions                      OpenAI transcription
+  GET  /_stats, POST /_config, POST /_reset          inspect / tune a running server
+
+Usage (from repo root):
+  python backend/scripts/fake_providers.py --port 8090 \\
+      --latency lognormal:400:0.5 --rate-429 0.05 --truncate 0.2
+
+then point the backend at it (any API key works):
+  GOOGLE_GEMINI_BASE_URL=http://127.0.0.1:8090 GEMINI_API_KEYS=k1,k2 \\
+  OPENAI_BASE_URL=http://127.0.0.1:8090/v1 OPENAI_API_KEY=sk-fake \\
+  uvicorn app.main:app
+
+and drive it with backend/scripts/load_driver.py.
+
+Latency specs (milliseconds, time to first byte): fixed:MS, uniform:LO:HI,
+lognormal:MEDIAN:SIGMA. --truncate makes that share of first answers stop
+mid-sentence with finishReason MAX_TOKENS (status "incomplete" on OpenAI), so
+the continuation path runs; continuation requests always finish cleanly. Any
+answer longer than the request's output-token cap is also cut at the cap
+with the same finish reason.
+--fail-models always answer 429, to exercise key/model fallback.
+
+OpenAI responses are stored (unless the request sends store=false), so a
+later request can continue one with previous_response_id; an unknown id gets
+the API's 400 previous_response_not_found. --no-store forgets every
+response, to exercise the fallback to resending the text. /_stats counts
+chained requests and the input characters actually received.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+SENTENCES = [
+    "I worked on network telemetry pipelines during my internship at Nokia.",
+    "My thesis looks at retrieval quality for small, curated knowledge bases.",
+    "On the Hermis project I owned the data ingestion and evaluation tooling.",
+    "I usually start by measuring where the time actually goes before optimizing anything.",
+    "Python is my main language, and I am comfortable with C++ for performance-critical parts.",
+    "I like shipping small, reviewable changes and keeping a tight feedback loop with users.",
+    "When a teammate disagrees, I try to turn the discussion into an experiment we can run.",
+    "I enjoy turning research prototypes into services that other people can rely on.",
+]
+TRANSCRIPT = "Can you tell me about your internship at Nokia and what you built there"
+
+CONFIG: Dict[str, Any] = {
+    "latency": "lognormal:400:0.5",
+    "chunk_delay_ms": 30.0,
+    "chunk_chars": 24,
+    "rate_429": 0.0,
+    "retry_after": 2.0,
+    "truncate": 0.0,
+    "reply_sentences": 4,
+    "fail_models": [],
+    "store_responses": True,
+}
+MAX_STORED_RESPONSES = 10000
+_stats: Counter = Counter()
+_stats_lock = threading.Lock()
+_stored: "OrderedDict[str, str]" = OrderedDict()  # response id -> input + output text so far
+
+app = FastAPI(title="Fake Gemini/OpenAI")
+
+
+def _count(*parts: str, amount: int = 1) -> None:
+    with _stats_lock:
+        _stats[":".join(parts)] += amount
+
+
+def sample_latency(spec: str, rng: random.Random = random) -> float:
+    """Seconds to wait before the first byte, drawn from a latency spec."""
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(":") if v]
+    if kind == "fixed":
+        ms = values[0]
+    elif kind == "uniform":
+        ms = rng.uniform(values[0], values[1])
+    elif kind == "lognormal":
+        ms = rng.lognormvariate(0.0, values[1] if len(values) > 1 else 0.5) * values[0]
+    else:
+        raise ValueError(f"Unknown latency spec: {spec}")
+    return max(ms, 0.0) / 1000.0
+
+
+def _answer(truncated: bool, continuation: bool) -> str:
+    if continuation:
+        return "That is the rest of it, and I am happy to go deeper on any part."
+    text = " ".join(random.sample(SENTENCES, k=min(CONFIG["reply_sentences"], len(SENTENCES))))
+    if truncated:
+        # Long enough for _needs_continue and cut mid-word, like a real output cap.
+        text = text[: max(len(text) * 2 // 3, 130)].rstrip(" .")
+    return text
+
+
+def _should_rate_limit(model: str) -> bool:
+    return model in CONFIG["fail_models"] or random.random() < CONFIG["rate_429"]
+
+
+def _pieces(text: str) -> List[str]:
+    size = max(int(CONFIG["chunk_chars"]), 1)
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+def _tokens(text: str) -> int:
+    return max(len(text) // 4, 1)
+
+
+def _cap(text: str, max_tokens: Any) -> Tuple[str, bool]:
+    """Cut `text` at an output-token cap (4 chars a token); returns (text, was cut)."""
+    if not max_tokens or _tokens(text) <= int(max_tokens):
+        return text, False
+    return text[: int(max_tokens) * 4].rstrip(), True
+
+
+# -- Gemini ---------------------------------------------------------------------
+
+
+def _gemini_text_parts(body: Dict[str, Any]) -> Tuple[str, bool]:
+    """Return (last user text, has inline audio)."""
+    contents = body.get("contents") or []
+    last = contents[-1] if contents else {}
+    texts, audio = [], False
+    for part in last.get("parts") or []:
+        if "text" in part:
+            texts.append(part["text"])
+        if "inlineData" in part or "inline_data" in part:
+            audio = True
+    return " ".join(texts), audio
+
+
+def _gemini_chunk(text: str, finish: Optional[str], prompt_tokens: int) -> Dict[str, Any]:
+    candidate: Dict[str, Any] = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+    out: Dict[str, Any] = {"candidates": [candidate]}
+    if finish:
+        candidate["finishReason"] = finish
+        out["usageMetadata"] = {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": _tokens(text),
+            "totalTokenCount": prompt_tokens + _tokens(text),
+        }
+    return out
+
+
+def _gemini_429() -> JSONResponse:
+    retry = f"{CONFIG['retry_after']:g}s"
+    return JSONResponse(status_code=429, content={"error": {
+        "code": 429,
+        "message": "Resource has been exhausted (e.g. check quota).",
+        "status": "RESOURCE_EXHAUSTED",
+        "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": retry}],
+    }})
+
+
+@app.post("/{version}/models/{target}")
+async def gemini(version: str, target: str, request: Request) -> Any:
+    model, _, method = target.partition(":")
+    body = await request.json()
+    await asyncio.sleep(sample_latency(CONFIG["latency"]))
+    if _should_rate_limit(model):
+        _count("gemini", model, "429")
+        return _gemini_429()
+
+    last_text, audio = _gemini_text_parts(body)
+    prompt_tokens = _tokens(json.dumps(body))
+    if audio:
+        text, finish = TRANSCRIPT, "STOP"
+    else:
+        continuation = last_text.startswith("Continue exactly from where")
+        truncated = not continuation and random.random() < CONFIG["truncate"]
+        text, capped = _cap(_answer(truncated, continuation), (body.get("generationConfig") or {}).get("maxOutputTokens"))
+        finish = "MAX_TOKENS" if truncated or capped else "STOP"
+    _count("gemini", model, method, finish)
+
+    if method != "streamGenerateContent":
+        return _gemini_chunk(text, finish, prompt_tokens)
+
+    async def sse() -> AsyncIterator[str]:
+        pieces = _pieces(text)
+        for n, piece in enumerate(pieces):
+            if n:
+                await asyncio.sleep(CONFIG["chunk_delay_ms"] / 1000.0)
+            last = n == len(pieces) - 1
+            yield "data: " + json.dumps(_gemini_chunk(piece, finish if last else None, prompt_tokens)) + "\r\n\r\n"
+
+    return StreamingResponse(sse(), media_type="text/event-stream")
+
+
+# -- OpenAI ---------------------------------------------------------------------
+
+
+def _openai_429() -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        headers={"retry-after": f"{CONFIG['retry_after']:g}"},
+        content={"error": {"message": "Rate limit reached for requests", "type": "requests", "code": "rate_limit_exceeded"}},
+    )
+
+
+def _openai_response(response_id: str, model: str, text: str, truncated: bool, input_text: str) -> Dict[str, Any]:
+    return {
+        "id": response_id,
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": model,
+        "status": "incomplete" if truncated else "completed",
+        "incomplete_details": {"reason": "max_output_tokens"} if truncated else None,
+        "output": [{
+            "type": "message",
+            "id": "msg_" + response_id[5:],
+            "status": "incomplete" if truncated else "completed",
+            "role": "assistant",
+            "content": [{"type": "output_text", "text": text, "annotations": []}],
+        }],
+        "parallel_tool_calls": False,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {
+            "input_tokens": _tokens(input_text),
+            "output_tokens": _tokens(text),
+            "total_tokens": _tokens(input_text) + _tokens(text),
+        },
+    }
+
+
+def _store(response_id: str, context: str) -> None:
+    _stored[response_id] = context
+    while len(_stored) > MAX_STORED_RESPONSES:
+        _stored.popitem(last=False)
+
+
+def _event(payload: Dict[str, Any]) -> str:
+    return f"event: {payload['type']}\ndata: {json.dumps(payload)}\n\n"
+
+
+@app.post("/v1/responses")
+async def openai_responses(request: Request) -> Any:
+    body = await request.json()
+    model = body.get("model") or ""
+    input_text = body.get("input") if isinstance(body.get("input"), str) else json.dumps(body.get("input"))
+    await asyncio.sleep(sample_latency(CONFIG["latency"]))
+    if _should_rate_limit(model):
+        _count("openai", model, "429")
+        return _openai_429()
+
+    context = ""
+    previous_id = body.get("previous_response_id")
+    if previous_id:
+        stored = _stored.get(previous_id) if CONFIG["store_responses"] else None
+        if stored is None:
+            _count("openai", model, "previous_response_not_found")
+            return JSONResponse(status_code=400, content={"error": {
+                "message": f"Previous response with id '{previous_id}' not found.",
+                "type": "invalid_request_error",
+                "param": "previous_response_id",
+                "code": "previous_response_not_found",
+            }})
+        context = stored
+        _count("openai", model, "chained")
+    _count("openai", "input_chars", amount=len(input_text))
+
+    continuation = "Continue exactly from where" in input_text
+    truncated = not continuation and random.random() < CONFIG["truncate"]
+    text, capped = _cap(_answer(truncated, continuation), body.get("max_output_tokens"))
+    truncated = truncated or capped
+    response_id = "resp_" + uuid.uuid4().hex
+    # Stored context counts as input, as it is billed upstream.
+    final = _openai_response(response_id, model, text, truncated, context + input_text)
+    if CONFIG["store_responses"] and body.get("store", True):
+        _store(response_id, context + input_text + "\n" + text)
+    _count("openai", model, "responses", "incomplete" if truncated else "completed")
+
+    if not body.get("stream"):
+        return final
+
+    async def sse() -> AsyncIterator[str]:
+        seq = 0
+        started = dict(final, status="in_progress", output=[], usage=None, incomplete_details=None)
+        yield _event({"type": "response.created", "response": started, "sequence_number": seq})
+        for n, piece in enumerate(_pieces(text)):
+            if n:
+                await asyncio.sleep(CONFIG["chunk_delay_ms"] / 1000.0)
+            seq += 1
+            yield _event({
+                "type": "response.output_text.delta",
+                "item_id": final["output"][0]["id"],
+                "output_index": 0,
+                "content_index": 0,
+                "delta": piece,
+                "logprobs": [],
+                "sequence_number": seq,
+            })
+        seq += 1
+        done_type = "response.incomplete" if truncated else "response.completed"
+        yield _event({"type": done_type, "response": final, "sequence_number": seq})
+
+    return StreamingResponse(sse(), media_type="text/event-stream")
+
+
+@app.post("/v1/audio/transcriptions")
+async def openai_transcriptions(request: Request) -> Any:
+    form = await request.form()
+    model = str(form.get("model") or "")
+    upload = form.get("file")
+    data = await upload.read() if hasattr(upload, "read") else b""
+    await asyncio.sleep(sample_latency(CONFIG["latency"]))
+    if _should_rate_limit(model):
+        _count("openai", model, "429")
+        return _openai_429()
+    _count("openai", model, "transcriptions")
+    return {"text": TRANSCRIPT if any(data[44:]) else ""}
+
+
+# -- control --------------------------------------------------------------------
+
+
+@app.get("/_stats")
+def stats() -> Dict[str, int]:
+    with _stats_lock:
+        return dict(sorted(_stats.items()))
+
+
+@app.post("/_config")
+async def configure(request: Request) -> Dict[str, Any]:
+    updates = await request.json()
+    unknown = set(updates) - set(CONFIG)
+    if unknown:
+        return JSONResponse(status_code=400, content={"detail": f"Unknown settings: {sorted(unknown)}"})
+    if "latency" in updates:
+        sample_latency(updates["latency"])  # validate before applying
+    CONFIG.update(updates)
+    return CONFIG
+
+
+@app.post("/_reset")
+def reset() -> Dict[str, bool]:
+    with _stats_lock:
+        _stats.clear()
+    _stored.clear()
+    return {"ok": True}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake Gemini/OpenAI server for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", default=CONFIG["latency"], help="fixed:MS | uniform:LO:HI | lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--chunk-delay-ms", type=float, default=CONFIG["chunk_delay_ms"], help="gap between stream chunks")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="share of calls answered with 429")
+    parser.add_argument("--retry-after", type=float, default=CONFIG["retry_after"], help="Retry-After seconds on 429s")
+    parser.add_argument("--truncate", type=float, default=0.0, help="share of first answers cut at the output cap")
+    parser.add_argument("--fail-models", default="", help="comma separated models that always return 429")
+    parser.add_argument("--no-store", action="store_true", help="keep no OpenAI responses, so previous_response_id always fails")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    sample_latency(args.latency)
+    if args.seed is not None:
+        random.seed(args.seed)
+    CONFIG.update(
+        latency=args.latency,
+        chunk_delay_ms=args.chunk_delay_ms,
+        rate_429=args.rate_429,
+        retry_after=args.retry_after,
+        truncate=args.truncate,
+        fail_models=[m.strip() for m in args.fail_models.split(",") if m.strip()],
+        store_responses=not args.no_store,
+    )
+
+    import uvicorn
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""Open-loop load driver for /api/chat, /api/chat/stream and /api/transcribe.
+
+Requests are launched on a fixed schedule at the target rate whether or not
+earlier ones have finished, so a slow backend shows up as growing latency and
+errors instead of a quietly lower request rate.
+
+Usage (from repo root, with the API running, e.g. against fake_providers.py):
+  python backend/scripts/load_driver.py --url http://127.0.0.1:8000 --rps 20 --duration 30
+  python backend/scripts/load_driver.py --mix chat=6,stream=2,transcribe=2 --poisson \\
+      --fake-url http://127.0.0.1:8090 --json results.json
+
+Reports, per endpoint: requests sent, achieved throughput, latency
+p50/p90/p99/max, time to first byte for the stream, and errors by status
+code or exception. --fake-url also prints the fake server's upstream call
+counts (429s, fallbacks, truncations) for the run.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import math
+import random
+import struct
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List
+
+import httpx
+
+
+QUESTIONS = [
+    "Tell me about yourself.",
+    "What did you work on during your Nokia internship?",
+    "What is your thesis about?",
+    "Explain the Hermis project and your role in it.",
+    "Why should we hire you?",
+    "What are your biggest strengths and weaknesses?",
+    "Describe a challenging bug you fixed.",
+    "How do you approach system design for a new service?",
+    "What machine learning models have you trained and deployed?",
+    "Where do you see yourself in five years?",
+]
+
+
+def speech_like_wav(seconds: float, rate: int = 16000, seed: int = 1) -> bytes:
+    """16-bit mono PCM WAV with a modulated tone, so it is not pure silence."""
+    rng = random.Random(seed)
+    frames = bytearray()
+    for n in range(int(seconds * rate)):
+        envelope = 0.5 + 0.5 * math.sin(2 * math.pi * 3 * n / rate)
+        sample = envelope * math.sin(2 * math.pi * 220 * n / rate) + rng.uniform(-0.05, 0.05)
+        frames += struct.pack("<h", int(max(-1.0, min(1.0, sample)) * 12000))
+    header = b"RIFF" + struct.pack("<I", 36 + len(frames)) + b"WAVE"
+    header += b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, rate, rate * 2, 2, 16)
+    header += b"data" + struct.pack("<I", len(frames))
+    return header + bytes(frames)
+
+
+def chat_payload(n: int, mode: str, repeat_ratio: float, history: int) -> Dict[str, Any]:
+    question = random.choice(QUESTIONS)
+    if random.random() >= repeat_ratio:
+        question += f" (load test #{n})"  # unique text, so the reply cache does not answer it
+    messages: List[Dict[str, str]] = [{"role": "assistant", "content": "Hi, I'm Ansuk. Ask me anything."}]
+    for _ in range(history):
+        messages.append({"role": "user", "content": random.choice(QUESTIONS)})
+        messages.append({"role": "assistant", "content": "I worked on telemetry pipelines and retrieval quality."})
+    messages.append({"role": "user", "content": question})
+    return {"messages": messages, "app_mode": mode}
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(round(pct / 100.0 * (len(sorted_values) - 1))), len(sorted_values) - 1)]
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.ttfb: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Counter] = defaultdict(Counter)
+        self.sent: Counter = Counter()
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for kind in sorted(self.sent):
+            ok = sorted(self.latencies[kind])
+            failed = sum(self.errors[kind].values())
+            row = {
+                "sent": self.sent[kind],
+                "ok": len(ok),
+                "error_rate": round(failed / self.sent[kind], 4) if self.sent[kind] else 0.0,
+                "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+                "p50_ms": round(_percentile(ok, 50) * 1000, 1),
+                "p90_ms": round(_percentile(ok, 90) * 1000, 1),
+                "p99_ms": round(_percentile(ok, 99) * 1000, 1),
+                "max_ms": round((ok[-1] if ok else 0.0) * 1000, 1),
+                "errors": dict(self.errors[kind]),
+            }
+            if self.ttfb[kind]:
+                first = sorted(self.ttfb[kind])
+                row["ttfb_p50_ms"] = round(_percentile(first, 50) * 1000, 1)
+                row["ttfb_p99_ms"] = round(_percentile(first, 99) * 1000, 1)
+            out[kind] = row
+        return out
+
+
+async def one_request(client: httpx.AsyncClient, kind: str, n: int, args: argparse.Namespace, audio: bytes, rec: Recorder) -> None:
+    rec.sent[kind] += 1
+    started = time.perf_counter()
+    try:
+        if kind == "chat":
+            resp = await client.post("/api/chat", json=chat_payload(n, args.mode, args.repeat_ratio, args.history))
+        elif kind == "stream":
+            payload = chat_payload(n, args.mode, args.repeat_ratio, args.history)
+            async with client.stream("POST", "/api/chat/stream", json=payload) as resp:
+                failed = None
+                first = None
+                async for line in resp.aiter_lines():
+                    if first is None and line.startswith("event: delta"):
+                        first = time.perf_counter() - started
+                    elif line.startswith("event: error"):
+                        failed = "stream error event"
+                if first is not None:
+                    rec.ttfb[kind].append(first)
+                if failed and resp.status_code < 400:
+                    rec.errors[kind][failed] += 1
+                    return
+        else:
+            files = {"file": ("speech.wav", io.BytesIO(audio), "audio/wav")}
+            resp = await client.post("/api/transcribe", files=files)
+    except Exception as exc:
+        rec.errors[kind][type(exc).__name__] += 1
+        return
+    if resp.status_code >= 400:
+        rec.errors[kind][str(resp.status_code)] += 1
+        return
+    rec.latencies[kind].append(time.perf_counter() - started)
+
+
+async def drive(args: argparse.Namespace) -> Dict[str, Any]:
+    mix = {}
+    for part in args.mix.split(","):
+        kind, _, weight = part.partition("=")
+        mix[kind.strip()] = float(weight or 1)
+    unknown = set(mix) - {"chat", "stream", "transcribe"}
+    if unknown:
+        raise SystemExit(f"Unknown request kinds in --mix: {sorted(unknown)}")
+    kinds, weights = list(mix), list(mix.values())
+    audio = speech_like_wav(args.audio_seconds)
+    rec = Recorder()
+
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        if args.fake_url:
+            await client.post(f"{args.fake_url}/_reset")
+        tasks = []
+        started = time.perf_counter()
+        next_at = started
+        n = 0
+        while next_at - started < args.duration:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            kind = random.choices(kinds, weights)[0]
+            tasks.append(asyncio.ensure_future(one_request(client, kind, n, args, audio, rec)))
+            n += 1
+            gap = random.expovariate(args.rps) if args.poisson else 1.0 / args.rps
+            next_at += gap
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+        report: Dict[str, Any] = {"target_rps": args.rps, "elapsed_s": round(elapsed, 2), "endpoints": rec.summary(elapsed)}
+        if args.fake_url:
+            report["upstream_calls"] = (await client.get(f"{args.fake_url}/_stats")).json()
+    return report
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"target {report['target_rps']} rps over {report['elapsed_s']}s")
+    for kind, row in report["endpoints"].items():
+        ttfb = f"  ttfb p50 {row['ttfb_p50_ms']}ms p99 {row['ttfb_p99_ms']}ms" if "ttfb_p50_ms" in row else ""
+        print(
+            f"{kind:<11} sent {row['sent']:>6}  ok {row['ok']:>6}  {row['throughput_rps']:>7} rps  "
+            f"p50 {row['p50_ms']}ms  p90 {row['p90_ms']}ms  p99 {row['p99_ms']}ms  max {row['max_ms']}ms  "
+            f"errors {row['error_rate']:.1%} {row['errors'] or ''}{ttfb}"
+        )
+    if report.get("upstream_calls"):
+        print("upstream calls:")
+        for name, count in report["upstream_calls"].items():
+            print(f"  {name:<60} {count}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Open-loop load driver for the chat API")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="backend base URL")
+    parser.add_argument("--rps", type=float, default=10.0, help="target requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to keep sending")
+    parser.add_argument("--mix", default="chat=8,transcribe=2", help="weights for chat, stream and transcribe")
+    parser.add_argument("--mode", default="quota_saver", help="app_mode sent with chat requests")
+    parser.add_argument("--history", type=int, default=2, help="earlier question/answer pairs per chat request")
+    parser.add_argument("--repeat-ratio", type=float, default=0.0, help="share of chats reusing a cacheable question")
+    parser.add_argument("--audio-seconds", type=float, default=3.0, help="length of the generated WAV upload")
+    parser.add_argument("--poisson", action="store_true", help="exponential gaps instead of a fixed interval")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--max-connections", type=int, default=1000)
+    parser.add_argument("--fake-url", help="fake_providers.py base URL, to reset and report its counters")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    report = asyncio.run(drive(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    total_errors = sum(sum(row["errors"].values()) for row in report["endpoints"].values())
+    sys.exit(1 if total_errors and not any(row["ok"] for row in report["endpoints"].values()) else 0)
+
+
+if __name__ == "__main__":
+    main()
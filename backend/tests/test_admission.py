@@ -0,0 +1,197 @@
+"""Admission control: concurrency slots, queue limits, shedding and per-client fairness."""
+
+import asyncio
+import json
+
+import pytest
+
+from app.admission import AdmissionController, Rejected
+from app.main import AdmissionMiddleware
+
+
+def _controller(max_concurrent=1, max_queue=4, max_wait_seconds=1.0, client_share=1.0):
+    return AdmissionController("test", max_concurrent, max_queue, max_wait_seconds, client_share)
+
+
+async def _hold(controller, client, release):
+    async with controller.slot(client):
+        await release.wait()
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_admits_up_to_max_concurrent_without_waiting():
+    async def scenario():
+        controller = _controller(max_concurrent=2)
+        async with controller.slot("a") as first, controller.slot("b") as second:
+            assert (first, second) == (0.0, 0.0)
+            assert controller.running == 2 and controller.queued() == 0
+        assert controller.running == 0
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_is_shed_with_503_and_retry_after():
+    async def scenario():
+        controller = _controller(max_concurrent=1, max_queue=1)
+        release = asyncio.Event()
+        holders = [asyncio.create_task(_hold(controller, client, release)) for client in ("a", "b")]
+        await _settle()
+        assert controller.running == 1 and controller.queued() == 1
+
+        with pytest.raises(Rejected) as rejected:
+            async with controller.slot("c"):
+                pass
+        release.set()
+        await asyncio.gather(*holders)
+        return rejected.value
+
+    rejected = asyncio.run(scenario())
+    assert (rejected.status_code, rejected.reason) == (503, "queue_full")
+    assert rejected.retry_after >= 1
+
+
+def test_wait_past_the_timeout_is_shed_with_503():
+    async def scenario():
+        controller = _controller(max_wait_seconds=0.05)
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(controller, "a", release))
+        await _settle()
+        with pytest.raises(Rejected) as rejected:
+            async with controller.slot("b"):
+                pass
+        assert controller.queued() == 0
+        release.set()
+        await holder
+        return rejected.value
+
+    assert asyncio.run(scenario()).reason == "timeout"
+
+
+def test_expected_wait_over_budget_is_shed_up_front():
+    async def scenario():
+        controller = _controller(max_wait_seconds=1.0)
+        controller.service_seconds = 5.0
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(controller, "a", release))
+        await _settle()
+        with pytest.raises(Rejected) as rejected:
+            async with controller.slot("b"):
+                pass
+        release.set()
+        await holder
+        return rejected.value
+
+    rejected = asyncio.run(scenario())
+    assert (rejected.status_code, rejected.reason) == (503, "deadline")
+    assert rejected.retry_after >= 5
+
+
+def test_client_over_its_share_gets_429():
+    async def scenario():
+        controller = _controller(max_concurrent=2, max_queue=2, client_share=0.25)
+        async with controller.slot("a"):
+            with pytest.raises(Rejected) as rejected:
+                async with controller.slot("a"):
+                    pass
+            async with controller.slot("b"):
+                pass
+        return rejected.value
+
+    rejected = asyncio.run(scenario())
+    assert (rejected.status_code, rejected.reason) == (429, "client_share")
+
+
+def test_waiters_are_served_round_robin_per_client():
+    async def scenario():
+        controller = _controller(max_concurrent=1, max_queue=8)
+        order = []
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(controller, "first", release))
+        await _settle()
+
+        async def request(client, label):
+            async with controller.slot(client):
+                order.append(label)
+
+        waiting = []
+        for client, label in (("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1"), ("c", "c1")):
+            waiting.append(asyncio.create_task(request(client, label)))
+            await _settle()
+        release.set()
+        await asyncio.gather(holder, *waiting)
+        return order
+
+    assert asyncio.run(scenario()) == ["a1", "b1", "c1", "a2", "a3"]
+
+
+class _BlockingApp:
+    """Inner ASGI app that answers 200 once `release` is set."""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.started = 0
+
+    async def __call__(self, scope, receive, send):
+        self.started += 1
+        await self.release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def _request(middleware, path="/limited", client="10.0.0.1"):
+    scope = {"type": "http", "method": "POST", "path": path, "headers": [], "client": (client, 1234)}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await middleware(scope, receive, send)
+    start = next(m for m in sent if m["type"] == "http.response.start")
+    body = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+    return start["status"], dict(start["headers"]), body
+
+
+def test_middleware_sheds_with_status_and_retry_after():
+    async def scenario():
+        inner = _BlockingApp()
+        controller = _controller(max_concurrent=1, max_queue=0, client_share=1.0)
+        middleware = AdmissionMiddleware(inner, {"/limited": controller})
+        first = asyncio.create_task(_request(middleware))
+        await _settle()
+        shed = await _request(middleware, client="10.0.0.2")
+        unlimited = asyncio.create_task(_request(middleware, path="/healthz"))
+        await _settle()
+        inner.release.set()
+        return await first, shed, await unlimited, inner.started
+
+    first, shed, unlimited, started = asyncio.run(scenario())
+    assert first[0] == 200 and unlimited[0] == 200
+    status, headers, body = shed
+    assert status == 503
+    assert int(headers[b"retry-after"]) >= 1
+    assert "busy" in json.loads(body)["detail"]
+    assert started == 2
+
+
+def test_middleware_returns_429_for_a_client_over_its_share():
+    async def scenario():
+        inner = _BlockingApp()
+        controller = _controller(max_concurrent=2, max_queue=2, client_share=0.25)
+        middleware = AdmissionMiddleware(inner, {"/limited": controller})
+        first = asyncio.create_task(_request(middleware))
+        await _settle()
+        second = await _request(middleware)
+        inner.release.set()
+        await first
+        return second
+
+    status, headers, _ = asyncio.run(scenario())
+    assert status == 429
+    assert b"retry-after" in headers
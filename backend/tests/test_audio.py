@@ -0,0 +1,95 @@
+"""Audio preprocessing: silence trimming, downmix/resample, and the silent-clip short cut."""
+
+import io
+import wave
+
+import numpy as np
+import pytest
+
+from app import audio
+from app.audio import prepare_audio
+
+
+def _clip(rate, segments, channels=1):
+    """Concatenate (seconds, amplitude) segments: amplitude 0 is silence, otherwise a 440 Hz tone."""
+    parts = []
+    for seconds, amplitude in segments:
+        t = np.arange(int(seconds * rate)) / rate
+        parts.append(amplitude * np.sin(2 * np.pi * 440.0 * t))
+    mono = np.concatenate(parts)
+    return np.repeat(mono[:, None], channels, axis=1)
+
+
+def _wav(samples, rate):
+    out = io.BytesIO()
+    with wave.open(out, "wb") as wav:
+        wav.setnchannels(samples.shape[1])
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes((samples * 32767).astype("<i2").tobytes())
+    return out.getvalue()
+
+
+def _read(data):
+    with wave.open(io.BytesIO(data), "rb") as wav:
+        return wav.getframerate(), wav.getnchannels(), wav.getnframes() / wav.getframerate()
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    monkeypatch.setenv("AUDIO_PREPROCESS", "1")
+
+
+def test_silence_padding_is_trimmed_and_the_clip_resampled_to_16k_mono():
+    data = _wav(_clip(48000, [(2.0, 0.0), (1.0, 0.3), (2.0, 0.0)], channels=2), 48000)
+
+    prepared = prepare_audio(data, "audio/wav")
+
+    assert not prepared["silent"] and prepared["mime"] == "audio/wav"
+    rate, channels, seconds = _read(prepared["audio"])
+    assert (rate, channels) == (audio.TARGET_RATE, 1)
+    # One second of speech plus VAD_PAD_MS on each side, to within a frame.
+    expected = 1.0 + 2 * audio.VAD_PAD_MS / 1000.0
+    assert abs(seconds - expected) <= 2 * audio.FRAME_MS / 1000.0
+    assert prepared["bytes_saved"] == len(data) - len(prepared["audio"]) > 0.9 * len(data)
+
+
+def test_raw_l16_pcm_with_a_rate_parameter_is_trimmed():
+    samples = _clip(8000, [(1.0, 0.0), (0.5, 0.3), (1.0, 0.0)])[:, 0]
+    data = (samples * 32767).astype(">i2").tobytes()
+
+    prepared = prepare_audio(data, "audio/L16;rate=8000")
+
+    assert prepared["mime"] == "audio/wav"
+    assert abs(_read(prepared["audio"])[2] - (0.5 + 2 * audio.VAD_PAD_MS / 1000.0)) <= 0.05
+
+
+@pytest.mark.parametrize("segments", [[(3.0, 0.0)], [(3.0, 0.001)], [(1.0, 0.0), (0.06, 0.5), (1.0, 0.0)]])
+def test_clip_without_enough_speech_is_flagged_silent(segments):
+    data = _wav(_clip(16000, segments), 16000)
+
+    prepared = prepare_audio(data, "audio/wav")
+
+    assert prepared["silent"] is True
+    assert prepared["audio"] == b""
+    assert prepared["bytes_saved"] == len(data)
+
+
+def test_clip_that_would_not_shrink_is_sent_unchanged():
+    data = _wav(_clip(16000, [(1.0, 0.3)]), 16000)
+    prepared = prepare_audio(data, "audio/wav")
+    assert prepared["audio"] is data and prepared["bytes_saved"] == 0
+
+
+@pytest.mark.parametrize("mime", ["audio/wav", "application/octet-stream"])
+def test_undecodable_or_unknown_audio_passes_through(mime):
+    data = b"not audio at all" * 100
+    prepared = prepare_audio(data, mime)
+    assert prepared == {"audio": data, "mime": mime, "silent": False, "original_bytes": len(data), "bytes_saved": 0}
+
+
+def test_preprocessing_can_be_switched_off(monkeypatch):
+    monkeypatch.setenv("AUDIO_PREPROCESS", "0")
+    data = _wav(_clip(16000, [(2.0, 0.0)]), 16000)
+    prepared = prepare_audio(data, "audio/wav")
+    assert prepared["audio"] is data and not prepared["silent"]
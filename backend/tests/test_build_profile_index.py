@@ -0,0 +1,143 @@
+"""Incremental index builds: the content-hash manifest decides what gets embedded."""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+import build_profile_index as builder  # noqa: E402
+
+DIM = 8
+
+
+class FakeEmbedClient:
+    """Stands in for genai.Client: a deterministic vector per input text."""
+
+    def __init__(self) -> None:
+        self.models = self
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def embed_content(self, model, contents, config=None):
+        with self._lock:
+            self.calls.append(list(contents))
+        return {"embeddings": [{"values": _vector(text)} for text in contents]}
+
+
+def _vector(text):
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [b / 255.0 + 0.01 for b in digest[:DIM]]
+
+
+def _chunks(n):
+    return [{"id": f"c{i}", "title": f"Title {i}", "text": f"Body text number {i}."} for i in range(n)]
+
+
+@pytest.fixture
+def artifact(tmp_path, monkeypatch):
+    monkeypatch.setattr(builder, "VECTORS_OUT_PATH", str(tmp_path / "profile_index.npy"))
+    monkeypatch.setattr(builder, "META_OUT_PATH", str(tmp_path / "profile_index.meta.json"))
+    monkeypatch.setattr(builder, "OUT_PATH", str(tmp_path / "profile_index.json"))
+    return tmp_path
+
+
+def _build(chunks, client, *, fmt="binary", model="test-model", dim=DIM, batch_size=2):
+    previous = builder.load_previous_vectors(model, dim)
+    items, stats = builder.embed_chunks(
+        client, chunks, previous=previous, model=model, dim=dim, batch_size=batch_size, workers=3, rpm=0
+    )
+    meta = {"model": model, "output_dimensionality": dim}
+    if fmt == "binary":
+        builder.write_binary_index(items, meta, dtype="float32")
+    else:
+        builder.write_json_index(items, meta)
+    return items, stats
+
+
+def test_first_build_embeds_everything_in_batches(artifact):
+    client = FakeEmbedClient()
+    items, stats = _build(_chunks(5), client)
+    assert stats == {"total": 5, "reused": 0, "embedded": 5, "calls": 3}
+    assert [len(call) for call in sorted(client.calls, key=len)] == [1, 2, 2]
+    assert all(item["embedding"] == pytest.approx(_vector(builder._embed_input(item["title"], item["text"]))) for item in items)
+
+
+def test_rebuild_embeds_only_changed_chunks(artifact):
+    chunks = _chunks(6)
+    _build(chunks, FakeEmbedClient())
+
+    client = FakeEmbedClient()
+    _, stats = _build(chunks, client)
+    assert stats["embedded"] == 0 and stats["calls"] == 0 and client.calls == []
+
+    chunks[3]["text"] = "Edited body."
+    chunks.append({"id": "new", "title": "", "text": "Added later."})
+    client = FakeEmbedClient()
+    items, stats = _build(chunks, client)
+    assert stats["embedded"] == 2 and stats["reused"] == 5
+    assert sorted(text for call in client.calls for text in call) == sorted(
+        [builder._embed_input("Title 3", "Edited body."), "Added later."]
+    )
+    assert items[3]["embedding"] == pytest.approx(_vector(builder._embed_input("Title 3", "Edited body.")))
+
+
+def test_duplicate_chunks_are_embedded_once(artifact):
+    chunks = _chunks(2) + [dict(_chunks(1)[0], id="copy")]
+    client = FakeEmbedClient()
+    items, stats = _build(chunks, client)
+    assert stats["embedded"] == 2
+    assert items[0]["embedding"] == items[2]["embedding"]
+
+
+def test_model_or_dimension_change_reembeds(artifact):
+    chunks = _chunks(3)
+    _build(chunks, FakeEmbedClient())
+    _, stats = _build(chunks, FakeEmbedClient(), model="other-model")
+    assert stats["reused"] == 0
+    assert builder.load_previous_vectors("test-model", DIM + 1) == {}
+
+
+def test_json_artifact_is_reused(artifact):
+    chunks = _chunks(3)
+    _build(chunks, FakeEmbedClient(), fmt="json")
+    _, stats = _build(chunks, FakeEmbedClient(), fmt="json")
+    assert stats["reused"] == 3 and stats["embedded"] == 0
+
+
+def test_legacy_json_without_hashes_is_reembedded(artifact):
+    # The old builder embedded the bare text with the title in the config, so
+    # its vectors do not match the folded input and must not be reused.
+    chunks = _chunks(2)
+    legacy = {
+        "model": "test-model",
+        "output_dimensionality": DIM,
+        "items": [{"id": c["id"], "title": c["title"], "text": c["text"], "embedding": _vector(c["text"])} for c in chunks],
+    }
+    with open(builder.OUT_PATH, "w", encoding="utf-8") as f:
+        json.dump(legacy, f)
+
+    client = FakeEmbedClient()
+    items, stats = _build(chunks, client)
+    assert stats["reused"] == 0 and stats["embedded"] == 2
+    assert items[0]["embedding"] == pytest.approx(_vector(builder._embed_input(chunks[0]["title"], chunks[0]["text"])))
+
+
+def test_rate_limited_batch_is_retried(artifact, monkeypatch):
+    monkeypatch.setattr(builder.time, "sleep", lambda seconds: None)
+    client = FakeEmbedClient()
+    real = client.embed_content
+    failures = iter([True, False])
+
+    def flaky(model, contents, config=None):
+        if next(failures, False):
+            raise RuntimeError("429 RESOURCE_EXHAUSTED")
+        return real(model, contents, config)
+
+    client.embed_content = flaky
+    _, stats = _build(_chunks(1), client)
+    assert stats["embedded"] == 1 and len(client.calls) == 1
@@ -0,0 +1,25 @@
+"""Cache keys: what counts as the same request."""
+
+from app.cache import chat_cache_key, transcribe_cache_key
+
+AUDIO = b"\x00\x01" * 600
+
+
+def test_transcribe_key_keeps_mime_parameters():
+    at_16k = transcribe_cache_key("gemini", AUDIO, "audio/L16;rate=16000;channels=1")
+    at_8k = transcribe_cache_key("gemini", AUDIO, "audio/L16;rate=8000;channels=1")
+    assert at_16k != at_8k
+    assert at_16k.endswith(":audio/l16;rate=16000;channels=1")
+
+
+def test_transcribe_key_normalizes_case_and_spacing():
+    assert transcribe_cache_key("gemini", AUDIO, " Audio/WebM; Codecs = opus ") == transcribe_cache_key(
+        "gemini", AUDIO, "audio/webm;codecs=opus"
+    )
+    assert transcribe_cache_key("gemini", AUDIO, "audio/webm") != transcribe_cache_key("openai", AUDIO, "audio/webm")
+
+
+def test_chat_key_ignores_whitespace_but_not_case():
+    base = chat_cache_key("gemini", "quota_saver", "facts", "Where is the US office?")
+    assert chat_cache_key("gemini", "quota_saver", "facts", "  Where is   the US\noffice? ") == base
+    assert chat_cache_key("gemini", "quota_saver", "facts", "where is the us office?") != base
@@ -0,0 +1,120 @@
+"""Time budgets: attempt timeouts surface as 504, hedges respect the budget, backoff stays bounded."""
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import deadlines, gemini, main
+from app.deadlines import Deadline, DeadlineExceeded
+from app.metrics import HEDGES
+from app.scheduler import KeyScheduler
+
+
+@pytest.fixture(autouse=True)
+def short_budgets(monkeypatch):
+    monkeypatch.setattr(deadlines, "ATTEMPT_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(deadlines, "MIN_ATTEMPT_SECONDS", 0.01)
+    monkeypatch.setattr(deadlines, "BACKOFF_BASE_SECONDS", 0.01)
+    monkeypatch.setattr(deadlines, "BACKOFF_MAX_SECONDS", 0.02)
+    monkeypatch.setattr(gemini, "scheduler", KeyScheduler(None))
+    monkeypatch.setattr(gemini, "get_gemini_client", lambda key: key)
+    monkeypatch.delenv("GEMINI_HEDGE_DELAY_MS", raising=False)
+
+
+def _attempt(latencies, calls):
+    """Fake attempt: sleeps the latency configured for its key/model, then answers."""
+
+    async def attempt(client, key, model, last_errors):
+        calls.append((key, model))
+        await asyncio.sleep(latencies.get((key, model), 0.0))
+        return f"reply from {key}/{model}"
+
+    return attempt
+
+
+def test_every_attempt_timing_out_raises_deadline_exceeded():
+    calls = []
+    hung = {("k1", "m1"): 10.0, ("k1", "m2"): 10.0}
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(gemini._run_attempts(["k1"], ["m1", "m2"], _attempt(hung, calls), deadline=Deadline(2.0)))
+    assert calls == [("k1", "m1"), ("k1", "m2")]
+
+
+def test_timed_out_chat_is_reported_as_504(monkeypatch):
+    async def chat_reply(history, app_mode, deadline_ms=None):
+        attempt = _attempt({("k1", "m1"): 10.0}, [])
+        result, *_ = await gemini._run_attempts(["k1"], ["m1"], attempt, deadline=Deadline(1.0))
+        return {"reply": result}
+
+    monkeypatch.setattr(main, "chat_reply_async", chat_reply)
+    with TestClient(main.app) as client:
+        response = client.post("/api/chat", json={"messages": [{"role": "user", "content": "hi"}]})
+    assert response.status_code == 504
+    assert "time budget" in response.json()["detail"]
+
+
+def test_slow_attempt_gets_a_hedge_on_another_key(monkeypatch):
+    monkeypatch.setenv("GEMINI_HEDGE_DELAY_MS", "20")
+    calls = []
+    before = HEDGES.value(provider="gemini")
+
+    result, model, _, _ = asyncio.run(
+        gemini._run_attempts(["k1", "k2"], ["m1"], _attempt({("k1", "m1"): 0.3}, calls), deadline=Deadline(5.0))
+    )
+
+    assert HEDGES.value(provider="gemini") - before == 1
+    assert calls == [("k1", "m1"), ("k2", "m1")]
+    assert result == "reply from k2/m1"
+
+
+def test_no_hedge_once_the_budget_cannot_fit_another_attempt(monkeypatch):
+    monkeypatch.setenv("GEMINI_HEDGE_DELAY_MS", "20")
+    monkeypatch.setattr(deadlines, "ATTEMPT_TIMEOUT_SECONDS", 1.0)
+    monkeypatch.setattr(deadlines, "MIN_ATTEMPT_SECONDS", 0.5)
+    calls = []
+    before = HEDGES.value(provider="gemini")
+
+    result, _, _, _ = asyncio.run(
+        gemini._run_attempts(["k1", "k2"], ["m1"], _attempt({("k1", "m1"): 0.1}, calls), deadline=Deadline(0.51))
+    )
+
+    assert HEDGES.value(provider="gemini") == before
+    assert calls == [("k1", "m1")]
+    assert result == "reply from k1/m1"
+
+
+def test_backoff_is_jittered_within_the_exponential_ceiling(monkeypatch):
+    delays = []
+
+    async def fake_sleep(seconds):
+        delays.append(seconds)
+
+    monkeypatch.setattr(deadlines, "BACKOFF_BASE_SECONDS", 0.25)
+    monkeypatch.setattr(deadlines, "BACKOFF_MAX_SECONDS", 4.0)
+    monkeypatch.setattr(deadlines.asyncio, "sleep", fake_sleep)
+    deadline = Deadline(60.0)
+
+    for failures, ceiling in ((1, 0.25), (2, 0.5), (3, 1.0), (6, 4.0), (12, 4.0)):
+        delays.clear()
+        assert all(asyncio.run(deadline.backoff(failures)) for _ in range(50))
+        assert all(0.0 <= d <= ceiling for d in delays)
+        assert max(delays) > ceiling / 4
+
+
+def test_backoff_never_sleeps_past_the_budget(monkeypatch):
+    delays = []
+
+    async def fake_sleep(seconds):
+        delays.append(seconds)
+
+    monkeypatch.setattr(deadlines, "BACKOFF_BASE_SECONDS", 10.0)
+    monkeypatch.setattr(deadlines, "BACKOFF_MAX_SECONDS", 10.0)
+    monkeypatch.setattr(deadlines, "MIN_ATTEMPT_SECONDS", 0.5)
+    monkeypatch.setattr(deadlines.asyncio, "sleep", fake_sleep)
+
+    for _ in range(20):
+        assert asyncio.run(Deadline(1.0).backoff(1))
+    assert all(d <= 0.5 for d in delays)
+    assert asyncio.run(Deadline(0.4).backoff(1)) is False
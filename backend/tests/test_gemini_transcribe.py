@@ -0,0 +1,77 @@
+"""Gemini transcription: key/model selection under cooldowns, cache and shared flights."""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app import gemini
+from app.cache import TTLCache
+from app.scheduler import KeyScheduler
+
+MODELS = ["model-a", "model-b"]
+AUDIO = b"\x1aE\xdf\xa3" + b"\x00" * 4000
+
+
+class FakeGeminiClient:
+    """Stands in for genai.Client: records (key, model) per call and returns a transcript."""
+
+    def __init__(self, key, calls):
+        self.key = key
+        self.calls = calls
+        self.aio = SimpleNamespace(models=self)
+
+    async def generate_content(self, model, contents, config=None):
+        self.calls.append((self.key, model))
+        await asyncio.sleep(0.05)
+        return SimpleNamespace(text=f"hello from {model}")
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    recorded = []
+    monkeypatch.setenv("GEMINI_API_KEYS", "key-1,key-2")
+    monkeypatch.setenv("GEMINI_TRANSCRIBE_MODEL_CANDIDATES", ",".join(MODELS))
+    monkeypatch.setattr(gemini, "scheduler", KeyScheduler(None))
+    monkeypatch.setattr(gemini, "transcribe_cache", TTLCache(ttl_seconds=60, max_bytes=1 << 20))
+    monkeypatch.setattr(gemini, "get_gemini_client", lambda key: FakeGeminiClient(key, recorded))
+    return recorded
+
+
+def test_blocked_pairs_are_skipped_while_another_is_open(calls):
+    for key in ("key-1", "key-2"):
+        gemini.scheduler.record_rate_limit(key, "model-a", 60)
+
+    result = asyncio.run(gemini._transcribe(AUDIO, "audio/webm"))
+
+    assert result["used_model"] == "model-b"
+    assert calls and all(model == "model-b" for _, model in calls)
+
+
+def test_all_pairs_blocked_still_tries_the_ranked_list(calls):
+    for key in ("key-1", "key-2"):
+        for model in MODELS:
+            gemini.scheduler.record_rate_limit(key, model, 60)
+
+    result = asyncio.run(gemini._transcribe(AUDIO, "audio/webm"))
+
+    assert result["text"] == "hello from model-a"
+    assert calls == [("key-1", "model-a")]
+
+
+def test_joined_flight_is_coalesced_and_only_a_cache_hit_is_cached(calls):
+    async def scenario():
+        first, second = await asyncio.gather(
+            gemini.transcribe_async(AUDIO, "audio/webm"),
+            gemini.transcribe_async(AUDIO, "audio/webm"),
+        )
+        again = await gemini.transcribe_async(AUDIO, "audio/webm")
+        return first, second, again
+
+    first, second, again = asyncio.run(scenario())
+
+    assert len(calls) == 1
+    assert [r.get("coalesced", False) for r in (first, second)] == [False, True]
+    assert not first.get("cached") and not second.get("cached")
+    assert again["cached"] is True and not again.get("coalesced")
+    assert first["text"] == second["text"] == again["text"]
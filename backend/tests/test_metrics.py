@@ -0,0 +1,95 @@
+"""/metrics: every line must be valid Prometheus text exposition (format 0.0.4)."""
+
+import re
+from collections import defaultdict
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main, metrics
+
+_NAME = r"[a-zA-Z_:][a-zA-Z0-9_:]*"
+_LABEL = r'[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\\n]|\\[\\"n])*"'
+_SAMPLE_RE = re.compile(rf"^({_NAME})(\{{{_LABEL}(?:,{_LABEL})*\}})? (\S+)$")
+_LABEL_RE = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\\n]|\\[\\"n])*)"')
+_META_RE = re.compile(rf"^# (HELP|TYPE) ({_NAME}) (.+)$")
+
+
+def _parse(text):
+    """Return {family: {"type", "help", "samples": [(name, labels, value)]}}, asserting the grammar."""
+    assert text.endswith("\n")
+    families = {}
+    current = None
+    for line in text.splitlines():
+        meta = _META_RE.match(line)
+        if meta:
+            kind, name, rest = meta.groups()
+            family = families.setdefault(name, {"type": None, "help": None, "samples": []})
+            assert family[kind.lower()] is None, f"duplicate {kind} for {name}"
+            assert not family["samples"], f"{kind} for {name} after its samples"
+            family[kind.lower()] = rest
+            current = name
+            continue
+        sample = _SAMPLE_RE.match(line)
+        assert sample, f"not a valid exposition line: {line!r}"
+        name, labels, value = sample.groups()
+        family = families[current]
+        suffixes = ("_bucket", "_sum", "_count") if family["type"] == "histogram" else ("",)
+        assert any(name == current + suffix for suffix in suffixes), f"{name} outside its family {current}"
+        float(value)
+        family["samples"].append((name, dict(_LABEL_RE.findall(labels or "")), value))
+    return families
+
+
+def test_metrics_endpoint_serves_valid_exposition():
+    metrics.CHAINED_REQUESTS.inc(kind="hop", result="chained")
+    metrics.CHAINED_INPUT_CHARS_SAVED.inc(1234)
+    metrics.PROVIDER_ATTEMPT_SECONDS.observe(0.03, model='odd "model"\nname\\', key="...abcd", outcome="ok")
+    metrics.PROVIDER_ATTEMPT_SECONDS.observe(7.0, model="m", key="...abcd", outcome="ok")
+    metrics.PROVIDER_ATTEMPT_SECONDS.observe(120.0, model="m", key="...abcd", outcome="ok")
+    metrics.ADMISSION_IN_FLIGHT.set(2, route="chat")
+
+    with TestClient(main.app) as client:
+        response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "text/plain; version=0.0.4; charset=utf-8"
+    families = _parse(response.text)
+
+    for metric in metrics.REGISTRY:
+        assert metric.name in families
+        assert families[metric.name]["help"] and families[metric.name]["type"] in ("counter", "gauge", "histogram")
+
+    chained = families["provider_chained_requests_total"]
+    assert chained["type"] == "counter"
+    assert ("provider_chained_requests_total", {"kind": "hop", "result": "chained"}) in [
+        (name, labels) for name, labels, _ in chained["samples"]
+    ]
+    odd = [labels for _, labels, _ in families["chat_provider_attempt_seconds"]["samples"] if labels.get("model", "").startswith("odd")]
+    assert odd and odd[0]["model"] == 'odd \\"model\\"\\nname\\\\'
+
+
+def test_histogram_buckets_are_cumulative_and_end_at_the_count():
+    histogram = metrics.Histogram("test_seconds", "Test histogram.", buckets=(0.1, 1.0, 10.0))
+    for value in (0.05, 0.1, 0.5, 3.0, 3.0, 50.0):
+        histogram.observe(value, route="x")
+
+    family = _parse("\n".join(histogram.render()) + "\n")["test_seconds"]
+
+    buckets = [(labels["le"], float(value)) for name, labels, value in family["samples"] if name == "test_seconds_bucket"]
+    assert buckets == [("0.1", 2.0), ("1", 3.0), ("10", 5.0), ("+Inf", 6.0)]
+    totals = {name: float(value) for name, _, value in family["samples"] if name != "test_seconds_bucket"}
+    assert totals == {"test_seconds_count": 6.0, "test_seconds_sum": pytest.approx(56.65)}
+
+
+def test_every_series_of_a_histogram_carries_the_same_labels():
+    families = _parse(metrics.render())
+    for name, family in families.items():
+        if family["type"] != "histogram":
+            continue
+        by_series = defaultdict(set)
+        for sample, labels, _ in family["samples"]:
+            series = tuple(sorted((k, v) for k, v in labels.items() if k != "le"))
+            by_series[series].add(sample)
+        for series, samples in by_series.items():
+            assert samples == {f"{name}_bucket", f"{name}_sum", f"{name}_count"}, (name, series)
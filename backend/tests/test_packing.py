@@ -0,0 +1,57 @@
+"""Prompt packing: the input budget decides which facts and history are sent."""
+
+import random
+
+from app.packing import MESSAGE_OVERHEAD_TOKENS, estimate_tokens, pack_prompt
+
+SYSTEM = "s" * 400  # 100 tokens
+
+
+def _conversation(turns, size=80):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"{i:03d}" + "m" * (size - 3)}
+        for i in range(turns)
+    ]
+
+
+def test_packed_prompt_never_exceeds_the_budget():
+    rng = random.Random(5)
+    for _ in range(300):
+        blocks = [{"text": "f" * rng.randint(10, 600), "pinned": rng.random() < 0.2} for _ in range(rng.randint(0, 6))]
+        messages = _conversation(rng.randint(1, 20), size=rng.randint(10, 400))
+        budget = rng.randint(150, 2000)
+        tokens = pack_prompt(SYSTEM, blocks, messages, budget, max_messages=16)["tokens"]
+        newest_user = estimate_tokens(messages[-1 if messages[-1]["role"] == "user" else -2]["content"]) + MESSAGE_OVERHEAD_TOKENS
+        assert tokens["total"] <= max(budget, tokens["system"] + newest_user)
+        assert tokens["total"] == tokens["system"] + tokens["facts"] + tokens["history"]
+
+
+def test_history_is_a_contiguous_tail_starting_at_a_user_turn():
+    messages = _conversation(12)
+    packed = pack_prompt(SYSTEM, [], messages, budget=100 + 3 * (20 + MESSAGE_OVERHEAD_TOKENS), max_messages=16)
+
+    # Room for three messages (9, 10, 11); the leading assistant turn 9 is not sent.
+    assert packed["messages"] == messages[10:]
+    assert packed["tokens"]["history_dropped"] == 10
+    assert packed["tokens"]["history"] == 2 * (20 + MESSAGE_OVERHEAD_TOKENS)
+
+
+def test_newest_user_message_is_kept_even_over_budget():
+    messages = _conversation(3, size=4000)
+    packed = pack_prompt(SYSTEM, [{"text": "fact"}], messages, budget=50, max_messages=16)
+    assert packed["messages"] == [messages[-1]]
+    assert packed["facts"] == ""
+    assert packed["tokens"]["facts_dropped"] == 1
+
+
+def test_pinned_blocks_win_over_topical_ones():
+    blocks = [{"text": "topical " * 50}, {"text": "pinned " * 50, "pinned": True}]
+    budget = 100 + (MESSAGE_OVERHEAD_TOKENS + 20) + estimate_tokens(blocks[1]["text"]) + 1
+    packed = pack_prompt(SYSTEM, blocks, _conversation(1), budget=budget, max_messages=16)
+    assert packed["facts"] == blocks[1]["text"]
+
+
+def test_facts_char_cap_drops_blocks_whole():
+    blocks = [{"text": "a" * 300}, {"text": "b" * 300}, {"text": "c" * 100}]
+    packed = pack_prompt(SYSTEM, blocks, _conversation(1), budget=10_000, max_messages=16, max_facts_chars=450)
+    assert packed["facts"] == "a" * 300 + "\n\n" + "c" * 100
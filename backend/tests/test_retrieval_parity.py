@@ -0,0 +1,103 @@
+"""The lexical index must rank chunks exactly like the reference _keyword_score."""
+
+import random
+
+import pytest
+
+from app import retrieval
+
+
+def _reference(items, query_tokens, question):
+    scored = [(retrieval._keyword_score(query_tokens, question, item), item) for item in items]
+    return sorted(scored, key=lambda pair: -pair[0])
+
+
+def _queries(items, count, seed):
+    rng = random.Random(seed)
+    vocab = sorted(retrieval.build_lexical_index(items)["postings"])
+    pool = vocab + sorted(retrieval._QUERY_EXPANSIONS) + sorted(retrieval._STOPWORDS)
+    for _ in range(count):
+        words = []
+        for _ in range(rng.randint(0, 8)):
+            word = rng.choice(pool)
+            roll = rng.random()
+            if roll < 0.25 and len(word) > 3:
+                start = rng.randrange(len(word) - 2)
+                word = word[start : start + rng.randint(2, len(word) - start)]
+            elif roll < 0.3:
+                word = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(rng.randint(2, 6)))
+            words.append(word.upper() if rng.random() < 0.1 else word)
+        if rng.random() < 0.2:
+            words.append(rng.choice(retrieval._IMPORTANT_PHRASES))
+        yield rng.choice([" ", ", ", "? ", "-"]).join(words) + rng.choice(["", "?", "."])
+
+
+def _assert_parity(items, count, seed):
+    index = retrieval.build_lexical_index(items)
+    for question in _queries(items, count, seed):
+        tokens = retrieval._expanded_query_tokens(question)
+        got = list(retrieval._ranked_chunks(index, tokens, question))
+        want = _reference(items, tokens, question)
+        assert [item.get("id") for _, item in got] == [item.get("id") for _, item in want], question
+        assert [score for score, _ in got] == pytest.approx([score for score, _ in want]), question
+
+
+def test_parity_on_profile_chunks():
+    _assert_parity(retrieval.load_chunks(), 1500, seed=1)
+
+
+def test_parity_on_synthetic_corpus():
+    # Overlapping words, repeated substrings and tied priors exercise the
+    # substring counting and the stable tie order.
+    rng = random.Random(7)
+    words = ["beam", "beamforming", "nokia", "rrm", "dqn", "dueling", "thesis", "hermis", "aa", "aaa", "ab", "ba"]
+    items = [
+        {
+            "id": f"chunk_{i}",
+            "title": " ".join(rng.choices(words, k=rng.randint(0, 3))),
+            "tags": rng.choices(words, k=rng.randint(0, 3)),
+            "text": " ".join(rng.choices(words, k=rng.randint(0, 40))),
+            "priority": rng.choice([0, 10, 50, 50, 90, 120]),
+        }
+        for i in range(60)
+    ]
+    _assert_parity(items, 1500, seed=2)
+
+
+def _full_scan_postings(index, token):
+    counts = {}
+    for word, by_chunk in index["postings"].items():
+        occurrences = word.count(token)
+        if not occurrences:
+            continue
+        for pos, (in_title, in_tags, in_text) in by_chunk.items():
+            acc = counts.setdefault(pos, [0, 0, 0])
+            acc[0] += in_title
+            acc[1] += in_tags
+            acc[2] += in_text * occurrences
+    return {pos: (t > 0, g > 0, x) for pos, (t, g, x) in counts.items()}
+
+
+def test_bigram_candidates_recall_every_matching_word():
+    index = retrieval.build_lexical_index(retrieval.load_chunks())
+    words = sorted(index["postings"])
+    rng = random.Random(3)
+    tokens = {word[i:j] for word in words for i in range(len(word)) for j in range(i + 1, min(len(word), i + 6) + 1)}
+    tokens |= {"".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(rng.randint(1, 5))) for _ in range(300)}
+    for token in sorted(tokens):
+        assert retrieval._token_postings(index, token) == _full_scan_postings(index, token), token
+
+
+def test_cold_token_scans_only_candidate_words():
+    index = retrieval.build_lexical_index(retrieval.load_chunks())
+    index["postings"] = _CountingDict(index["postings"])
+    retrieval._token_postings(index, "nokia")
+    assert 0 < index["postings"].reads < len(index["postings"])
+
+
+class _CountingDict(dict):
+    reads = 0
+
+    def __getitem__(self, key):
+        self.reads += 1
+        return super().__getitem__(key)
@@ -0,0 +1,94 @@
+"""Key scheduler: token buckets refill with time, 429s cool a pair down, headroom orders keys."""
+
+from types import SimpleNamespace
+
+import pytest
+
+from app import scheduler as scheduler_module
+from app.scheduler import KeyScheduler, rank_keys
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = Clock()
+    monkeypatch.setattr(scheduler_module, "time", SimpleNamespace(time=fake.time))
+    monkeypatch.setenv("GEMINI_MODEL_LIMITS", "m=60:6000")
+    return fake
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def sched(request, tmp_path, clock):
+    return KeyScheduler(None if request.param == "memory" else str(tmp_path / "buckets.sqlite3"))
+
+
+def test_acquire_drains_and_time_refills_the_buckets(sched, clock):
+    assert sched.headroom(["k"], "m") == {"k": 1.0}
+
+    for _ in range(30):
+        sched.acquire("k", "m", 10)
+    assert sched.headroom(["k"], "m")["k"] == pytest.approx(0.5)
+
+    clock.now += 15  # 60 rpm refills one request per second
+    assert sched.headroom(["k"], "m")["k"] == pytest.approx(0.75)
+    clock.now += 600
+    assert sched.headroom(["k"], "m")["k"] == pytest.approx(1.0)
+
+
+def test_tighter_bucket_sets_the_headroom_and_settle_corrects_it(sched):
+    sched.acquire("k", "m", 3000)
+    assert sched.headroom(["k"], "m")["k"] == pytest.approx(0.5)
+
+    sched.settle("k", "m", 3000, 600)
+    assert sched.headroom(["k"], "m")["k"] == pytest.approx(0.9)
+
+
+def test_rate_limit_blocks_the_pair_until_retry_after(sched, clock):
+    sched.record_rate_limit("k", "m", 30)
+    assert sched.is_blocked("k", "m")
+    assert sched.headroom_table(["k", "other"], ["m", "n"]) == {
+        ("k", "m"): -1.0,
+        ("other", "m"): 1.0,
+        ("k", "n"): 1.0,
+        ("other", "n"): 1.0,
+    }
+
+    clock.now += 29
+    assert sched.is_blocked("k", "m")
+    clock.now += 2
+    assert not sched.is_blocked("k", "m")
+    # The buckets were emptied by the 429 and have refilled for 31s since.
+    assert sched.headroom(["k"], "m")["k"] == pytest.approx(31 / 60)
+
+
+def test_rate_limit_without_a_hint_uses_the_default_cooldown(sched, clock, monkeypatch):
+    monkeypatch.setattr(scheduler_module, "DEFAULT_BLOCK_SECONDS", 60.0)
+    sched.record_rate_limit("k", "m")
+    clock.now += 59
+    assert sched.is_blocked("k", "m")
+    clock.now += 2
+    assert not sched.is_blocked("k", "m")
+
+
+def test_keys_are_ordered_by_headroom_and_blocked_keys_go_last(sched):
+    for _ in range(40):
+        sched.acquire("busy", "m", 0)
+    for _ in range(10):
+        sched.acquire("light", "m", 0)
+    sched.record_rate_limit("limited", "m", 30)
+
+    assert sched.order_keys(["busy", "limited", "light", "fresh"], "m") == ["fresh", "light", "busy"]
+    assert rank_keys(["a", "b"], {"a": -1.0, "b": -1.0}) == ["a", "b"]
+
+
+def test_sqlite_state_is_shared_between_instances(tmp_path, clock):
+    path = str(tmp_path / "shared.sqlite3")
+    KeyScheduler(path).record_rate_limit("k", "m", 30)
+    assert KeyScheduler(path).is_blocked("k", "m")
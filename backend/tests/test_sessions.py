@@ -0,0 +1,111 @@
+"""Delta-only chat sessions: server-minted ids, stored history, store budgets, SQLite kept off the event loop."""
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main, sessions
+from app.sessions import SessionStore
+
+
+class RecordingStore(SessionStore):
+    """A SQLite SessionStore that notes which thread each get/put ran on."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.threads = []
+
+    def get(self, session_id):
+        self.threads.append(("get", threading.get_ident()))
+        return super().get(session_id)
+
+    def put(self, session_id, messages):
+        self.threads.append(("put", threading.get_ident()))
+        return super().put(session_id, messages)
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    store = RecordingStore(str(tmp_path / "sessions.sqlite3"))
+    seen = []
+
+    async def fake_reply(history, app_mode, deadline_ms=None):
+        seen.append([m["content"] for m in history])
+        store.threads.append(("loop", threading.get_ident()))
+        return {"reply": f"answer {len(seen)}", "used_model": "fake"}
+
+    monkeypatch.setattr(main, "session_store", store)
+    monkeypatch.setattr(main, "chat_reply_async", fake_reply)
+    with TestClient(main.app) as test_client:
+        yield test_client, store, seen
+
+
+def test_delta_turn_continues_the_stored_history(client):
+    test_client, store, seen = client
+    first = test_client.post(
+        "/api/chat",
+        json={"messages": [{"role": "user", "content": "hi"}], "use_session": True, "session_id": "chosen-by-client"},
+    )
+    assert first.status_code == 200
+    session_id = first.json()["session_id"]
+    assert session_id and session_id != "chosen-by-client"
+
+    second = test_client.post("/api/chat", json={"session_id": session_id, "message": {"role": "user", "content": "more"}})
+
+    assert second.status_code == 200
+    assert seen[-1] == ["hi", "answer 1", "more"]
+    assert store.get(session_id)[-1] == {"role": "assistant", "content": "answer 2"}
+
+
+def test_sqlite_calls_run_off_the_event_loop(client):
+    test_client, store, _ = client
+    session_id = test_client.post(
+        "/api/chat", json={"messages": [{"role": "user", "content": "hi"}], "use_session": True}
+    ).json()["session_id"]
+    test_client.post("/api/chat", json={"session_id": session_id, "message": {"role": "user", "content": "again"}})
+
+    loop_threads = {ident for kind, ident in store.threads if kind == "loop"}
+    store_threads = {ident for kind, ident in store.threads if kind in ("get", "put")}
+    assert {kind for kind, _ in store.threads} == {"loop", "get", "put"}
+    assert not loop_threads & store_threads
+
+
+def test_unknown_session_asks_for_the_full_history(client):
+    test_client, _, seen = client
+    response = test_client.post("/api/chat", json={"session_id": "gone", "message": {"role": "user", "content": "hi"}})
+    assert response.status_code == 409
+    assert not seen
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_store_keeps_the_newest_messages_and_sessions(backend, tmp_path, monkeypatch):
+    monkeypatch.setattr(sessions, "SESSION_MAX_MESSAGES", 4)
+    store = SessionStore(None if backend == "memory" else str(tmp_path / "s.sqlite3"), max_sessions=2, ttl_seconds=60)
+    history = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"m{i}"} for i in range(9)] + [{"role": "user", "content": "  "}]
+
+    store.put("a", history)
+    assert [m["content"] for m in store.get("a")] == ["m5", "m6", "m7", "m8"]
+
+    store.put("b", history)
+    store.get("a")
+    store.put("c", history)
+    assert store.stats()["sessions"] == 2
+    assert store.get("a") is not None and store.get("c") is not None
+    assert store.get("b") is None
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_store_expires_sessions_after_the_ttl(backend, tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(sessions, "time", SimpleNamespace(time=lambda: now[0]))
+    store = SessionStore(None if backend == "memory" else str(tmp_path / "s.sqlite3"), ttl_seconds=30)
+    store.put("a", [{"role": "user", "content": "hi"}])
+
+    now[0] += 25
+    assert store.get("a") is not None  # a read refreshes the TTL
+    now[0] += 25
+    assert store.get("a") is not None
+    now[0] += 31
+    assert store.get("a") is None
@@ -0,0 +1,87 @@
+"""/api/transcribe uploads: size cap enforced while the body streams in."""
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+from app import main
+from app.uploads import MULTIPART_OVERHEAD_BYTES, UploadTooLarge, read_audio_upload
+
+CAP = 10_000
+BOUNDARY = "testboundary"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    received = []
+
+    async def fake_transcribe(audio_bytes, declared_mime=None):
+        received.append((len(audio_bytes), declared_mime))
+        return {"text": "ok", "used_model": "fake"}
+
+    monkeypatch.setattr(main, "MAX_AUDIO_BYTES", CAP)
+    monkeypatch.setattr(main, "transcribe_async", fake_transcribe)
+    with TestClient(main.app) as test_client:
+        yield test_client, received
+
+
+def _multipart_chunks(audio_size, chunk=4096):
+    yield (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="clip.webm"\r\n'
+        "Content-Type: audio/webm\r\n\r\n"
+    ).encode()
+    for start in range(0, audio_size, chunk):
+        yield b"\x00" * min(chunk, audio_size - start)
+    yield f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def test_upload_under_the_cap_is_transcribed(client):
+    test_client, received = client
+    response = test_client.post("/api/transcribe", files={"file": ("clip.webm", b"\x00" * (CAP - 1), "audio/webm")})
+    assert response.status_code == 200
+    assert received == [(CAP - 1, "audio/webm")]
+
+
+def test_upload_over_the_cap_gets_413(client):
+    test_client, received = client
+    response = test_client.post("/api/transcribe", files={"file": ("clip.webm", b"\x00" * (CAP + 1), "audio/webm")})
+    assert response.status_code == 413
+    assert received == []
+
+
+def _read_streamed(chunks, headers):
+    """Run read_audio_upload over `chunks`; returns the sizes of the chunks it pulled."""
+    pulled = []
+
+    async def receive():
+        part = chunks[len(pulled)]
+        pulled.append(len(part))
+        return {"type": "http.request", "body": part, "more_body": len(pulled) < len(chunks)}
+
+    content_type = (b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())
+    scope = {"type": "http", "method": "POST", "path": "/api/transcribe", "headers": [content_type] + headers}
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(read_audio_upload(Request(scope, receive), CAP))
+    return pulled
+
+
+def test_streamed_upload_without_content_length_is_cut_off_early():
+    chunks = list(_multipart_chunks(50 * CAP))
+    pulled = _read_streamed(chunks, [])
+    assert sum(pulled) <= CAP + MULTIPART_OVERHEAD_BYTES + 4096
+    assert len(pulled) < len(chunks)
+
+
+def test_declared_content_length_over_the_cap_is_rejected_before_reading():
+    chunks = list(_multipart_chunks(50 * CAP))
+    assert _read_streamed(chunks, [(b"content-length", str(sum(map(len, chunks))).encode())]) == []
+
+
+def test_upload_without_the_file_field_is_a_400(client):
+    test_client, received = client
+    response = test_client.post("/api/transcribe", data={"other": "x"}, files={"not_file": ("a.txt", b"x", "text/plain")})
+    assert response.status_code == 400
+    assert received == []
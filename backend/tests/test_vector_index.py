@@ -0,0 +1,95 @@
+"""Vector top-k: the NumPy engine and the mmap'd binary index must match a brute-force cosine ranking."""
+
+import os
+import random
+import sys
+
+import numpy as np
+import pytest
+
+from app import retrieval
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+import build_profile_index as builder  # noqa: E402
+
+DIM = 16
+
+
+def _items(count, seed):
+    rng = random.Random(seed)
+    items = [
+        {"id": f"c{i}", "title": f"Title {i}", "text": "", "embedding": [rng.gauss(0.0, 1.0) for _ in range(DIM)]}
+        for i in range(count)
+    ]
+    items[3]["embedding"] = [0.0] * DIM  # zero norm
+    items[7]["embedding"] = [1.0] * (DIM - 1)  # wrong length
+    return items
+
+
+def _queries(count, seed):
+    rng = random.Random(seed)
+    return [[rng.gauss(0.0, 1.0) for _ in range(DIM)] for _ in range(count)]
+
+
+def _brute_force(items, query, k, min_score):
+    q = np.asarray(query, dtype=np.float64)
+    scored = []
+    for item in items:
+        vec = np.asarray(item["embedding"], dtype=np.float64)
+        if vec.shape != q.shape or not np.linalg.norm(vec):
+            # Unusable rows keep their position and score -1.0, like _cosine.
+            scored.append((-1.0, item["id"]))
+            continue
+        scored.append((float(q @ vec / (np.linalg.norm(q) * np.linalg.norm(vec))), item["id"]))
+    scored.sort(key=lambda pair: -pair[0])
+    return [(score, item_id) for score, item_id in scored[:k] if score >= min_score]
+
+
+def _assert_matches(index, items, k, min_score, tolerance, exact_order=True):
+    queries = _queries(40, seed=k)
+    for query, got in zip(queries, retrieval.top_k_from_index(queries, index, k=k, min_score=min_score)):
+        want = _brute_force(items, query, k, min_score)
+        assert [score for score, _ in got] == pytest.approx([score for score, _ in want], abs=tolerance)
+        if exact_order:
+            assert [item["id"] for _, item in got] == [item_id for _, item_id in want]
+        else:
+            # Lossy storage may swap near-ties; every pick must still be as good as the reference's.
+            true_scores = {item_id: score for score, item_id in _brute_force(items, query, len(items), -1.0)}
+            assert [true_scores[item["id"]] for _, item in got] == pytest.approx(
+                [score for score, _ in want], abs=2 * tolerance
+            )
+
+
+@pytest.mark.parametrize("k,min_score", [(1, -1.0), (5, -1.0), (5, 0.2), (200, -1.0)])
+def test_in_memory_engine_matches_brute_force(k, min_score):
+    items = _items(120, seed=1)
+    _assert_matches({"items": items}, items, k, min_score, tolerance=1e-5)
+
+
+@pytest.mark.parametrize("dtype,tolerance", [("float32", 1e-5), ("float16", 2e-3)])
+def test_binary_index_matches_brute_force(monkeypatch, tmp_path, dtype, tolerance):
+    items = _items(120, seed=2)
+    vectors_path, meta_path = str(tmp_path / "profile_index.npy"), str(tmp_path / "profile_index.meta.json")
+    monkeypatch.setattr(builder, "VECTORS_OUT_PATH", vectors_path)
+    monkeypatch.setattr(builder, "META_OUT_PATH", meta_path)
+    builder.write_binary_index(items, {"model": "test", "output_dimensionality": DIM}, dtype=dtype)
+
+    index = retrieval._load_binary_index(vectors_path, meta_path)
+
+    assert isinstance(index["_engine"]["matrix"], np.memmap)
+    assert [item["id"] for item in index["items"]] == [item["id"] for item in items]
+    for k in (1, 5, 200):
+        _assert_matches(index, items, k, -1.0, tolerance, exact_order=dtype == "float32")
+
+
+def test_binary_index_rejects_a_sidecar_that_does_not_match(monkeypatch, tmp_path):
+    items = _items(10, seed=3)
+    vectors_path, meta_path = str(tmp_path / "profile_index.npy"), str(tmp_path / "profile_index.meta.json")
+    monkeypatch.setattr(builder, "VECTORS_OUT_PATH", vectors_path)
+    monkeypatch.setattr(builder, "META_OUT_PATH", meta_path)
+    builder.write_binary_index(items, {"model": "test", "output_dimensionality": DIM})
+    np.save(vectors_path, np.zeros((4, DIM), dtype=np.float32))
+
+    with pytest.raises(ValueError):
+        retrieval._load_binary_index(vectors_path, meta_path)
@@ -36,6 +36,15 @@ type ChatResponse = {
   mode_detail?: string | null;
   candidate_models?: string[];
   hops_used?: number;
+  session_id?: string | null;
+};
+
+// Server-side history for the active conversation: once the server holds the
+// first `synced` messages, only the next user message needs to be sent.
+type ChatSession = {
+  conversationId: string;
+  sessionId: string;
+  synced: number;
 };
 
 type ChatCallOptions = {
@@ -53,6 +62,8 @@ const MAX_RECORDING_MS = 22_000;
 const SILENCE_STOP_MS = 1_150;
 const CHAT_HISTORY_STORAGE_KEY = "talk_to_ansuk_chat_history_v1";
 const MAX_SAVED_CONVERSATIONS = 30;
+// The backend accepts at most this many messages in one request.
+const MAX_CHAT_HISTORY_MESSAGES = 30;
 const DEFAULT_ASSISTANT_GREETING =
   "Hey — I’m Ansuk. Ask me anything interview-style: projects, RL, strengths, growth areas, whatever.";
 const FRESH_ASSISTANT_GREETING =
@@ -1329,6 +1340,8 @@ export default function Chat() {
   const [portalReady, setPortalReady] = useState(false);
   const settingsMenuRef = useRef<HTMLDivElement | null>(null);
   const activeConversationIdRef = useRef<string | null>(null);
+  const chatSessionRef = useRef<ChatSession | null>(null);
+  const chatAbortRef = useRef<AbortController | null>(null);
 
   const [input, setInput] = useState("");
   const [busy, setBusy] = useState(false);
@@ -1645,6 +1658,11 @@ export default function Chat() {
     return () => cleanupRecordingResources();
   }, []);
 
+  // Leaving the page mid-answer closes the request, so the server stops generating.
+  useEffect(() => {
+    return () => chatAbortRef.current?.abort();
+  }, []);
+
   function isSpeechSynthesisSupported() {
     return (
       typeof window !== "undefined" &&
@@ -1798,22 +1816,59 @@ export default function Chat() {
       return botMsg;
     };
 
-    try {
-      const res = await fetch(buildApiUrl("/api/chat"), {
+    const conversationId = activeConversationIdRef.current;
+    const session = chatSessionRef.current;
+    const latest = nextMessages[nextMessages.length - 1];
+    const controller = new AbortController();
+    chatAbortRef.current = controller;
+    const postChat = (body: Record<string, unknown>) =>
+      fetch(buildApiUrl("/api/chat"), {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ messages: nextMessages, app_mode: appMode }),
+        body: JSON.stringify({ ...body, app_mode: appMode }),
+        signal: controller.signal,
       });
+    const fullHistory = {
+      messages: nextMessages.slice(-MAX_CHAT_HISTORY_MESSAGES),
+      use_session: true,
+    };
+
+    try {
+      const canSendDelta =
+        session !== null &&
+        session.conversationId === conversationId &&
+        session.synced === nextMessages.length - 1 &&
+        latest?.role === "user";
+      let res = await postChat(
+        canSendDelta
+          ? {
+              session_id: session.sessionId,
+              message: { role: "user", content: latest.content },
+            }
+          : fullHistory,
+      );
+      // 409: the server no longer has this session, so send everything once more.
+      if (canSendDelta && res.status === 409) res = await postChat(fullHistory);
 
       if (!res.ok) throw new Error(await responseErrorMessage(res, "chat"));
 
       const data: ChatResponse = await res.json();
+      chatSessionRef.current =
+        data.session_id && conversationId
+          ? {
+              conversationId,
+              sessionId: data.session_id,
+              synced: nextMessages.length + 1,
+            }
+          : null;
       appendAssistantMessage(data.reply);
       setDebug(data);
     } catch (error: unknown) {
+      if (controller.signal.aborted) return;
       const errMsg = friendlyRequestError(error, "chat").slice(0, 520);
       appendAssistantMessage(`⚠️ ${errMsg}`);
     } finally {
+      if (chatAbortRef.current === controller) chatAbortRef.current = null;
       setBusy(false);
     }
   }